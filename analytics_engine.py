@@ -0,0 +1,180 @@
+"""Vectorized attendance analytics on NumPy arrays.
+
+AttendanceMatrix holds the attendance of a date range as one
+students x dates x roll calls status array, plus a vector giving the class
+of each student row. Department and class percentages, weekday averages,
+trends and chronic absentees are then array reductions instead of loops
+over per-day summaries.
+
+NumPy is optional. When it is not installed HAS_NUMPY is False,
+DataManager.get_attendance_matrix() returns None and the chatbot falls back
+to its pure Python analytics.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence
+
+from models import Class
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Status codes. Several rows for the same student and roll call combine to
+# the highest code, which matches the distinct present/late student counts
+# of the storage summaries.
+NOT_MARKED = -1
+ABSENT = 0
+PRESENT = 1
+LATE = 2
+
+# Roll call 0 is day attendance (the 'day' rows of period 1), roll call n is
+# period n of period attendance
+DAY_ROLL_CALL = 0
+
+
+class AttendanceMatrix:
+    def __init__(self, dates: List[str], class_ids: List[str], class_names: List[str], class_sizes,
+                 students: List[tuple], student_class, status):
+        self.dates = dates
+        self.class_ids = class_ids
+        self.class_names = class_names
+        self.class_sizes = class_sizes      # roster size per class
+        self.students = students            # (student_id, class_id) per student row
+        self.student_class = student_class  # class position per student row
+        self.status = status                # students x dates x roll calls, int8 status codes
+
+    @classmethod
+    def build(cls, rows: List[Dict], classes: List[Class], class_sizes: Dict[str, int],
+              start_date: str, end_date: str) -> 'AttendanceMatrix':
+        """Build the matrix from attendance rows dated start_date to end_date.
+
+        A student is counted in the class named on their attendance row, as in
+        the storage summaries. Rows for classes missing from classes are left
+        out, as they are from department summaries.
+        """
+        dates = []
+        day = datetime.strptime(start_date, '%Y-%m-%d')
+        last_day = datetime.strptime(end_date, '%Y-%m-%d')
+        while day <= last_day:
+            dates.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+        date_positions = {date_str: position for position, date_str in enumerate(dates)}
+        class_ids = [class_obj.class_id for class_obj in classes]
+        class_positions = {class_id: position for position, class_id in enumerate(class_ids)}
+
+        student_positions = {}
+        student_rows, date_cols, roll_calls, codes = [], [], [], []
+        for row in rows:
+            if row.get('attendance_type') == 'day':
+                if row.get('period') != 1:
+                    continue
+                roll_call = DAY_ROLL_CALL
+            elif row.get('attendance_type') == 'period' and row.get('period'):
+                roll_call = row['period']
+            else:
+                continue
+            date_position = date_positions.get(row['date'])
+            if date_position is None or row['class_id'] not in class_positions:
+                continue
+
+            key = (row.get('student_id'), row['class_id'])
+            student_rows.append(student_positions.setdefault(key, len(student_positions)))
+            date_cols.append(date_position)
+            roll_calls.append(roll_call)
+            if row.get('status') != 'present':
+                codes.append(ABSENT)
+            else:
+                codes.append(LATE if row.get('is_late') else PRESENT)
+
+        students = list(student_positions)
+        status = np.full((len(students), len(dates), max(roll_calls, default=0) + 1), NOT_MARKED, dtype=np.int8)
+        if codes:
+            np.maximum.at(status, (np.array(student_rows), np.array(date_cols), np.array(roll_calls)),
+                          np.array(codes, dtype=np.int8))
+        student_class = np.array([class_positions[class_id] for _, class_id in students], dtype=np.intp)
+        sizes = np.array([class_sizes.get(class_id, 0) for class_id in class_ids], dtype=np.int64)
+        return cls(dates, class_ids, [class_obj.class_name for class_obj in classes], sizes,
+                   students, student_class, status)
+
+    def _roll_call_status(self, roll_call: int):
+        if roll_call >= self.status.shape[2]:
+            return np.full(self.status.shape[:2], NOT_MARKED, dtype=np.int8)
+        return self.status[:, :, roll_call]
+
+    def class_present_counts(self, roll_call: int = DAY_ROLL_CALL):
+        """Distinct present students per class and date (classes x dates)"""
+        counts = np.zeros((len(self.class_ids), len(self.dates)), dtype=np.int64)
+        np.add.at(counts, self.student_class, self._roll_call_status(roll_call) >= PRESENT)
+        return counts
+
+    def class_marked(self, roll_call: int = DAY_ROLL_CALL):
+        """Whether any student of the class was marked, per class and date (classes x dates)"""
+        counts = np.zeros((len(self.class_ids), len(self.dates)), dtype=np.int64)
+        np.add.at(counts, self.student_class, self._roll_call_status(roll_call) > NOT_MARKED)
+        return counts > 0
+
+    def class_percentages(self, roll_call: int = DAY_ROLL_CALL):
+        """Present percentage of each class roster per date (classes x dates), 0 for empty classes"""
+        sizes = self.class_sizes[:, None]
+        present = self.class_present_counts(roll_call)
+        return np.divide(present, sizes, out=np.zeros(present.shape), where=sizes > 0) * 100
+
+    def daily_totals(self, roll_call: int = DAY_ROLL_CALL) -> List[Dict]:
+        """Department totals per date, oldest first, as in get_department_attendance_summary"""
+        total_students = int(self.class_sizes.sum())
+        present = self.class_present_counts(roll_call).sum(axis=0)
+        percentages = present / total_students * 100 if total_students > 0 else np.zeros(len(self.dates))
+        return [{'date': date_str, 'total_students': total_students, 'total_present': int(present_count),
+                 'overall_percentage': float(percentage)}
+                for date_str, present_count, percentage in zip(self.dates, present, percentages)]
+
+    def rank_classes(self, date_str: str, roll_call: int = DAY_ROLL_CALL) -> List[tuple]:
+        """(class_name, percentage) of the classes marked above 0% on date_str, best first"""
+        percentages = self.class_percentages(roll_call)[:, self.dates.index(date_str)]
+        order = np.argsort(-percentages, kind='stable')
+        return [(self.class_names[i], float(percentages[i])) for i in order if percentages[i] > 0]
+
+    def chronic_absentees(self, threshold: float = 75.0, min_days: int = 3,
+                          roll_call: int = DAY_ROLL_CALL) -> List[Dict]:
+        """Students present on less than threshold percent of the days they were marked, worst first"""
+        status = self._roll_call_status(roll_call)
+        marked_days = (status > NOT_MARKED).sum(axis=1)
+        present_days = (status >= PRESENT).sum(axis=1)
+        rates = np.divide(present_days, marked_days, out=np.zeros(len(self.students)), where=marked_days > 0) * 100
+        flagged = np.flatnonzero((marked_days >= min_days) & (rates < threshold))
+        return [{
+            'student_id': self.students[i][0],
+            'class_id': self.students[i][1],
+            'attendance_rate': round(float(rates[i]), 2),
+            'days_marked': int(marked_days[i]),
+            'days_present': int(present_days[i])
+        } for i in flagged[np.argsort(rates[flagged], kind='stable')]]
+
+
+def weekday_averages(dates: Sequence[str], percentages: Sequence[float]) -> Dict[str, float]:
+    """Average of the non-zero percentages per weekday, Monday first"""
+    weekdays = np.array([datetime.strptime(date_str, '%Y-%m-%d').weekday() for date_str in dates], dtype=np.intp)
+    values = np.asarray(percentages, dtype=float)
+    marked = values > 0
+    totals = np.bincount(weekdays[marked], weights=values[marked], minlength=7)
+    counts = np.bincount(weekdays[marked], minlength=7)
+    return {WEEKDAY_NAMES[day]: round(float(totals[day] / counts[day]), 2) for day in range(7) if counts[day]}
+
+
+def trend_direction(percentages: Sequence[float]) -> str:
+    """'improving', 'declining' or 'stable', comparing the means of the two halves"""
+    values = np.asarray(percentages, dtype=float)
+    if len(values) < 3:
+        return 'stable'
+    half = len(values) // 2
+    difference = values[half:].mean() - values[:half].mean()
+    if difference > 2:
+        return 'improving'
+    elif difference < -2:
+        return 'declining'
+    return 'stable'
@@ -0,0 +1,101 @@
+"""Inter-process locks and atomic file replacement for the JSON data files.
+
+Several gunicorn workers share the data directory. A data file is never
+rewritten in place: the new contents go to a temporary file in the same
+directory, which is flushed to disk and renamed over the old file. Readers
+therefore see either the old file or the new one, never a torn one.
+Writers that must not interleave hold an flock on a '<file>.lock' file next
+to the data file.
+"""
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+
+@contextmanager
+def file_lock(path: str, exclusive: bool = True):
+    """Hold an flock on path + '.lock' for the duration of the block"""
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _format_options(indent: Optional[int]) -> Dict:
+    """json.dump() arguments for indent, or for minified JSON if indent is None"""
+    return {'indent': indent} if indent is not None else {'separators': (',', ':')}
+
+
+def write_json_atomic(path: str, data, indent: Optional[int] = 2, fsync: bool = True):
+    """Replace path with data serialized as JSON, so no reader sees a partial file.
+
+    indent=None writes minified JSON. Writers to the same path must be
+    serialized, e.g. with file_lock().
+    """
+    _replace_atomic(path, lambda f: json.dump(data, f, **_format_options(indent)), fsync)
+
+
+def write_json_array_atomic(path: str, rows: Iterable, indent: Optional[int] = 2, fsync: bool = True):
+    """Write the same file as write_json_atomic(path, list(rows)), encoding one row at a time"""
+    options = _format_options(indent)
+
+    def write(f):
+        if indent is None:
+            f.write('[')
+            for i, row in enumerate(rows):
+                f.write((',' if i else '') + json.dumps(row, **options))
+            f.write(']')
+            return
+        prefix = ' ' * indent
+        empty = True
+        f.write('[')
+        for row in rows:
+            f.write('\n' if empty else ',\n')
+            f.write(prefix + json.dumps(row, **options).replace('\n', '\n' + prefix))
+            empty = False
+        f.write(']' if empty else '\n]')
+    _replace_atomic(path, write, fsync)
+
+
+def gzip_file_atomic(source: str, path: str, fsync: bool = True):
+    """Replace path with a gzip-compressed copy of the file source"""
+    def write(f):
+        with open(source, 'rb') as plain, gzip.GzipFile(filename=os.path.basename(source), mode='wb', fileobj=f) as packed:
+            shutil.copyfileobj(plain, packed)
+    _replace_atomic(path, write, fsync, mode='wb')
+
+
+def _replace_atomic(path: str, write: Callable, fsync: bool, mode: str = 'w'):
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # mkstemp creates the file readable by the owner only
+        os.chmod(temp_path, 0o644)
+        # Readers detect changes by (mtime, size, inode). The filesystem clock
+        # can be too coarse to tell two quick writes apart and the inode of a
+        # replaced file gets reused, so make mtime strictly increase
+        try:
+            previous_mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            previous_mtime = 0
+        mtime = max(os.stat(temp_path).st_mtime_ns, previous_mtime + 1)
+        os.utime(temp_path, ns=(mtime, mtime))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
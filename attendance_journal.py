@@ -0,0 +1,95 @@
+"""Append-only journal for attendance changes.
+
+attendance.json holds the compacted attendance rows. Every change made after
+the last compaction is appended to the journal as one JSON object per line:
+
+    {"op": "add", "row": {...}}
+    {"op": "lock", "class_id": ..., "date": ..., "attendance_type": ..., "period": ...}
+    {"op": "update", "record_id": ..., "updates": {...}}
+
+Readers apply the journal on top of the compacted rows, and DataManager folds
+the journal back into attendance.json once it grows past a size threshold.
+Writers hold an exclusive flock on the journal while appending or compacting,
+readers hold a shared one while loading, so no reader ever sees a compacted
+file together with the journal that was already folded into it.
+"""
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AttendanceJournal:
+    def __init__(self, filepath: str, fsync: bool = True):
+        self.filepath = filepath
+        self.fsync = fsync
+
+    @contextmanager
+    def _locked(self, operation: int):
+        fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield fd
+        finally:
+            os.close(fd)
+
+    def shared_lock(self):
+        """Hold off compaction while the compacted file and journal are read"""
+        return self._locked(fcntl.LOCK_SH)
+
+    def exclusive_lock(self):
+        """Block readers and other writers, used for compaction"""
+        return self._locked(fcntl.LOCK_EX)
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.filepath)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, ops: List[Dict]):
+        """Append a batch of operations with a single write and a single fsync"""
+        if not ops:
+            return
+        payload = ''.join(json.dumps(op, separators=(',', ':')) + '\n' for op in ops).encode('utf-8')
+        with self.exclusive_lock() as fd:
+            # A crash mid-append can leave a partial last line; terminate it so
+            # the damage stays confined to that one line
+            end = os.lseek(fd, 0, os.SEEK_END)
+            if end and os.pread(fd, 1, end - 1) != b'\n':
+                payload = b'\n' + payload
+            written = 0
+            while written < len(payload):
+                written += os.write(fd, payload[written:])
+            if self.fsync:
+                os.fsync(fd)
+
+    def read(self, offset: int = 0) -> Tuple[List[Dict], int]:
+        """Read complete operations from offset, returning them and the offset after the last one"""
+        try:
+            with open(self.filepath, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        end = chunk.rfind(b'\n') + 1
+        ops = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping unreadable line in %s", self.filepath)
+        return ops, offset + end
+
+    def truncate(self, fd: int):
+        """Empty the journal; fd must come from exclusive_lock()"""
+        os.ftruncate(fd, 0)
+        if self.fsync:
+            os.fsync(fd)
@@ -0,0 +1,130 @@
+"""Compacted attendance rows split into one file per month.
+
+A partitioned data directory keeps the compacted attendance rows in
+data/attendance/YYYY-MM.json, one JSON array per month of the rows' dates,
+instead of in a single attendance.json. data/attendance/manifest.json lists
+the partitions, so a query opens only the months it can touch and a
+compaction rewrites only the months the journal changed. Old months can be
+archived as YYYY-MM.json.gz, which readers open transparently.
+
+JsonStorage uses this layout whenever the manifest exists;
+partition_attendance.py converts a data directory and archives old months.
+Writers hold the attendance journal's exclusive lock, and readers open the
+files they need under its shared lock, as for attendance.json.
+"""
+import gzip
+import json
+import os
+from typing import Dict, Iterable, List, Optional, TextIO
+
+from atomic_io import gzip_file_atomic, write_json_array_atomic, write_json_atomic
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def partition_month(date_str: str) -> str:
+    """The partition of a row dated date_str: its 'YYYY-MM' month"""
+    return date_str[:7]
+
+
+def month_overlaps(month: str, start_date: str = None, end_date: str = None) -> bool:
+    """Whether the partition of month can hold rows dated start_date to end_date"""
+    return ((not start_date or month >= partition_month(start_date))
+            and (not end_date or month <= partition_month(end_date)))
+
+
+class _CountingRows:
+    def __init__(self, rows: Iterable[Dict]):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+class AttendancePartitions:
+    def __init__(self, directory: str, fsync: bool = True, indent: Optional[int] = 2):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.fsync = fsync
+        # JSON indentation of the files written; None writes them minified
+        self.indent = indent
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self) -> Dict[str, str]:
+        """{month: file name} of the partitions, oldest month first"""
+        with open(self.manifest_path, 'r') as f:
+            return dict(sorted(json.load(f)['partitions'].items()))
+
+    def open(self, filename: str) -> TextIO:
+        path = os.path.join(self.directory, filename)
+        if filename.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8')
+        return open(path, 'r')
+
+    def load(self, filename: str) -> List[Dict]:
+        with self.open(filename) as f:
+            return json.load(f)
+
+    def write(self, manifest: Dict[str, str], rows_by_month: Dict[str, Iterable[Dict]]) -> Dict[str, str]:
+        """Replace the partitions of the given months, then the manifest; returns the new manifest.
+
+        Months left without rows are dropped, and archived months stay
+        compressed. Partition files are replaced before the manifest and
+        stale files removed after it, so a reader that took either manifest
+        finds the files it names.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = dict(manifest)
+        stale = []
+        for month, rows in sorted(rows_by_month.items()):
+            filename = f'{month}.json'
+            rows = _CountingRows(rows)
+            write_json_array_atomic(os.path.join(self.directory, filename), rows, indent=self.indent, fsync=self.fsync)
+            previous = manifest.get(month)
+            if previous == filename + '.gz' and rows.count:
+                gzip_file_atomic(os.path.join(self.directory, filename),
+                                 os.path.join(self.directory, previous), fsync=self.fsync)
+                stale.append(filename)
+                filename = previous
+            if previous is not None and previous != filename:
+                stale.append(previous)
+            if rows.count:
+                manifest[month] = filename
+            else:
+                manifest.pop(month, None)
+                stale.append(filename)
+        self._write_manifest(manifest)
+        self._remove(stale)
+        return manifest
+
+    def archive(self, manifest: Dict[str, str], before_month: str) -> Dict[str, str]:
+        """Compress the partitions of months before before_month; returns the new manifest"""
+        manifest = dict(manifest)
+        stale = []
+        for month, filename in manifest.items():
+            if month >= before_month or filename.endswith('.gz'):
+                continue
+            gzip_file_atomic(os.path.join(self.directory, filename),
+                             os.path.join(self.directory, filename + '.gz'), fsync=self.fsync)
+            manifest[month] = filename + '.gz'
+            stale.append(filename)
+        if stale:
+            self._write_manifest(manifest)
+            self._remove(stale)
+        return manifest
+
+    def _write_manifest(self, manifest: Dict[str, str]):
+        write_json_atomic(self.manifest_path, {'partitions': dict(sorted(manifest.items()))},
+                          indent=self.indent, fsync=self.fsync)
+
+    def _remove(self, filenames: List[str]):
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,145 @@
+"""Streaming reads of the attendance rows.
+
+iter_json_array() decodes the elements of a JSON array one at a time, so
+attendance.json can be scanned in a fixed amount of memory instead of being
+parsed into one list. JournalReplay applies the attendance journal (see
+attendance_journal.py) to rows as they stream past, so a scan sees the same
+rows as the resident copy JsonStorage keeps.
+"""
+import bisect
+import json
+import re
+from typing import Dict, Iterator, List, TextIO
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """Yield the elements of the JSON array in f, reading chunk_size characters at a time.
+
+    Raises json.JSONDecodeError if f does not hold a well formed array; the
+    elements before the damage have been yielded by then.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    opened = False
+    expect_comma = False
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array", buffer, position)
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+
+        if not opened:
+            if buffer[position] != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, position)
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        if expect_comma:
+            if buffer[position] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+            expect_comma = False
+            position += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            value, end = None, None
+        # An element cut off by the end of the buffer either fails to decode or,
+        # for a bare number, decodes short; read on and decode it again
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array element", buffer, position)
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield value
+        position = end
+        expect_comma = True
+
+
+class JournalReplay:
+    """Journal operations indexed by the rows they apply to.
+
+    Lock operations are looked up by (class_id, date) and updates by
+    record_id, so replaying the journal costs each streamed row a few dict
+    lookups. An update applies to the first row with its record_id, as in the
+    resident rows, so one JournalReplay serves a single pass over the rows in
+    stored order.
+    """
+
+    def __init__(self, ops: List[Dict]):
+        self.added = []    # (position, row) for each 'add' operation
+        self._locks = {}   # (class_id, date) -> ([positions], [ops])
+        self._updates = {}  # record_id -> ([positions], [updates])
+        self._updated_record_ids = set()
+        # (class_id, date) of the rows updates were applied to, before and after
+        self.updated_pairs = set()
+        # Whether an update can move a row to another date
+        self.moves_rows = False
+        for position, op in enumerate(ops):
+            kind = op.get('op')
+            if kind == 'add':
+                self.added.append((position, op['row']))
+            elif kind == 'lock':
+                positions, lock_ops = self._locks.setdefault((op['class_id'], op['date']), ([], []))
+                positions.append(position)
+                lock_ops.append(op)
+            elif kind == 'update':
+                positions, updates = self._updates.setdefault(op['record_id'], ([], []))
+                positions.append(position)
+                updates.append(op['updates'])
+                self.moves_rows = self.moves_rows or 'date' in op['updates']
+
+    @property
+    def has_updates(self) -> bool:
+        return bool(self._updates)
+
+    def touched_pairs(self) -> set:
+        """(class_id, date) of the rows added or locked by the journal"""
+        return {(row.get('class_id'), row.get('date')) for _, row in self.added} | set(self._locks)
+
+    @staticmethod
+    def _next(indexed: tuple, after: int) -> tuple:
+        if indexed is None:
+            return None, None
+        positions, values = indexed
+        i = bisect.bisect_right(positions, after)
+        return (positions[i], values[i]) if i < len(positions) else (None, None)
+
+    def apply(self, row: Dict, after: int = -1) -> Dict:
+        """Apply the operations logged after position `after` to row, in place.
+
+        Rows of attendance.json precede the whole journal (after=-1); a row
+        added by the journal takes the operations that follow its 'add'.
+        """
+        owns_updates = row.get('record_id') in self._updates and row.get('record_id') not in self._updated_record_ids
+        if owns_updates:
+            self._updated_record_ids.add(row.get('record_id'))
+        position = after
+        while True:
+            lock_position, lock = self._next(self._locks.get((row.get('class_id'), row.get('date'))), position)
+            update_position, updates = (self._next(self._updates.get(row.get('record_id')), position)
+                                        if owns_updates else (None, None))
+            if lock_position is None and update_position is None:
+                return row
+            if update_position is None or (lock_position is not None and lock_position < update_position):
+                position = lock_position
+                if row['attendance_type'] != lock['attendance_type']:
+                    continue
+                if lock['attendance_type'] == 'period' and lock['period'] and row.get('period') != lock['period']:
+                    continue
+                row['locked'] = True
+            else:
+                position = update_position
+                self.updated_pairs.add((row.get('class_id'), row.get('date')))
+                row.update(updates)
+                self.updated_pairs.add((row.get('class_id'), row.get('date')))
@@ -0,0 +1,101 @@
+"""Memory and time to materialize attendance history as AttendanceRecord objects.
+
+Usage:
+    python benchmarks/attendance_records.py [--records 200000]
+
+Rows are generated in the shape of attendance.json and decoded from JSON, so
+every string is a separate object as it is after json.load. The current
+AttendanceRecord is compared with the previous dict-backed implementation.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AttendanceRecord
+
+
+class DictAttendanceRecord:
+    """AttendanceRecord as it was before __slots__, for comparison"""
+
+    def __init__(self, record_id, class_id, date, attendance_type, period=None, student_id="", status="",
+                 is_late=False, marked_by="", locked=False, submitted_as_type="period"):
+        self.record_id = record_id
+        self.class_id = class_id
+        self.date = date
+        self.attendance_type = attendance_type
+        self.period = period
+        self.student_id = student_id
+        self.status = status
+        self.is_late = is_late
+        self.marked_by = marked_by
+        self.locked = locked
+        self.submitted_as_type = submitted_as_type
+        self.created_at = datetime.now().isoformat()
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(
+            data['record_id'], data['class_id'], data['date'],
+            data['attendance_type'], data.get('period'), data.get('student_id', ''),
+            data.get('status', ''), data.get('is_late', False),
+            data.get('marked_by', ''), data.get('locked', False),
+            data.get('submitted_as_type', 'period')
+        )
+        record.created_at = data.get('created_at', datetime.now().isoformat())
+        return record
+
+
+def generate_rows(count: int) -> list:
+    rows = []
+    for i in range(count):
+        day = i // 480
+        rows.append({
+            'record_id': f'ATT_{i}',
+            'class_id': f'CS_{day % 8}A',
+            'date': f'2024-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}',
+            'attendance_type': 'period',
+            'period': 1 + i % 8,
+            'student_id': f'STU{i % 60:03d}',
+            'status': 'present' if i % 7 else 'absent',
+            'is_late': i % 11 == 0,
+            'marked_by': 'staff1',
+            'locked': True,
+            'created_at': f'2024-01-01T09:{i % 60:02d}:00',
+            'submitted_as_type': 'period'
+        })
+    return json.loads(json.dumps(rows))
+
+
+def measure(record_class, rows: list) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = [record_class.from_dict(row) for row in rows]
+    elapsed = time.perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return allocated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000, help='number of attendance rows')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.records)
+    results = {}
+    for label, record_class in (('dict', DictAttendanceRecord), ('slots', AttendanceRecord)):
+        allocated, elapsed = measure(record_class, rows)
+        results[label] = allocated
+        print(f"{label:>6}: {allocated / args.records:7.1f} bytes/record, {elapsed * 1000:8.1f} ms")
+    print(f"Memory per record reduced by {1 - results['slots'] / results['dict']:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Multi-process stress test of the storage write path.
+
+Usage:
+    python benchmarks/concurrent_writes.py [--backend json|sqlite] [--workers 4] [--iterations 200]
+
+Worker processes, like gunicorn workers, share one scratch data directory.
+Each one repeatedly submits a batch of attendance, locks it, and appends a
+class with modify_table(). A reader process meanwhile parses the data files
+and checks the attendance count never goes backwards. At the end every
+submitted record and every appended class must be present exactly once, and
+no read may have failed. The exit status is 1 otherwise.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JsonStorage, create_storage
+
+REPO_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def open_storage(data_dir: str, backend: str, compact_bytes: int):
+    os.environ['ATTENDANCE_STORAGE'] = backend
+    storage = create_storage(data_dir)
+    if isinstance(storage, JsonStorage):
+        # A low threshold makes compactions race with the appends
+        storage.JOURNAL_COMPACT_BYTES = compact_bytes
+    return storage
+
+
+def seed(data_dir: str, backend: str):
+    storage = open_storage(data_dir, backend, JsonStorage.JOURNAL_COMPACT_BYTES)
+    for table in ('users', 'classes', 'students'):
+        with open(os.path.join(REPO_DATA_DIR, f'{table}.json')) as f:
+            storage.save_table(table, json.load(f))
+    storage.save_table('attendance', [])
+
+
+def writer(worker: int, args, data_dir: str):
+    storage = open_storage(data_dir, args.backend, args.compact_bytes)
+    for i in range(args.iterations):
+        class_id = f'STRESS_{worker}_{i}'
+        date_str = f'2030-01-{1 + i % 28:02d}'
+        storage.add_attendance([{
+            'record_id': f'{class_id}_{j}', 'class_id': class_id, 'date': date_str, 'attendance_type': 'day',
+            'period': 1, 'student_id': f'S{j}', 'status': 'present', 'is_late': False,
+            'marked_by': f'worker{worker}', 'locked': False, 'created_at': '2030-01-01T09:00:00',
+            'submitted_as_type': 'day'
+        } for j in range(args.batch)])
+        storage.lock_attendance(class_id, date_str, 'day')
+        storage.modify_table('classes', lambda rows: rows + [{
+            'class_id': class_id, 'class_name': class_id, 'department': 'Stress', 'semester': 1,
+            'section': 'A', 'students': []
+        }])
+
+
+def reader(args, data_dir: str, stop, failures):
+    storage = open_storage(data_dir, args.backend, args.compact_bytes)
+    last_count = 0
+    while not stop.is_set():
+        if args.backend == 'json':
+            for filename in ('classes.json', 'attendance.json'):
+                try:
+                    with open(os.path.join(data_dir, filename)) as f:
+                        json.load(f)
+                except json.JSONDecodeError:
+                    failures.value += 1
+        count = len(storage.find_attendance())
+        if count < last_count:
+            failures.value += 1
+        last_count = count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=200, help='submissions per worker')
+    parser.add_argument('--batch', type=int, default=30, help='attendance records per submission')
+    parser.add_argument('--compact-bytes', type=int, default=256 * 1024,
+                        help='journal size that triggers compaction (json backend)')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='attendance-stress-')
+    try:
+        seed(data_dir, args.backend)
+        base_classes = len(open_storage(data_dir, args.backend, args.compact_bytes).load_table('classes'))
+
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        failures = context.Value('i', 0)
+        watcher = context.Process(target=reader, args=(args, data_dir, stop, failures))
+        watcher.start()
+        started = time.perf_counter()
+        workers = [context.Process(target=writer, args=(worker, args, data_dir)) for worker in range(args.workers)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        watcher.join()
+
+        storage = open_storage(data_dir, args.backend, args.compact_bytes)
+        record_ids = [row['record_id'] for row in storage.find_attendance()]
+        expected_records = args.workers * args.iterations * args.batch
+        unlocked = sum(1 for row in storage.find_attendance() if not row['locked'])
+        class_ids = [row['class_id'] for row in storage.load_table('classes')]
+        expected_classes = base_classes + args.workers * args.iterations
+
+        submissions = args.workers * args.iterations
+        print(f"{args.backend}: {submissions} submissions from {args.workers} workers in {elapsed:.2f}s "
+              f"({submissions / elapsed:.0f}/s)")
+        print(f"  attendance records: {len(record_ids)} stored, {len(set(record_ids))} distinct, "
+              f"{expected_records} expected, {unlocked} left unlocked")
+        print(f"  classes: {len(class_ids)} stored, {len(set(class_ids))} distinct, {expected_classes} expected")
+        print(f"  failed or backwards reads: {failures.value}")
+        ok = (len(record_ids) == len(set(record_ids)) == expected_records and unlocked == 0
+              and len(class_ids) == expected_classes and failures.value == 0)
+        print("OK" if ok else "FAILED")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
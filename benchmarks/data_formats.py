@@ -0,0 +1,112 @@
+"""Size and speed of the pretty and compact data file formats.
+
+Usage:
+    python benchmarks/data_formats.py [--years 3] [--classes 4] [--students 40]
+
+Builds a synthetic attendance history spanning the given number of academic
+years (every class marked for day attendance and each of its periods on
+every school day) and, for each ATTENDANCE_DATA_FORMAT, times a save as a
+compaction does it, a full load as a resident worker does it, and a streamed
+scan as ATTENDANCE_RESIDENT=0 does it. Writes skip fsync, so the save times
+are those of encoding and the page cache.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from atomic_io import write_json_array_atomic
+from attendance_stream import iter_json_array
+from storage import JsonStorage
+
+PERIODS = 6
+
+
+def generate_rows(years: int, classes: int, students: int):
+    day = date(2024, 6, 1)
+    end = date(2024 + years, 6, 1)
+    number = 0
+    while day < end:
+        if day.weekday() < 5:
+            for class_number in range(classes):
+                class_id = f'CS_{class_number + 1}A'
+                for attendance_type, period in [('day', None)] + [('period', p) for p in range(1, PERIODS + 1)]:
+                    for student in range(students):
+                        number += 1
+                        yield {
+                            'record_id': f'{number:08x}-0000-4000-8000-{number:012x}',
+                            'class_id': class_id,
+                            'date': day.isoformat(),
+                            'attendance_type': attendance_type,
+                            'period': period,
+                            'student_id': f'CS{class_number + 1}A{student + 1:03d}',
+                            'status': 'absent' if (number * 7919) % 13 == 0 else 'present',
+                            'is_late': (number * 104729) % 29 == 0,
+                            'marked_by': f'staff{class_number % 5 + 1}',
+                            'locked': True,
+                            'created_at': f'{day.isoformat()}T09:{number % 60:02d}:00.000000'
+                        }
+        day += timedelta(days=1)
+
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=3, help='academic years of attendance')
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--students', type=int, default=40, help='students per class')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per timing; the best is reported')
+    args = parser.parse_args()
+
+    rows = list(generate_rows(args.years, args.classes, args.students))
+    print(f"{len(rows)} attendance rows over {args.years} years")
+    data_dir = tempfile.mkdtemp(prefix='attendance-formats-')
+    try:
+        results = {}
+        for data_format, indent in JsonStorage.DATA_FORMATS.items():
+            path = os.path.join(data_dir, f'{data_format}.json')
+            save = best_of(args.repeat, lambda: write_json_array_atomic(path, iter(rows), indent=indent, fsync=False))
+
+            def load():
+                with open(path) as f:
+                    json.load(f)
+
+            def scan():
+                with open(path) as f:
+                    for _ in iter_json_array(f):
+                        pass
+
+            with open(path, 'rb') as f:
+                gzipped = len(gzip.compress(f.read()))
+            results[data_format] = (os.path.getsize(path), gzipped, save, best_of(args.repeat, load),
+                                    best_of(args.repeat, scan))
+
+        baseline = results['pretty']
+        print(f"{'format':>8} {'size':>10} {'gzipped':>10} {'save':>9} {'load':>9} {'scan':>9}")
+        for data_format, (size, gzipped, save, load, scan) in results.items():
+            print(f"{data_format:>8} {size / 2 ** 20:7.1f} MB {gzipped / 2 ** 20:7.1f} MB "
+                  f"{save:8.2f}s {load:8.2f}s {scan:8.2f}s")
+            if data_format != 'pretty':
+                print(f"{'':>8} {size / baseline[0]:9.0%}  {gzipped / baseline[1]:9.0%}  "
+                      f"{save / baseline[2]:8.0%} {load / baseline[3]:8.0%} {scan / baseline[4]:8.0%}  of pretty")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Backtest the attendance forecasts of forecasting.py and time their fit.
+
+Usage:
+    python benchmarks/forecasting.py [--classes 20] [--students 60] [--days 160] [--weekday-effect 0.6]
+        [--drift 1.0] [--cutoffs 40] [--seed 1]
+
+Generates day attendance with synthetic_data.py, then for each of the last
+--cutoffs school days that have a week of attendance after them: fits the
+model on the HISTORY_DAYS up to that day, as AttendanceForecaster does, and
+forecasts the school days of the following week. The department forecasts
+are scored against what happened, next to the chatbot's previous
+predictions (7-day mean with a fixed slope or wiggle by trend) and a plain
+7-day mean. The class forecasts are scored against each class's own 7-day
+mean. Errors are in percentage points. Coverage is the share of days inside
+the 80% interval.
+
+Fit times are for all classes at once: a full fit from the whole history,
+and the refresh of the last REFRESH_DAYS days done between full fits.
+Building the attendance matrices the fits read is timed separately.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import SyntheticDataset
+import analytics_engine
+from analytics_engine import AttendanceMatrix, np
+from forecasting import HISTORY_DAYS, REFRESH_DAYS, SeasonalTrendModel, attendance_series, department_forecast
+from models import Class
+
+
+def previous_predictions(history: list, horizons: list) -> list:
+    """The chatbot's predictions before forecasting.py; history is newest first"""
+    average = statistics.mean(history[:7])
+    trend = analytics_engine.trend_direction(history[:7])
+    predictions = []
+    for i in horizons:
+        if trend == 'improving':
+            predictions.append(min(100, average + i * 2))
+        elif trend == 'declining':
+            predictions.append(max(60, average - i * 1.5))
+        else:
+            predictions.append(average + ((i % 2) * 3 - 1.5))
+    return predictions
+
+
+def scores(errors: list) -> str:
+    errors = np.asarray(errors)
+    return f"MAE {np.abs(errors).mean():5.2f}, RMSE {np.sqrt((errors ** 2).mean()):5.2f}"
+
+
+def best_ms(run, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--students', type=int, default=60, help='students per class')
+    parser.add_argument('--days', type=int, default=160, help='school days of attendance')
+    parser.add_argument('--absence-rate', type=float, default=0.1)
+    parser.add_argument('--weekday-effect', type=float, default=0.6)
+    parser.add_argument('--drift', type=float, default=1.0)
+    parser.add_argument('--cutoffs', type=int, default=40, help='forecast origins to score')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not analytics_engine.HAS_NUMPY:
+        sys.exit("The forecasts need NumPy")
+
+    dataset = SyntheticDataset(args.classes, args.students, args.days, 0, args.absence_rate, 0.05, args.seed,
+                               date(2025, 12, 19), args.weekday_effect, args.drift)
+    rows = list(dataset.attendance_rows())
+    classes = [Class.from_dict(row) for row in dataset.classes]
+    sizes = {row['class_id']: args.students for row in dataset.classes}
+    days = dataset.school_days()
+    first, last = date.fromisoformat(days[0]), date.fromisoformat(days[-1])
+    matrix = AttendanceMatrix.build(rows, classes, sizes, days[0], days[-1])
+    print(f"{len(classes)} classes, {len(dataset.students)} students, {len(days)} school days "
+          f"from {days[0]} to {days[-1]}")
+
+    origin = first.toordinal()
+    day_numbers = np.arange(origin, last.toordinal() + 1)
+    percentages, marked = attendance_series(matrix)
+    series = len(percentages)
+    department = np.array([day['overall_percentage'] for day in matrix.daily_totals()])
+    school_day_numbers = [date.fromisoformat(day).toordinal() for day in days]
+    cutoffs = [day for day in school_day_numbers
+               if day - HISTORY_DAYS + 1 >= origin and day + 7 <= last.toordinal()][-args.cutoffs:]
+
+    errors = {'forecast': [], 'previous': [], 'mean7': []}
+    class_errors = {'forecast': [], 'mean7': []}
+    covered = []
+    for cutoff in cutoffs:
+        window = slice(cutoff - HISTORY_DAYS + 1 - origin, cutoff + 1 - origin)
+        model = SeasonalTrendModel(series, cutoff)
+        model.add(day_numbers[window], percentages[:, window], marked[:, window])
+        model.solve()
+
+        targets = [day for day in school_day_numbers if cutoff < day <= cutoff + 7]
+        actual = department[[day - origin for day in targets]]
+        forecast = department_forecast(model, targets)
+        history = [value for value in department[cutoff - 13 - origin:cutoff + 1 - origin][::-1] if value > 0]
+        for i, day in enumerate(forecast):
+            errors['forecast'].append(day['predicted_attendance'] - actual[i])
+            covered.append(bool(day['low'] <= actual[i] <= day['high']))
+        errors['previous'] += list(np.array(previous_predictions(history, [day - cutoff for day in targets]))
+                                   - actual)
+        errors['mean7'] += list(statistics.mean(history[:7]) - actual)
+
+        class_actual = percentages[:-1, [day - origin for day in targets]]
+        class_forecast = model.predict(targets)[0][:-1]
+        class_errors['forecast'] += list((class_forecast - class_actual).ravel())
+        for c in range(len(classes)):
+            recent = percentages[c, window][marked[c, window]][-7:]
+            class_errors['mean7'] += list(recent.mean() - class_actual[c])
+
+    print(f"\n{len(cutoffs)} forecast origins, {len(errors['forecast'])} department days forecast")
+    print(f"  department, forecast:  {scores(errors['forecast'])}, 80% interval coverage "
+          f"{100 * statistics.mean(covered):.0f}%")
+    print(f"  department, previous:  {scores(errors['previous'])}")
+    print(f"  department, 7-day mean: {scores(errors['mean7'])}")
+    print(f"  classes, forecast:     {scores(class_errors['forecast'])}")
+    print(f"  classes, 7-day mean:   {scores(class_errors['mean7'])}")
+
+    cutoff = cutoffs[-1]
+    window = slice(cutoff - HISTORY_DAYS + 1 - origin, cutoff + 1 - origin)
+    recent = slice(cutoff - REFRESH_DAYS + 1 - origin, cutoff + 1 - origin)
+    model = SeasonalTrendModel(series, cutoff)
+
+    def full_fit():
+        fitted = SeasonalTrendModel(series, cutoff)
+        fitted.add(day_numbers[window], percentages[:, window], marked[:, window])
+        fitted.solve()
+
+    def refresh():
+        model.add(day_numbers[recent], percentages[:, recent], marked[:, recent], sign=-1)
+        model.add(day_numbers[recent], percentages[:, recent], marked[:, recent])
+        model.solve()
+
+    model.add(day_numbers[window], percentages[:, window], marked[:, window])
+    model.solve()
+    history_start = date.fromordinal(cutoff - HISTORY_DAYS + 1).isoformat()
+    refresh_start = date.fromordinal(cutoff - REFRESH_DAYS + 1).isoformat()
+    cutoff_date = date.fromordinal(cutoff).isoformat()
+    history_rows = [row for row in rows if history_start <= row['date'] <= cutoff_date]
+    refresh_rows = [row for row in rows if refresh_start <= row['date'] <= cutoff_date]
+    print(f"\nTimes for {len(classes)} classes (best of 5)")
+    print(f"  full fit, {HISTORY_DAYS} days:          {best_ms(full_fit):8.2f} ms")
+    print(f"  refresh, last {REFRESH_DAYS} days:        {best_ms(refresh):8.2f} ms")
+    print(f"  forecast, 7 days:             {best_ms(lambda: model.predict(school_day_numbers[-7:])):8.2f} ms")
+    print(f"  matrix build, {HISTORY_DAYS} days:      "
+          f"{best_ms(lambda: AttendanceMatrix.build(history_rows, classes, sizes, history_start, cutoff_date)):8.2f} ms")
+    print(f"  matrix build, {REFRESH_DAYS} days:        "
+          f"{best_ms(lambda: AttendanceMatrix.build(refresh_rows, classes, sizes, refresh_start, cutoff_date)):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
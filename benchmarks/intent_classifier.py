@@ -0,0 +1,145 @@
+"""Latency and parity of the compiled chatbot intent classifier.
+
+Usage:
+    python benchmarks/intent_classifier.py [--repeat 20]
+
+Classifies a corpus of realistic chatbot queries, built from templates with
+class names, dates and student ids filled in, with the previous
+_identify_intent (one re.search per pattern and a keyword table rebuilt per
+intent) and with the IntentClassifier the chatbot now uses. Every query must
+get the same intent and confidence from both; the exit status is 1 otherwise.
+Entity extraction is timed too, as process_query runs it on every query.
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+TEMPLATES = [
+    'show attendance for {cls} {date}', 'what is the attendance of {cls} today', 'attendance for {cls} yesterday',
+    'how many students were absent in {cls}', 'who was present for {cls} on {date}', 'show latecomers for {cls}',
+    'list late students in {cls} today', 'who came late for {cls}', 'late students in {cls} {date}',
+    'show student details for {student}', 'find info about {student}', 'attendance of student {student}',
+    'show attendance analytics', 'attendance trend for the last month', 'show me a chart of attendance',
+    'performance improvement over time', 'any pattern in {cls} absences', 'predict attendance for next week',
+    'forecast attendance for {cls}', 'what will attendance be tomorrow', 'upcoming attendance for {cls}',
+    'compare {cls} versus {other}', 'which class has the best attendance', 'is {cls} better than {other}',
+    'compare this week against last week', 'what about {cls}', 'how about {other} on {date}', 'more details',
+    'help', 'what can you do', 'summary for {date}', 'give me the department summary',
+    'Show Attendance For {cls} On {date} Please', 'tardy people in {cls}',
+]
+CLASSES = ['cs 2a', '2nd year computer science a', '2nd year b', 'cs 3', 'it 2', '3rd year computer science',
+           'section a', 'information technology']
+DATES = ['today', 'yesterday', '2025-09-06', '2025-10-01', 'on monday']
+STUDENTS = ['cs2a001', 'cs3a017', 'it2a042', 'adhishesan', '620124243011']
+
+
+def build_corpus() -> list:
+    corpus = []
+    for i, template in enumerate(TEMPLATES):
+        for j, cls in enumerate(CLASSES):
+            corpus.append(template.format(cls=cls, other=CLASSES[(j + 3) % len(CLASSES)],
+                                          date=DATES[(i + j) % len(DATES)],
+                                          student=STUDENTS[(i + j) % len(STUDENTS)]))
+    # Long rambling queries, where the .* patterns backtrack the most
+    corpus += [' '.join(corpus[i:i + 6]) for i in range(0, 60, 6)]
+    return corpus
+
+
+def reference_identify_intent(intent_patterns: dict, query: str) -> tuple:
+    """AttendanceChatbot._identify_intent as it was before IntentClassifier"""
+    max_confidence = 0
+    best_intent = 'attendance'
+
+    for intent, patterns in intent_patterns.items():
+        confidence = 0
+        for pattern in patterns:
+            if re.search(pattern, query, re.IGNORECASE):
+                confidence = max(confidence, 0.8)
+
+        intent_keywords = {
+            'attendance_query': ['attendance', 'present', 'absent', 'show'],
+            'latecomer_query': ['late', 'latecomer', 'tardy'],
+            'student_query': ['student', 'info', 'details'],
+            'analytics_query': ['analytics', 'trend', 'pattern', 'chart'],
+            'prediction_query': ['predict', 'forecast', 'future'],
+            'comparison_query': ['compare', 'versus', 'better', 'best']
+        }
+
+        if intent in intent_keywords:
+            keyword_matches = sum(1 for keyword in intent_keywords[intent] if keyword in query)
+            confidence += keyword_matches * 0.2
+
+        if confidence > max_confidence:
+            max_confidence = confidence
+            best_intent = intent
+
+    return best_intent.replace('_query', ''), min(max_confidence, 1.0)
+
+
+def per_query_us(run, corpus: list, repeat: int) -> list:
+    """Microseconds per query, best of repeat passes, in corpus order"""
+    best = [float('inf')] * len(corpus)
+    for _ in range(repeat):
+        for i, query in enumerate(corpus):
+            started = time.perf_counter()
+            run(query)
+            best[i] = min(best[i], (time.perf_counter() - started) * 1e6)
+    return best
+
+
+def describe(timings: list) -> str:
+    ordered = sorted(timings)
+    return (f"mean {statistics.mean(timings):7.1f} us, median {statistics.median(timings):7.1f} us, "
+            f"p95 {ordered[int(len(ordered) * 0.95)]:7.1f} us, max {ordered[-1]:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='passes over the corpus; the best time is kept')
+    args = parser.parse_args()
+
+    # Importing the chatbot starts a DataManager on ./data, so give it a scratch copy
+    work_dir = tempfile.mkdtemp(prefix='attendance-intents-')
+    cwd = os.getcwd()
+    try:
+        shutil.copytree(os.path.join(REPO_DIR, 'data'), os.path.join(work_dir, 'data'))
+        os.chdir(work_dir)
+        from chatbot import chatbot
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    corpus = [query.lower().strip() for query in build_corpus()]
+    mismatches = []
+    for query in corpus:
+        expected = reference_identify_intent(chatbot.intent_patterns, query)
+        actual = chatbot._identify_intent(query)
+        if expected != actual:
+            mismatches.append((query, expected, actual))
+
+    reference = per_query_us(lambda query: reference_identify_intent(chatbot.intent_patterns, query), corpus, args.repeat)
+    compiled = per_query_us(chatbot._identify_intent, corpus, args.repeat)
+    context = {'last_class': '', 'last_student': ''}
+    entities = per_query_us(lambda query: chatbot._extract_entities(query, context), corpus, args.repeat)
+
+    print(f"{len(corpus)} queries, {len(corpus) - len(mismatches)} classified the same")
+    print(f"  previous classifier: {describe(reference)}")
+    print(f"  compiled classifier: {describe(compiled)}")
+    print(f"  entity extraction:   {describe(entities)}")
+    print(f"  speedup: {sum(reference) / sum(compiled):.1f}x overall, "
+          f"{statistics.median(r / c for r, c in zip(reference, compiled)):.1f}x median per query")
+    for query, expected, actual in mismatches[:10]:
+        print(f"  MISMATCH {query!r}: {expected} before, {actual} now")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
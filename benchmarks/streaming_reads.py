@@ -0,0 +1,103 @@
+"""Peak memory and time of attendance queries with resident and streamed rows.
+
+Usage:
+    python benchmarks/streaming_reads.py [--records 300000]
+
+A scratch data directory gets an attendance.json of the given size plus a
+journal with a few submissions on top. Each mode runs in a fresh process, so
+the peak resident set size reported is that of one worker answering
+get_attendance_records, get_student_attendance_history and a class summary.
+ATTENDANCE_RESIDENT=0 selects the streamed mode.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from atomic_io import write_json_array_atomic
+from storage import JsonStorage
+
+# The roll call the queries read, which the journal submits and locks
+CLASS_ID, DATE, PERIOD = 'CS_3A', '2024-03-04', 2
+
+QUERIES = """
+import resource, sys, time
+sys.path.insert(0, {repo!r})
+from data_manager import DataManager
+from storage import JsonStorage
+manager = DataManager(JsonStorage({data_dir!r}))
+started = time.perf_counter()
+records = manager.get_attendance_records({class_id!r}, {date!r}, 'period', {period!r})
+history = manager.get_student_attendance_history('STU007', '2024-02-01', '2024-02-29')
+summary = manager.storage.summarize_attendance({class_id!r}, {date!r}, 'period', {period!r})
+elapsed = time.perf_counter() - started
+print(len(records), len(history), summary['records'], elapsed,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def generate_rows(count: int):
+    for i in range(count):
+        day = i // 480
+        yield {
+            'record_id': f'ATT_{i}',
+            'class_id': f'CS_{day % 8}A',
+            'date': f'2024-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}',
+            'attendance_type': 'period',
+            'period': 1 + i % 8,
+            'student_id': f'STU{i % 60:03d}',
+            'status': 'present' if i % 7 else 'absent',
+            'is_late': i % 11 == 0,
+            'marked_by': 'staff1',
+            'locked': True,
+            'created_at': f'2024-01-01T09:{i % 60:02d}:00',
+            'submitted_as_type': 'period'
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=300000, help='number of attendance rows')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='attendance-stream-')
+    try:
+        for table in ('users', 'classes', 'students'):
+            shutil.copy(os.path.join(REPO_DIR, 'data', f'{table}.json'), data_dir)
+        write_json_array_atomic(os.path.join(data_dir, 'attendance.json'), generate_rows(args.records), fsync=False)
+        storage = JsonStorage(data_dir)
+        # Save the rollup, then leave a journal for the queries to replay
+        storage.resident_attendance = False
+        storage.rebuild_rollup()
+        # A day of period attendance for the queried class, 60 students per period
+        storage.add_attendance([dict(row, record_id=f'NEW_{row["record_id"]}', class_id=CLASS_ID, date=DATE,
+                                     locked=False)
+                                for row in generate_rows(480)])
+        storage.lock_attendance(CLASS_ID, DATE, 'period', PERIOD)
+
+        print(f"{args.records} attendance rows, {os.path.getsize(os.path.join(data_dir, 'attendance.json')) >> 20} MB")
+        for label, resident in (('resident', '1'), ('streamed', '0')):
+            env = dict(os.environ, ATTENDANCE_RESIDENT=resident)
+            started = time.perf_counter()
+            queries = QUERIES.format(repo=REPO_DIR, data_dir=data_dir, class_id=CLASS_ID, date=DATE, period=PERIOD)
+            output = subprocess.run([sys.executable, '-c', queries],
+                                    env=env, capture_output=True, text=True, check=True, cwd=data_dir).stdout
+            records, history, summary_records, elapsed, peak_kb = output.splitlines()[-1].split()
+            # The journal alone holds 60 rows of the roll call
+            assert int(records) >= 60 and int(summary_records) >= 60, \
+                f"{label} queries missed the journal rows: {records} records, summary of {summary_records}"
+            print(f"{label:>9}: {int(peak_kb) / 1024:7.1f} MB peak RSS, queries {float(elapsed) * 1000:8.1f} ms, "
+                  f"process {time.perf_counter() - started:6.2f} s "
+                  f"({records} records, {history} history rows, summary of {summary_records})")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Time the main DataManager operations and routes on a synthetic dataset.
+
+Usage:
+    python benchmarks/suite.py [--classes 20] [--students 60] [--days 120] [--backend json|sqlite]
+        [--repeat 5] [--output benchmark_results.json]
+
+The app runs against a scratch data directory from synthetic_data.py (see
+there for the dataset options). Each operation is run once cold, right after
+the app has started, and then --repeat more times; the results, with the
+dataset and environment they were measured on, are written as JSON to
+--output so runs can be compared over time. Routes go
+through the Flask test client logged in as the HOD, so they include
+template rendering but no network. ATTENDANCE_RESIDENT and
+ATTENDANCE_DATA_FORMAT apply as they do for the app.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import SyntheticDataset
+
+# {date} is the last school day of the dataset
+CHATBOT_QUERIES = {
+    'attendance': 'show attendance for {date}',
+    'latecomers': 'show late students for {date}',
+    'analytics': 'show attendance analytics',
+    'prediction': 'forecast attendance',
+    'comparison': 'compare this week against last week',
+}
+
+
+def measure(run, repeat: int) -> dict:
+    """Timings in milliseconds of one cold run of run() and repeat warm ones"""
+    started = time.perf_counter()
+    run()
+    first = time.perf_counter() - started
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return {
+        'first_ms': round(first * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3) if timings else None,
+        'median_ms': round(statistics.median(timings) * 1000, 3) if timings else None,
+        'runs': repeat
+    }
+
+
+def run_suite(dataset: SyntheticDataset, repeat: int) -> dict:
+    """Time the operations against the app imported from the current directory"""
+    from app import app
+    from data_manager import data_manager
+    from models import AttendanceRecord
+
+    # app.py logs every request at DEBUG
+    logging.getLogger().setLevel(logging.WARNING)
+    days = dataset.school_days()
+    latest, first_day = days[-1], days[0]
+    class_id = dataset.classes[len(dataset.classes) // 2]['class_id']
+    student_id = dataset.students[len(dataset.students) // 2]['student_id']
+    student_name = dataset.students[len(dataset.students) // 2]['name'].split()[0]
+    staff = dataset.staff_for(class_id)
+    save_dates = (date.fromisoformat(latest) + timedelta(days=offset) for offset in range(1, 10 ** 6))
+
+    def save_attendance():
+        date_str = next(save_dates).isoformat()
+        data_manager.save_attendance_records([
+            AttendanceRecord(f'BENCH_{date_str}_{student.student_id}', class_id, date_str, 'period', 1,
+                             student.student_id, 'present', marked_by=staff, locked=True)
+            for student in data_manager.get_students_by_class(class_id)
+        ])
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'hod', 'password': 'hod123'})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as the HOD: {response.status_code}")
+
+    def get(url: str):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return run
+
+    def chatbot_query(query: str):
+        def run():
+            response = client.post('/chatbot-query', json={'query': query})
+            if response.status_code != 200:
+                raise RuntimeError(f"Chatbot query {query!r} returned {response.status_code}")
+        return run
+
+    operations = {
+        'get_department_attendance_summary':
+            lambda: data_manager.get_department_attendance_summary(latest, 'day', 1),
+        'get_class_attendance_summary': lambda: data_manager.get_class_attendance_summary(class_id, latest),
+        'get_student_attendance_history':
+            lambda: data_manager.get_student_attendance_history(student_id, first_day, latest),
+        'search_students': lambda: data_manager.search_students(student_name),
+        'save_attendance_records': save_attendance,
+        'route /hod': get(f'/hod?date={latest}'),
+        'route /class-details': get(f'/class-details/{class_id}?date={latest}'),
+    }
+    for name, query in CHATBOT_QUERIES.items():
+        operations[f'route /chatbot-query ({name})'] = chatbot_query(query.format(date=latest))
+
+    results = {}
+    for name, run in operations.items():
+        results[name] = measure(run, repeat)
+        print(f"{name:>42}: first {results[name]['first_ms']:9.2f} ms, "
+              f"median {results[name]['median_ms'] or 0:9.2f} ms", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--students', type=int, default=60, help='students per class')
+    parser.add_argument('--days', type=int, default=120, help='school days of attendance')
+    parser.add_argument('--periods', type=int, default=8, help='periods per day')
+    parser.add_argument('--absence-rate', type=float, default=0.1)
+    parser.add_argument('--late-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--repeat', type=int, default=5, help='warm runs per operation')
+    parser.add_argument('--output', default='benchmark_results.json', help='file the JSON results are written to')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    cwd = os.getcwd()
+
+    dataset = SyntheticDataset(args.classes, args.students, args.days, args.periods,
+                               args.absence_rate, args.late_rate, args.seed)
+    work_dir = tempfile.mkdtemp(prefix='attendance-bench-')
+    try:
+        started = time.perf_counter()
+        dataset.write(os.path.join(work_dir, 'data'))
+        print(f"{len(dataset.classes)} classes, {len(dataset.students)} students, {dataset.attendance_count} "
+              f"attendance rows generated in {time.perf_counter() - started:.1f}s")
+
+        # The app serves the data directory under its working directory
+        os.chdir(work_dir)
+        os.environ['ATTENDANCE_STORAGE'] = args.backend
+        os.environ.setdefault('ATTENDANCE_JOURNAL_FSYNC', '0')
+        if args.backend == 'sqlite':
+            from migrate_to_sqlite import migrate
+            migrate('data', os.path.join('data', 'attendance.db'))
+
+        started = time.perf_counter()
+        import app  # noqa: F401 - loads the data files, as a starting worker does
+        startup_ms = round((time.perf_counter() - started) * 1000, 3)
+        results = run_suite(dataset, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dataset': {
+            'classes': args.classes, 'students_per_class': args.students, 'days': args.days,
+            'periods': args.periods, 'absence_rate': args.absence_rate, 'late_rate': args.late_rate,
+            'seed': args.seed, 'attendance_rows': dataset.attendance_count
+        },
+        'environment': {
+            'backend': args.backend,
+            'resident': os.environ.get('ATTENDANCE_RESIDENT', '1') != '0',
+            'data_format': os.environ.get('ATTENDANCE_DATA_FORMAT', 'pretty'),
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'startup_ms': startup_ms,
+        'results': results
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
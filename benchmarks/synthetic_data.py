@@ -0,0 +1,174 @@
+"""Synthetic data directories for benchmarks.
+
+Usage:
+    python benchmarks/synthetic_data.py OUTPUT_DIR [--classes 20] [--students 60] [--days 120]
+        [--periods 8] [--absence-rate 0.1] [--late-rate 0.05] [--weekday-effect 0] [--drift 0] [--seed 1]
+
+Writes users.json, classes.json, students.json and attendance.json in the
+shapes the app writes them. Every class is marked on each of the given
+number of school days (Monday to Friday) up to --end, for day attendance
+and for each period. A student misses a day or a period with roughly the
+absence rate, some students far more often than others, and comes in late
+with the late rate. --weekday-effect makes absences that much more likely
+on Mondays and Fridays and less likely mid-week, and --drift raises the
+absence rate by that fraction from the first day to the last, giving
+forecasts something to find. The same seed always gives the same directory.
+
+Logins: admin/admin123, hod/hod123 and staffN/staff123, where each staff
+member is assigned two consecutive classes.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from atomic_io import write_json_array_atomic
+
+DEPARTMENTS = ['CS', 'IT', 'ECE', 'EEE', 'MECH']
+FIRST_NAMES = ['Aarav', 'Anitha', 'Arjun', 'Bharath', 'Deepa', 'Divya', 'Ganesh', 'Harini', 'Karthik', 'Kavya',
+               'Lakshmi', 'Manoj', 'Meena', 'Naveen', 'Priya', 'Rahul', 'Ramya', 'Sanjay', 'Sneha', 'Vignesh']
+LAST_NAMES = ['Kumar', 'Raman', 'Subramanian', 'Krishnan', 'Murugan', 'Natarajan', 'Pillai', 'Iyer', 'Reddy',
+              'Selvam', 'Balaji', 'Chandran']
+# Relative change in the absence rate per weekday, Monday first, scaled by weekday_effect
+WEEKDAY_ABSENCE = (1.0, -0.5, -0.5, -0.25, 0.75)
+
+
+class SyntheticDataset:
+    """The rows of a synthetic data directory; attendance is generated lazily"""
+
+    def __init__(self, classes: int = 20, students: int = 60, days: int = 120, periods: int = 8,
+                 absence_rate: float = 0.1, late_rate: float = 0.05, seed: int = 1, end: date = None,
+                 weekday_effect: float = 0.0, drift: float = 0.0):
+        self.class_count = classes
+        self.students_per_class = students
+        self.day_count = days
+        self.periods = periods
+        self.absence_rate = absence_rate
+        self.late_rate = late_rate
+        self.weekday_effect = weekday_effect
+        self.drift = drift
+        self.seed = seed
+        self.end = end or date.today()
+
+        rng = random.Random(seed)
+        self.classes = []
+        for number in range(classes):
+            department = DEPARTMENTS[number % len(DEPARTMENTS)]
+            year, section = 1 + number // (2 * len(DEPARTMENTS)) % 4, 'AB'[number // len(DEPARTMENTS) % 2]
+            class_id = f'{department}_{year}{section}_{number:03d}'
+            self.classes.append({'class_id': class_id, 'class_name': f'{department} {year}{section} ({number})',
+                                 'department': department, 'semester': 2 * year, 'section': section,
+                                 'students': []})
+        self.students = []
+        # How much more or less often than the average each student is absent
+        self.absence_weights = {}
+        for class_row in self.classes:
+            for number in range(students):
+                student_id = f"{class_row['class_id']}_S{number + 1:03d}"
+                self.students.append({
+                    'student_id': student_id, 'roll_number': student_id,
+                    'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', 'class_id': class_row['class_id'],
+                    'email': f'{student_id.lower()}@college.edu', 'phone': f'98{rng.randrange(10 ** 8):08d}'
+                })
+                self.absence_weights[student_id] = rng.choice((0.2, 0.5, 1, 1, 1, 1.5, 3))
+        self.users = [
+            {'user_id': 'admin1', 'username': 'admin', 'password': 'admin123', 'role': 'admin',
+             'name': 'System Administrator', 'assigned_classes': []},
+            {'user_id': 'hod1', 'username': 'hod', 'password': 'hod123', 'role': 'hod',
+             'name': 'Head of Department', 'assigned_classes': []},
+        ]
+        for number in range(0, classes, 2):
+            staff = number // 2 + 1
+            self.users.append({'user_id': f'staff{staff}', 'username': f'staff{staff}', 'password': 'staff123',
+                               'role': 'staff', 'name': f'Staff Member {staff}',
+                               'assigned_classes': [row['class_id'] for row in self.classes[number:number + 2]]})
+
+    def school_days(self) -> List[str]:
+        """The dates attendance is marked on, oldest first"""
+        days = []
+        day = self.end
+        while len(days) < self.day_count:
+            if day.weekday() < 5:
+                days.append(day.isoformat())
+            day -= timedelta(days=1)
+        return days[::-1]
+
+    def staff_for(self, class_id: str) -> str:
+        return next(user['user_id'] for user in self.users if class_id in user['assigned_classes'])
+
+    def attendance_rows(self) -> Iterator[Dict]:
+        """Yield the attendance rows in the order the app would have saved them"""
+        rng = random.Random(self.seed + 1)
+        number = 0
+        students_by_class = {}
+        for student in self.students:
+            students_by_class.setdefault(student['class_id'], []).append(student['student_id'])
+        school_days = self.school_days()
+        for day_number, date_str in enumerate(school_days):
+            absence_rate = self.absence_rate * (
+                1 + self.weekday_effect * WEEKDAY_ABSENCE[date.fromisoformat(date_str).weekday()]
+            ) * (1 + self.drift * day_number / max(len(school_days) - 1, 1))
+            for class_row in self.classes:
+                class_id = class_row['class_id']
+                marked_by = self.staff_for(class_id)
+                # Day attendance is taken with the first period
+                for attendance_type, period in [('day', 1)] + [('period', p) for p in range(1, self.periods + 1)]:
+                    for student_id in students_by_class[class_id]:
+                        number += 1
+                        absent = rng.random() < absence_rate * self.absence_weights[student_id]
+                        yield {
+                            'record_id': f'{rng.getrandbits(32):08x}-{number:04x}-4000-8000-{self.seed:012x}',
+                            'class_id': class_id,
+                            'date': date_str,
+                            'attendance_type': attendance_type,
+                            'period': period,
+                            'student_id': student_id,
+                            'status': 'absent' if absent else 'present',
+                            'is_late': not absent and rng.random() < self.late_rate,
+                            'marked_by': marked_by,
+                            'locked': True,
+                            'created_at': f'{date_str}T{8 + period:02d}:{number % 60:02d}:00.000000',
+                            'submitted_as_type': 'period'
+                        }
+
+    @property
+    def attendance_count(self) -> int:
+        return self.day_count * self.class_count * self.students_per_class * (self.periods + 1)
+
+    def write(self, data_dir: str):
+        """Write the data files to data_dir, creating it if needed"""
+        os.makedirs(data_dir, exist_ok=True)
+        for table, rows in (('users', self.users), ('classes', self.classes), ('students', self.students),
+                            ('attendance', self.attendance_rows())):
+            write_json_array_atomic(os.path.join(data_dir, f'{table}.json'), rows, fsync=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir', help='data directory to write')
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--students', type=int, default=60, help='students per class')
+    parser.add_argument('--days', type=int, default=120, help='school days of attendance')
+    parser.add_argument('--periods', type=int, default=8, help='periods per day')
+    parser.add_argument('--absence-rate', type=float, default=0.1)
+    parser.add_argument('--late-rate', type=float, default=0.05)
+    parser.add_argument('--weekday-effect', type=float, default=0.0)
+    parser.add_argument('--drift', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--end', type=date.fromisoformat, help='last school day (default: today)')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.classes, args.students, args.days, args.periods,
+                               args.absence_rate, args.late_rate, args.seed, args.end,
+                               args.weekday_effect, args.drift)
+    dataset.write(args.output_dir)
+    print(f"{len(dataset.classes)} classes, {len(dataset.students)} students, "
+          f"{dataset.attendance_count} attendance rows written to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,28 @@
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from datetime import datetime, date, timedelta
 from data_manager import data_manager
+import analytics_engine
+import metrics
+from chatbot_intents import IntentClassifier
+from chatbot_sessions import ChatbotResultCache, ChatbotSessions
+from chatbot_snapshots import SnapshotRefresher, SnapshotStore
+from forecasting import AttendanceForecaster
+import os
 import re
 import json
 import statistics
 
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+STUDENT_PATTERN = re.compile(r'(?:student|for|about)\s+(\w+)')
+NUMBER_PATTERN = re.compile(r'\d+')
+
 class AttendanceChatbot:
+    # Commands whose answer depends only on the query date, the class and today's date
+    CACHED_COMMANDS = ('analytics', 'predictions', 'insights', 'compare')
+    # Days the 30 day analytics trend is read in when streamed: today alone
+    # for a first answer, then the rest of the week and the rest of the month
+    ANALYTICS_STREAM_CHUNKS = (1, 6, 23)
+
     def __init__(self):
         self.commands = {
             'attendance': self._get_attendance_info,
@@ -53,25 +70,60 @@ class AttendanceChatbot:
             ]
         }
         
-        # Conversation context storage
-        self.conversation_context = {
-            'last_query': '',
-            'last_class': '',
-            'last_student': '',
-            'last_date': '',
-            'preferences': {}
+        # Keyword-based confidence boost
+        self.intent_keywords = {
+            'attendance_query': ['attendance', 'present', 'absent', 'show'],
+            'latecomer_query': ['late', 'latecomer', 'tardy'],
+            'student_query': ['student', 'info', 'details'],
+            'analytics_query': ['analytics', 'trend', 'pattern', 'chart'],
+            'prediction_query': ['predict', 'forecast', 'future'],
+            'comparison_query': ['compare', 'versus', 'better', 'best']
         }
+        # Both compiled once (see chatbot_intents.py)
+        self.intent_classifier = IntentClassifier(self.intent_patterns, self.intent_keywords)
+        
+        # Conversation context of each session (see chatbot_sessions.py)
+        self.sessions = ChatbotSessions()
+        # Results of the commands that depend only on the data and the dates,
+        # shared by all sessions until the next write
+        self.results = ChatbotResultCache()
+        # The same results for today, precomputed in the background and
+        # shared by all workers (see chatbot_snapshots.py)
+        self.snapshots = SnapshotStore(os.path.join(data_manager.data_dir, 'chatbot_snapshot.json'))
+        self.snapshot_refresher = SnapshotRefresher(self.snapshots, self.precompute_answers,
+                                                    data_manager.data_generation)
+        # Per-class forecasting model, kept fitted between requests (see forecasting.py)
+        self.forecaster = AttendanceForecaster(data_manager.get_attendance_matrix, data_manager.data_generation)
+
+    def process_query(self, query: str, user_role: str = 'hod', session_id: str = None) -> Dict[str, Any]:
+        """Process user query and return appropriate response with enhanced NLP.
 
-    def process_query(self, query: str, user_role: str = 'hod') -> Dict[str, Any]:
-        """Process user query and return appropriate response with enhanced NLP"""
+        Follow-up questions refer to the previous queries of the same
+        session_id; callers without a session share one context.
+        """
+        for event, data in self.stream_query(query, user_role, session_id, streamed=False):
+            pass
+        return data
+
+    def stream_query(self, query: str, user_role: str = 'hod', session_id: str = None,
+                     streamed: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Answer query like process_query, as (event, data) pairs yielded as soon as they are known.
+
+        The last pair is ('complete', response), response being what
+        process_query returns. Before it, an analytics query that is not
+        cached yields a 'headline' with today's attendance, then a
+        'trend_point' per day, newest first, and finally its 'statistics'
+        and 'patterns'. Other queries only yield the 'complete' event.
+        """
         original_query = query
         query = query.lower().strip()
         
         # Update conversation context
-        self.conversation_context['last_query'] = original_query
+        context = self.sessions.context(session_id)
+        context['last_query'] = original_query
         
         # Extract entities from query
-        entities = self._extract_entities(query)
+        entities = self._extract_entities(query, context)
         
         # Determine intent using advanced pattern matching
         intent, confidence = self._identify_intent(query)
@@ -80,19 +132,70 @@ class AttendanceChatbot:
         target_date = entities.get('date', datetime.now().strftime('%Y-%m-%d'))
         
         # Handle follow-up questions using context
-        if self._is_follow_up_question(query):
-            return self._handle_follow_up(query, target_date, user_role)
+        if self._is_follow_up_question(query, context):
+            with metrics.timer('chatbot_handler', 'follow_up', handler='follow_up'):
+                yield 'complete', self._handle_follow_up(query, target_date, user_role, context)
+            return
         
         # Map intent to command
         command = self._intent_to_command(intent)
         
         if command in self.commands:
-            response = self.commands[command](query, target_date, user_role, entities)
+            with metrics.timer('chatbot_handler', command, handler=command):
+                for event, response in self._run_command(command, query, target_date, user_role, entities, streamed):
+                    if event != 'complete':
+                        yield event, response
             # Add intelligent suggestions
             response['suggestions'] = self._generate_suggestions(intent, entities, user_role)
-            return response
+            yield 'complete', response
         else:
-            return self._get_intelligent_response(query, target_date, entities, user_role)
+            with metrics.timer('chatbot_handler', 'fallback', handler='fallback'):
+                yield 'complete', self._get_intelligent_response(query, target_date, entities, user_role)
+
+    def _run_command(self, command: str, query: str, date_str: str, user_role: str, entities: Dict,
+                     streamed: bool) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Answer with the handler of command, from the shared results if it is cached.
+
+        Yields the events of stream_query, ending with ('complete', response);
+        only the analytics handler has others, and only when streamed.
+        """
+        if command not in self.CACHED_COMMANDS:
+            yield 'complete', self.commands[command](query, date_str, user_role, entities)
+            return
+
+        key = self._result_key(command, date_str, entities.get('class'))
+        # Read the generation first, so a write during the computation
+        # leaves a result that the next lookup discards
+        version = data_manager.data_generation()
+        response = self.results.get(key, version)
+        if response is not None:
+            metrics.count('chatbot_cache_hits')
+        else:
+            response = self.snapshots.get(key, version)
+            if response is not None:
+                metrics.count('chatbot_snapshot_hits')
+            else:
+                metrics.count('chatbot_cache_misses')
+                if streamed and command == 'analytics':
+                    for event, response in self._iter_analytics_info(self.ANALYTICS_STREAM_CHUNKS):
+                        if event != 'complete':
+                            yield event, response
+                else:
+                    response = self.commands[command](query, date_str, user_role, entities)
+            self.results.put(key, version, response)
+        # Callers add their own keys to the response; the cached one stays as computed
+        yield 'complete', dict(response)
+
+    @staticmethod
+    def _result_key(command: str, date_str: str, class_name: Optional[str]) -> tuple:
+        """Key of the answer to command in the shared results and the snapshot"""
+        return (command, date_str, class_name, date.today().isoformat())
+
+    def precompute_answers(self) -> Dict[tuple, Dict[str, Any]]:
+        """Today's answers to the CACHED_COMMANDS queries that name no date or class, by _result_key"""
+        today = date.today().isoformat()
+        return {self._result_key(command, today, None): self.commands[command]('', today, 'hod', {})
+                for command in self.CACHED_COMMANDS}
 
     def _extract_date(self, query: str) -> str:
         """Extract date from query string"""
@@ -104,8 +207,7 @@ class AttendanceChatbot:
             return yesterday.strftime('%Y-%m-%d')
         
         # Look for date in YYYY-MM-DD format
-        date_pattern = r'\d{4}-\d{2}-\d{2}'
-        match = re.search(date_pattern, query)
+        match = DATE_PATTERN.search(query)
         if match:
             return match.group()
         
@@ -393,48 +495,65 @@ class AttendanceChatbot:
 
     def _get_analytics_info(self, query: str, date_str: str, user_role: str, entities: Dict = None) -> Dict[str, Any]:
         """Get advanced analytics and trends"""
+        for event, data in self._iter_analytics_info((30,)):
+            pass
+        return data
+
+    def _iter_analytics_info(self, chunks: Tuple[int, ...]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """The analytics of the past 30 days as stream_query events, reading the days chunks at a time, newest first"""
         # Get trend data for the past 30 days
         trend_data = []
-        for i in range(30):
-            check_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            day_summary = data_manager.get_department_attendance_summary(check_date)
-            trend_data.append({
-                'date': check_date,
+        for day_summary in self._iter_recent_daily_totals(chunks):
+            point = {
+                'date': day_summary['date'],
                 'percentage': day_summary['overall_percentage'],
                 'total_students': day_summary['total_students'],
-                'present_students': day_summary['present_students']
-            })
+                'present_students': day_summary['total_present']
+            }
+            if not trend_data:
+                yield 'headline', point
+            trend_data.append(point)
+            yield 'trend_point', point
         
         # Calculate statistics
         percentages = [day['percentage'] for day in trend_data if day['percentage'] > 0]
         avg_attendance = statistics.mean(percentages) if percentages else 0
         best_day = max(trend_data, key=lambda x: x['percentage'])
         worst_day = min(trend_data, key=lambda x: x['percentage'] if x['percentage'] > 0 else 100)
+        analytics_statistics = {
+            'average_attendance': round(avg_attendance, 2),
+            'best_day': best_day,
+            'worst_day': worst_day,
+            'trend_direction': self._calculate_trend_direction(percentages[:7])
+        }
+        yield 'statistics', analytics_statistics
         
         # Identify patterns
         weekday_patterns = self._analyze_weekday_patterns(trend_data)
+        yield 'patterns', weekday_patterns
         
-        return {
+        yield 'complete', {
             'type': 'analytics',
             'date_range': f"{trend_data[-1]['date']} to {trend_data[0]['date']}",
-            'statistics': {
-                'average_attendance': round(avg_attendance, 2),
-                'best_day': best_day,
-                'worst_day': worst_day,
-                'trend_direction': self._calculate_trend_direction(percentages[:7])
-            },
+            'statistics': analytics_statistics,
             'patterns': weekday_patterns,
             'chart_data': trend_data[:14],  # Last 14 days for chart
             'message': "Here's your attendance analytics for the past month"
         }
 
     def _get_predictions_info(self, query: str, date_str: str, user_role: str, entities: Dict = None) -> Dict[str, Any]:
-        """Get attendance predictions using simple algorithms"""
+        """Get attendance predictions from the weekday pattern and trend of the class asked about, or the department"""
+        # The class comes from entities alone, as it does in the result cache key
+        class_name = (entities or {}).get('class')
+        if class_name and analytics_engine.HAS_NUMPY:
+            class_obj = self._find_class_by_name(class_name)
+            response = self._get_class_predictions(class_obj) if class_obj else None
+            if response:
+                return response
+
         # Get historical data for prediction
         historical_data = []
-        for i in range(14):
-            check_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            day_summary = data_manager.get_department_attendance_summary(check_date)
+        for day_summary in self._get_recent_daily_totals(14):
             if day_summary['overall_percentage'] > 0:
                 historical_data.append(day_summary['overall_percentage'])
         
@@ -444,11 +563,20 @@ class AttendanceChatbot:
                 'message': "Not enough historical data for predictions"
             }
         
-        # Simple moving average prediction
         avg_attendance = statistics.mean(historical_data[:7])
         trend = self._calculate_trend_direction(historical_data[:7])
         
-        # Predict next few days
+        forecast = self.forecaster.forecast(7) if analytics_engine.HAS_NUMPY else []
+        if forecast:
+            return {
+                'type': 'predictions',
+                'current_trend': trend,
+                'historical_average': round(avg_attendance, 2),
+                'predictions': self._add_confidence(forecast),
+                'message': "Attendance forecast from the department's weekday pattern and trend"
+            }
+        
+        # Without NumPy: simple moving average prediction
         predictions = []
         base_prediction = avg_attendance
         
@@ -476,16 +604,43 @@ class AttendanceChatbot:
             'message': f"Attendance predictions based on recent {trend} trend"
         }
 
+    def _get_class_predictions(self, class_obj) -> Optional[Dict[str, Any]]:
+        """Forecast of one class from its own weekday pattern and trend, or None without enough of its history"""
+        forecast = self.forecaster.forecast(7, class_obj.class_id)
+        matrix = self._get_recent_attendance_matrix(14)
+        if not forecast or matrix is None or class_obj.class_id not in matrix.class_ids:
+            return None
+        row = matrix.class_ids.index(class_obj.class_id)
+        # Percentages of the days the class was marked, newest first
+        historical_data = [float(percentage) for percentage
+                           in matrix.class_percentages()[row][matrix.class_marked()[row]][::-1]]
+        if len(historical_data) < 3:
+            return None
+        return {
+            'type': 'predictions',
+            'class_name': class_obj.class_name,
+            'current_trend': self._calculate_trend_direction(historical_data[:7]),
+            'historical_average': round(statistics.mean(historical_data[:7]), 2),
+            'predictions': self._add_confidence(forecast),
+            'message': f"Attendance forecast for {class_obj.class_name} from its weekday pattern and trend"
+        }
+
+    @staticmethod
+    def _add_confidence(forecast: List[Dict]) -> List[Dict]:
+        for day in forecast:
+            # Narrower 80% intervals give higher confidence
+            day['confidence'] = round(max(0, 100 - (day['high'] - day['low'])))
+        return forecast
+
     def _get_insights_info(self, query: str, date_str: str, user_role: str, entities: Dict = None) -> Dict[str, Any]:
         """Get intelligent insights about attendance patterns"""
         # Analyze various aspects of attendance data
         insights = []
         
         # Get recent data
+        matrix = self._get_recent_attendance_matrix(14)
         recent_summaries = []
-        for i in range(14):
-            check_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            summary = data_manager.get_department_attendance_summary(check_date)
+        for summary in self._get_recent_daily_totals(14, matrix):
             if summary['overall_percentage'] > 0:
                 recent_summaries.append(summary)
         
@@ -512,7 +667,7 @@ class AttendanceChatbot:
             })
         
         # Identify best performing classes
-        best_classes = self._identify_best_performing_classes(date_str)
+        best_classes = self._identify_best_performing_classes(date_str, matrix)
         if best_classes:
             insights.append({
                 'type': 'info',
@@ -520,6 +675,16 @@ class AttendanceChatbot:
                 'message': f'Classes with highest attendance: {", ".join(best_classes[:3])}'
             })
         
+        # Flag students who keep missing class (needs the attendance matrix)
+        if matrix is not None:
+            absentees = matrix.chronic_absentees()
+            if absentees:
+                insights.append({
+                    'type': 'warning',
+                    'title': 'Chronic Absentees',
+                    'message': f'{len(absentees)} students attended less than 75% of the days marked in the last 14 days'
+                })
+        
         # Check for improvement opportunities
         improvement_tips = self._generate_improvement_tips(recent_summaries)
         insights.extend(improvement_tips)
@@ -535,17 +700,16 @@ class AttendanceChatbot:
     def _get_comparison_info(self, query: str, date_str: str, user_role: str, entities: Dict = None) -> Dict[str, Any]:
         """Get comparative analysis of different aspects"""
         # Compare classes performance
-        all_classes = data_manager.get_all_classes()
+        current_summary = data_manager.get_department_attendance_summary(date_str)
         class_comparisons = []
         
-        for class_obj in all_classes:
-            summary = data_manager.get_class_attendance_summary(class_obj.class_id, date_str)
+        for summary in current_summary['classes']:
             class_comparisons.append({
-                'class_name': class_obj.class_name,
-                'attendance_percentage': summary['attendance_percentage'],
+                'class_name': summary['class_name'],
+                'attendance_percentage': summary['percentage'],
                 'total_students': summary['total_students'],
-                'present_students': summary['present_students'],
-                'late_students': summary['late_students']
+                'present_students': summary['present'],
+                'late_students': summary['late']
             })
         
         # Sort by attendance percentage
@@ -553,7 +717,6 @@ class AttendanceChatbot:
         
         # Week-over-week comparison
         last_week_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        current_summary = data_manager.get_department_attendance_summary(date_str)
         last_week_summary = data_manager.get_department_attendance_summary(last_week_date)
         
         week_comparison = {
@@ -572,7 +735,7 @@ class AttendanceChatbot:
         }
 
     # Enhanced NLP helper methods
-    def _extract_entities(self, query: str) -> Dict[str, Any]:
+    def _extract_entities(self, query: str, context: Dict) -> Dict[str, Any]:
         """Extract entities like dates, class names, student names from query"""
         entities = {}
         
@@ -583,16 +746,16 @@ class AttendanceChatbot:
         class_name = self._extract_class_name(query)
         if class_name:
             entities['class'] = class_name
-            self.conversation_context['last_class'] = class_name
+            context['last_class'] = class_name
         
         # Extract student name/roll
-        student_match = re.search(r'(?:student|for|about)\s+(\w+)', query)
+        student_match = STUDENT_PATTERN.search(query)
         if student_match:
             entities['student'] = student_match.group(1)
-            self.conversation_context['last_student'] = student_match.group(1)
+            context['last_student'] = student_match.group(1)
         
         # Extract numbers
-        numbers = re.findall(r'\d+', query)
+        numbers = NUMBER_PATTERN.findall(query)
         if numbers:
             entities['numbers'] = [int(n) for n in numbers]
         
@@ -600,34 +763,7 @@ class AttendanceChatbot:
 
     def _identify_intent(self, query: str) -> Tuple[str, float]:
         """Identify user intent with confidence score"""
-        max_confidence = 0
-        best_intent = 'attendance'
-        
-        for intent, patterns in self.intent_patterns.items():
-            confidence = 0
-            for pattern in patterns:
-                if re.search(pattern, query, re.IGNORECASE):
-                    confidence = max(confidence, 0.8)
-            
-            # Keyword-based confidence boost
-            intent_keywords = {
-                'attendance_query': ['attendance', 'present', 'absent', 'show'],
-                'latecomer_query': ['late', 'latecomer', 'tardy'],
-                'student_query': ['student', 'info', 'details'],
-                'analytics_query': ['analytics', 'trend', 'pattern', 'chart'],
-                'prediction_query': ['predict', 'forecast', 'future'],
-                'comparison_query': ['compare', 'versus', 'better', 'best']
-            }
-            
-            if intent in intent_keywords:
-                keyword_matches = sum(1 for keyword in intent_keywords[intent] if keyword in query)
-                confidence += keyword_matches * 0.2
-            
-            if confidence > max_confidence:
-                max_confidence = confidence
-                best_intent = intent
-        
-        return best_intent.replace('_query', ''), min(max_confidence, 1.0)
+        return self.intent_classifier.classify(query)
 
     def _intent_to_command(self, intent: str) -> str:
         """Map intent to command"""
@@ -642,12 +778,12 @@ class AttendanceChatbot:
         }
         return intent_command_map.get(intent, 'attendance')
 
-    def _is_follow_up_question(self, query: str) -> bool:
+    def _is_follow_up_question(self, query: str, context: Dict) -> bool:
         """Check if this is a follow-up question"""
         follow_up_indicators = ['what about', 'how about', 'and', 'also', 'more', 'details', 'explain']
-        return any(indicator in query for indicator in follow_up_indicators) and len(self.conversation_context['last_query']) > 0
+        return any(indicator in query for indicator in follow_up_indicators) and len(context['last_query']) > 0
 
-    def _handle_follow_up(self, query: str, date_str: str, user_role: str) -> Dict[str, Any]:
+    def _handle_follow_up(self, query: str, date_str: str, user_role: str, context: Dict) -> Dict[str, Any]:
         """Handle follow-up questions using context"""
         if 'what about' in query or 'how about' in query:
             # Extract the new subject from the follow-up
@@ -656,8 +792,8 @@ class AttendanceChatbot:
                 return self._get_attendance_info(query, date_str, user_role, {'class': new_class})
         
         # Default to previous context
-        if self.conversation_context['last_class']:
-            return self._get_attendance_info(f"attendance for {self.conversation_context['last_class']}", date_str, user_role, {})
+        if context['last_class']:
+            return self._get_attendance_info(f"attendance for {context['last_class']}", date_str, user_role, {})
         
         return self._get_default_response(query, date_str)
 
@@ -699,25 +835,56 @@ class AttendanceChatbot:
         return self._get_default_response(query, date_str)
 
     # Helper methods for analytics
+    def _get_recent_department_summaries(self, days: int, offset: int = 0) -> List[Dict]:
+        """Department summaries for the `days` days ending `offset` days before today, newest first"""
+        end = datetime.now() - timedelta(days=offset)
+        start_date = (end - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        day_summaries = data_manager.get_department_attendance_range(start_date, end.strftime('%Y-%m-%d'))
+        return list(reversed(day_summaries))
+
+    def _get_recent_attendance_matrix(self, days: int, offset: int = 0) -> Optional[analytics_engine.AttendanceMatrix]:
+        """Attendance matrix for the `days` days ending `offset` days before today, or None without NumPy"""
+        end = datetime.now() - timedelta(days=offset)
+        start_date = (end - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        return data_manager.get_attendance_matrix(start_date, end.strftime('%Y-%m-%d'))
+
+    def _get_recent_daily_totals(self, days: int, matrix: analytics_engine.AttendanceMatrix = None,
+                                 offset: int = 0) -> List[Dict]:
+        """Department date, total_students, total_present and overall_percentage per day, newest first"""
+        if matrix is None:
+            matrix = self._get_recent_attendance_matrix(days, offset)
+        if matrix is not None:
+            return list(reversed(matrix.daily_totals()))
+        return self._get_recent_department_summaries(days, offset)
+
+    def _iter_recent_daily_totals(self, chunks: Tuple[int, ...]) -> Iterator[Dict]:
+        """_get_recent_daily_totals of sum(chunks) days, read a chunk of days at a time, newest first"""
+        offset = 0
+        for days in chunks:
+            yield from self._get_recent_daily_totals(days, offset=offset)
+            offset += days
+
     def _analyze_weekday_patterns(self, trend_data: List[Dict]) -> Dict[str, Any]:
         """Analyze attendance patterns by weekday"""
-        weekday_data = {0: [], 1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
-        
-        for day_data in trend_data:
-            try:
-                date_obj = datetime.strptime(day_data['date'], '%Y-%m-%d')
-                weekday = date_obj.weekday()
-                if day_data['percentage'] > 0:
-                    weekday_data[weekday].append(day_data['percentage'])
-            except:
-                continue
-        
-        weekday_averages = {}
-        weekday_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
-        for day, percentages in weekday_data.items():
-            if percentages:
-                weekday_averages[weekday_names[day]] = round(statistics.mean(percentages), 2)
+        if analytics_engine.HAS_NUMPY:
+            weekday_averages = analytics_engine.weekday_averages([day['date'] for day in trend_data],
+                                                                 [day['percentage'] for day in trend_data])
+        else:
+            weekday_data = {0: [], 1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
+            
+            for day_data in trend_data:
+                try:
+                    date_obj = datetime.strptime(day_data['date'], '%Y-%m-%d')
+                    weekday = date_obj.weekday()
+                    if day_data['percentage'] > 0:
+                        weekday_data[weekday].append(day_data['percentage'])
+                except:
+                    continue
+            
+            weekday_averages = {}
+            for day, percentages in weekday_data.items():
+                if percentages:
+                    weekday_averages[analytics_engine.WEEKDAY_NAMES[day]] = round(statistics.mean(percentages), 2)
         
         best_day = max(weekday_averages.items(), key=lambda x: x[1]) if weekday_averages else ('Monday', 0)
         worst_day = min(weekday_averages.items(), key=lambda x: x[1]) if weekday_averages else ('Monday', 0)
@@ -730,6 +897,8 @@ class AttendanceChatbot:
 
     def _calculate_trend_direction(self, recent_percentages: List[float]) -> str:
         """Calculate if attendance is improving, declining, or stable"""
+        if analytics_engine.HAS_NUMPY:
+            return analytics_engine.trend_direction(recent_percentages)
         if len(recent_percentages) < 3:
             return 'stable'
         
@@ -745,23 +914,27 @@ class AttendanceChatbot:
         else:
             return 'stable'
 
-    def _identify_best_performing_classes(self, date_str: str) -> List[str]:
+    def _identify_best_performing_classes(self, date_str: str,
+                                          matrix: analytics_engine.AttendanceMatrix = None) -> List[str]:
         """Identify classes with best attendance"""
-        all_classes = data_manager.get_all_classes()
-        class_performance = []
-        
-        for class_obj in all_classes:
-            summary = data_manager.get_class_attendance_summary(class_obj.class_id, date_str)
-            if summary['attendance_percentage'] > 0:
-                class_performance.append((class_obj.class_name, summary['attendance_percentage']))
-        
-        class_performance.sort(key=lambda x: x[1], reverse=True)
-        return [name for name, _ in class_performance if class_performance[0][1] - _[1] <= 5]  # Top performing within 5%
+        if matrix is not None and date_str in matrix.dates:
+            class_performance = matrix.rank_classes(date_str)
+        else:
+            dept_summary = data_manager.get_department_attendance_summary(date_str)
+            class_performance = []
+            
+            for summary in dept_summary['classes']:
+                if summary['percentage'] > 0:
+                    class_performance.append((summary['class_name'], summary['percentage']))
+            
+            class_performance.sort(key=lambda x: x[1], reverse=True)
+        return [name for name, percentage in class_performance if class_performance[0][1] - percentage <= 5]  # Top performing within 5%
 
     def _generate_improvement_tips(self, recent_summaries: List[Dict]) -> List[Dict]:
         """Generate actionable improvement tips"""
         tips = []
-        avg_attendance = statistics.mean([s['overall_percentage'] for s in recent_summaries])
+        percentages = [s['overall_percentage'] for s in recent_summaries]
+        avg_attendance = statistics.mean(percentages)
         
         if avg_attendance < 85:
             tips.append({
@@ -771,8 +944,7 @@ class AttendanceChatbot:
             })
         
         # Check for consistency
-        percentages = [s['overall_percentage'] for s in recent_summaries]
-        if statistics.stdev(percentages) > 10:
+        if len(percentages) > 1 and statistics.stdev(percentages) > 10:
             tips.append({
                 'type': 'warning',
                 'title': 'Inconsistent Attendance',
@@ -914,21 +1086,15 @@ class AttendanceChatbot:
                     break
         
         if student_query:
-            students = data_manager.search_students(student_query)
+            students = data_manager.search_students(student_query, limit=1)
             if students:
-                student = students[0]  # Take the first match
+                student = students[0]  # Take the best match
                 
                 # Get recent attendance history
                 end_date = datetime.now().strftime('%Y-%m-%d')
                 start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
                 history = data_manager.get_student_attendance_history(student.student_id, start_date, end_date)
-                
-                # Calculate attendance percentage
-                total_days = len(set(record.date for record in history))
-                present_days = len(set(record.date for record in history if record.status == 'present'))
-                percentage = (present_days / total_days * 100) if total_days > 0 else 0
-                
-                late_count = sum(1 for record in history if record.is_late)
+                stats = data_manager.get_student_attendance_stats(student.student_id, start_date, end_date)
                 
                 return {
                     'type': 'student_info',
@@ -938,11 +1104,11 @@ class AttendanceChatbot:
                         'class_id': student.class_id
                     },
                     'stats': {
-                        'attendance_percentage': percentage,
-                        'total_days': total_days,
-                        'present_days': present_days,
-                        'absent_days': total_days - present_days,
-                        'late_count': late_count
+                        'attendance_percentage': stats['percentage'],
+                        'total_days': stats['total_days'],
+                        'present_days': stats['present_days'],
+                        'absent_days': stats['absent_days'],
+                        'late_count': stats['late_count']
                     },
                     'recent_history': [
                         {
@@ -983,11 +1149,9 @@ class AttendanceChatbot:
         
         # Get trend data for the past week
         trend_data = []
-        for i in range(7):
-            check_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            day_summary = data_manager.get_department_attendance_summary(check_date)
+        for day_summary in self._get_recent_department_summaries(7):
             trend_data.append({
-                'date': check_date,
+                'date': day_summary['date'],
                 'percentage': day_summary['overall_percentage']
             })
         
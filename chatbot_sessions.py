@@ -0,0 +1,80 @@
+"""Per-session conversation state and shared results for the chatbot.
+
+Follow-up questions ("what about ...") resolve against the class and student
+of the asker's previous query, so every browser session gets its own
+conversation context. Contexts are kept for the most recently active
+sessions only; an evicted session simply starts a new conversation.
+
+The analytics style answers (trends, predictions, insights, comparisons) do
+not depend on who asks, only on the data and the dates involved. They are
+kept in a cache shared by all sessions and keyed by command, date and
+class. The cache is tied to the data generation: the first lookup after any
+write in any worker empties it.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+def new_context() -> Dict:
+    return {
+        'last_query': '',
+        'last_class': '',
+        'last_student': '',
+        'last_date': '',
+        'preferences': {}
+    }
+
+
+class ChatbotSessions:
+    """Conversation contexts by session id, evicting the least recently used"""
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._contexts = OrderedDict()  # session id -> context, least recently used first
+
+    def context(self, session_id: Hashable) -> Dict:
+        """The context of session_id, started empty for a new session"""
+        with self._lock:
+            context = self._contexts.get(session_id)
+            if context is None:
+                context = self._contexts[session_id] = new_context()
+                if len(self._contexts) > self.max_sessions:
+                    self._contexts.popitem(last=False)
+            else:
+                self._contexts.move_to_end(session_id)
+            return context
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+
+class ChatbotResultCache:
+    """Command results shared by all sessions, valid for one data generation"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.version = None
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # key -> result, least recently used first
+
+    def get(self, key: tuple, version) -> Optional[Dict]:
+        """The result saved under key at version, or None"""
+        with self._lock:
+            if version != self.version:
+                return None
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, key: tuple, version, result: Dict):
+        """Save result under key; results of other versions are dropped"""
+        with self._lock:
+            if version != self.version:
+                self._results.clear()
+                self.version = version
+            self._results[key] = result
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
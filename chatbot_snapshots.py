@@ -0,0 +1,104 @@
+"""Chatbot answers precomputed in the background and shared by all workers.
+
+The analytics style answers (see ChatbotResultCache in chatbot_sessions.py)
+are the same for every caller on a given day. A SnapshotRefresher
+recomputes today's answers whenever the data generation moves on, and
+saves them in one snapshot file tagged with that generation and day. A
+worker that misses its own result cache looks in the snapshot, and falls
+back to computing the answer live when the snapshot is of an older
+generation or day.
+
+The refresher runs in one process of its own, precompute_chatbot.py, so
+the workers neither carry the precompute load nor run it alongside their
+requests. Refreshes are serialized with a file lock all the same, should
+more than one be started.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import date
+from typing import Callable, Dict, Optional
+
+from atomic_io import file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """The snapshot file: answers by cache key, valid for one data generation and day"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat = None  # (mtime_ns, size) of the file the snapshot below was read from
+        self._snapshot = {'version': None, 'day': None, 'results': {}}
+
+    def _current(self) -> Dict:
+        """The saved snapshot, read again only when the file has changed"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self._snapshot
+        stat = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stat != self._stat:
+                with open(self.path) as f:
+                    saved = json.load(f)
+                saved['results'] = {tuple(entry['key']): entry['response'] for entry in saved['results']}
+                self._snapshot, self._stat = saved, stat
+            return self._snapshot
+
+    def is_current(self, version, day: str) -> bool:
+        snapshot = self._current()
+        return snapshot['version'] == version and snapshot['day'] == day
+
+    def get(self, key: tuple, version) -> Optional[Dict]:
+        """The answer saved under key if the snapshot is of version, or None"""
+        snapshot = self._current()
+        if snapshot['version'] != version:
+            return None
+        return snapshot['results'].get(key)
+
+    def save(self, version, day: str, results: Dict[tuple, Dict]):
+        write_json_atomic(self.path, {
+            'version': version,
+            'day': day,
+            'results': [{'key': list(key), 'response': response} for key, response in results.items()]
+        }, indent=None, fsync=False)
+
+
+class SnapshotRefresher:
+    """Keeps a SnapshotStore current by recomputing it when the data generation or the day changes"""
+
+    def __init__(self, store: SnapshotStore, compute: Callable[[], Dict[tuple, Dict]],
+                 current_version: Callable[[], int]):
+        self.store = store
+        self.compute = compute
+        self.current_version = current_version
+
+    def refresh(self) -> bool:
+        """Recompute and save the snapshot if it is stale; returns whether it was"""
+        # Read the generation first, so a write during the computation
+        # leaves a snapshot the next refresh replaces
+        version, day = self.current_version(), date.today().isoformat()
+        if self.store.is_current(version, day):
+            return False
+        with file_lock(self.store.path):
+            # Another worker may have refreshed it while this one waited
+            if self.store.is_current(version, day):
+                return False
+            self.store.save(version, day, self.compute())
+        logger.info("Chatbot snapshot refreshed for generation %s", version)
+        return True
+
+    def run(self, interval: float, stop: threading.Event = None):
+        """Refresh every interval seconds until stop is set"""
+        stop = stop or threading.Event()
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Refreshing the chatbot snapshot failed")
+            if stop.wait(interval):
+                return
@@ -0,0 +1,37 @@
+"""Per-class roster snapshots built from the students table.
+
+Roll-call pages need the students of one class in file order. Rather than
+look the class up in the students table and build Student objects on every
+request, the cache groups the whole table by class once and keeps each
+roster as a tuple of Student objects. The cache is rebuilt only when the
+students table version changes, so a roster lookup costs the same however
+many students the other classes have.
+
+Snapshots are shared between requests, so callers must not modify the
+Student objects they get back.
+"""
+import threading
+from typing import Dict, List, Tuple
+
+from models import Student
+
+
+class ClassRosterCache:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._rosters = {}  # class_id -> tuple of Student, in students table order
+
+    def update(self, rows: List[Dict], version=None):
+        """Replace every snapshot with the rosters of rows"""
+        rosters = {}
+        for row in rows:
+            rosters.setdefault(row['class_id'], []).append(Student.from_dict(row))
+        with self._lock:
+            # Readers holding an old snapshot keep it; new lookups see the new ones
+            self._rosters = {class_id: tuple(students) for class_id, students in rosters.items()}
+            self.version = version
+
+    def roster(self, class_id: str) -> Tuple[Student, ...]:
+        """The students of class_id, or an empty tuple for an unknown class"""
+        return self._rosters.get(class_id, ())
@@ -0,0 +1,56 @@
+"""Rewrite the JSON data files in the pretty or compact format.
+
+Usage:
+    python convert_data_format.py --format compact|pretty [--data-dir data]
+
+Pretty files are indented JSON, as the app has always written them. Compact
+files are minified, which makes them smaller and quicker to save and load.
+The attendance journal is folded in on the way. Both formats are read back,
+so the app may keep running; set ATTENDANCE_DATA_FORMAT to the same format
+for its workers, or their next saves write the format they were started with.
+"""
+import argparse
+import os
+from typing import Dict
+
+from storage import JsonStorage
+
+
+def data_files(data_dir: str) -> Dict[str, int]:
+    """{path: size} of the JSON files in data_dir and its partition directory"""
+    sizes = {}
+    for directory in (data_dir, os.path.join(data_dir, JsonStorage.ATTENDANCE_PARTITION_DIR)):
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith(('.json', '.json.gz')):
+                    path = os.path.join(directory, filename)
+                    sizes[path] = os.path.getsize(path)
+    return sizes
+
+
+def convert(data_dir: str, data_format: str):
+    """Rewrite every table of data_dir, and the attendance rollup, in data_format"""
+    storage = JsonStorage(data_dir, data_format)
+    for table in ('users', 'classes', 'students'):
+        if storage.table_exists(table):
+            storage.modify_table(table, lambda rows: rows)
+    if storage.table_exists('attendance'):
+        storage.compact_attendance_journal(rewrite_all=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='data', help='directory holding the JSON data files')
+    parser.add_argument('--format', required=True, choices=sorted(JsonStorage.DATA_FORMATS))
+    args = parser.parse_args()
+
+    before = data_files(args.data_dir)
+    convert(args.data_dir, args.format)
+    after = data_files(args.data_dir)
+    for path, size in after.items():
+        print(f"{path}: {before.get(path, 0)} -> {size} bytes")
+    print(f"Total: {sum(before.values())} -> {sum(after.values())} bytes")
+
+
+if __name__ == '__main__':
+    main()
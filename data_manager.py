@@ -1,14 +1,25 @@
-import json
 import os
-from typing import Dict, List, Optional
-from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, date, timedelta
 from models import User, Class, Student, AttendanceRecord
+from storage import StorageBackend, create_storage
+from analytics_engine import HAS_NUMPY, AttendanceMatrix
+from student_search import StudentSearchIndex
+from class_rosters import ClassRosterCache
+from user_directory import UserDirectory
+import metrics
 
+# Every public call is timed for the request breakdown and /metrics
+@metrics.timed_methods('datamanager_call', 'call')
 class DataManager:
-    def __init__(self):
+    def __init__(self, storage: StorageBackend = None):
         self.data_dir = 'data'
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
+        self.storage = storage or create_storage(self.data_dir)
+        self.student_search = StudentSearchIndex()
+        self.class_rosters = ClassRosterCache()
+        self.users = UserDirectory()
         
         # Initialize data files if they don't exist
         self._initialize_data_files()
@@ -16,22 +27,19 @@ class DataManager:
     def _initialize_data_files(self):
         """Initialize data files with default data if they don't exist"""
         default_data = {
-            'users.json': self._get_default_users(),
-            'classes.json': self._get_default_classes(),
-            'students.json': [], # Initialize as empty, will be populated from CSV if file doesn't exist
-            'attendance.json': []
+            'users': self._get_default_users(),
+            'classes': self._get_default_classes(),
+            'students': [], # Initialize as empty, will be populated from CSV if file doesn't exist
+            'attendance': []
         }
         
-        for filename, default_content in default_data.items():
-            filepath = os.path.join(self.data_dir, filename)
-            if not os.path.exists(filepath):
-                if filename == 'students.json':
-                    # Save an empty students.json first, then import from CSV
-                    self._save_json(filename, [])
-                    csv_path = os.path.join(os.path.dirname(filepath), '..', 'students.csv') # Assuming students.csv is in the project root
+        for table, default_content in default_data.items():
+            # create_table() lets only one of several starting workers write the defaults
+            if not self.storage.table_exists(table) and self.storage.create_table(table, default_content):
+                if table == 'students':
+                    # The students table starts empty, then is imported from CSV
+                    csv_path = os.path.join(self.data_dir, '..', 'students.csv') # Assuming students.csv is in the project root
                     self.import_students_from_csv(csv_path)
-                else:
-                    self._save_json(filename, default_content)
 
     def _get_default_users(self):
         """Generate default users for the system"""
@@ -189,44 +197,29 @@ class DataManager:
                         'email': email,
                         'phone': phone
                     })
-            self._save_json('students.json', students)
+            self.storage.save_table('students', students)
+            self._get_student_search()
             print(f"Successfully imported {len(students)} students from {csv_filepath}")
         except FileNotFoundError:
             print(f"Error: CSV file not found at {csv_filepath}")
         except Exception as e:
             print(f"Error importing students from CSV: {e}")
 
-    def _load_json(self, filename: str) -> List[Dict]:
-        """Load data from JSON file"""
-        filepath = os.path.join(self.data_dir, filename)
-        try:
-            with open(filepath, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
-    def _save_json(self, filename: str, data: List[Dict]):
-        """Save data to JSON file"""
-        filepath = os.path.join(self.data_dir, filename)
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-
     # User management methods
+    def _get_users(self) -> UserDirectory:
+        """Get the user directory, rebuilding it if users.json was saved since"""
+        version = self.storage.table_version('users')
+        if self.users.version != version:
+            self.users.update(self.storage.load_table('users'), version)
+        return self.users
+
     def get_user_by_username(self, username: str) -> Optional[User]:
-        """Get user by username"""
-        users_data = self._load_json('users.json')
-        for user_data in users_data:
-            if user_data['username'] == username:
-                return User.from_dict(user_data)
-        return None
+        """Get user by username, as a shared object that must not be modified"""
+        return self._get_users().by_username(username)
 
     def get_user_by_id(self, user_id: str) -> Optional[User]:
-        """Get user by user_id"""
-        users_data = self._load_json('users.json')
-        for user_data in users_data:
-            if user_data['user_id'] == user_id:
-                return User.from_dict(user_data)
-        return None
+        """Get user by user_id, as a shared object that must not be modified"""
+        return self._get_users().by_id(user_id)
 
     def get_user_name_by_id(self, user_id: str) -> str:
         """Get user name by user_id"""
@@ -236,16 +229,13 @@ class DataManager:
     # Class management methods
     def get_all_classes(self) -> List[Class]:
         """Get all classes"""
-        classes_data = self._load_json('classes.json')
+        classes_data = self.storage.load_table('classes')
         return [Class.from_dict(class_data) for class_data in classes_data]
 
     def get_class_by_id(self, class_id: str) -> Optional[Class]:
         """Get class by class_id"""
-        classes_data = self._load_json('classes.json')
-        for class_data in classes_data:
-            if class_data['class_id'] == class_id:
-                return Class.from_dict(class_data)
-        return None
+        class_data = self.storage.lookup('classes', 'class_id', class_id)
+        return Class.from_dict(class_data) if class_data else None
 
     def get_classes_by_ids(self, class_ids: List[str]) -> List[Class]:
         """Get multiple classes by their IDs"""
@@ -253,103 +243,73 @@ class DataManager:
         return [cls for cls in all_classes if cls.class_id in class_ids]
 
     # Student management methods
-    def get_students_by_class(self, class_id: str) -> List[Student]:
-        """Get all students in a class"""
-        students_data = self._load_json('students.json')
-        return [Student.from_dict(student_data) for student_data in students_data 
-                if student_data['class_id'] == class_id]
+    def _get_class_rosters(self) -> ClassRosterCache:
+        """Get the class roster snapshots, rebuilding them if students.json was saved since"""
+        version = self.storage.table_version('students')
+        if self.class_rosters.version != version:
+            self.class_rosters.update(self.storage.load_table('students'), version)
+        return self.class_rosters
+
+    def get_students_by_class(self, class_id: str) -> Tuple[Student, ...]:
+        """Get all students in a class, as a shared snapshot that must not be modified"""
+        return self._get_class_rosters().roster(class_id)
 
     def get_student_by_id(self, student_id: str) -> Optional[Student]:
         """Get student by student_id"""
-        students_data = self._load_json('students.json')
-        for student_data in students_data:
-            if student_data['student_id'] == student_id:
-                return Student.from_dict(student_data)
-        return None
-
-    def search_students(self, query: str) -> List[Student]:
-        """Search students by name or roll number"""
-        students_data = self._load_json('students.json')
-        query = query.lower()
-        results = []
-        for student_data in students_data:
-            if (query in student_data['name'].lower() or 
-                query in student_data['roll_number'].lower()):
-                results.append(Student.from_dict(student_data))
-        return results
+        student_data = self.storage.lookup('students', 'student_id', student_id)
+        return Student.from_dict(student_data) if student_data else None
+
+    def _get_student_search(self) -> StudentSearchIndex:
+        """Get the student search index, catching it up with students.json if the table was saved since"""
+        version = self.storage.table_version('students')
+        if self.student_search.version != version:
+            self.student_search.update(self.storage.load_table('students'), version)
+        return self.student_search
+
+    def search_students(self, query: str, limit: int = None) -> List[Student]:
+        """Search students by name or roll number, best match first"""
+        return [Student.from_dict(student_data) for student_data in self._get_student_search().search(query, limit)]
+
+    def data_generation(self) -> int:
+        """Counter bumped by every write in any worker; caches of derived data compare it to revalidate"""
+        return self.storage.data_generation()
 
     # Attendance management methods
     def save_attendance_records(self, records: List[AttendanceRecord]):
         """Save attendance records"""
-        attendance_data = self._load_json('attendance.json')
-        for record in records:
-            attendance_data.append(record.to_dict())
-        self._save_json('attendance.json', attendance_data)
+        self.storage.add_attendance([record.to_dict() for record in records])
 
     def get_attendance_records(self, class_id: str = None, date_str: str = None, 
                              attendance_type: str = None, period: int = None) -> List[AttendanceRecord]:
         """Get attendance records with optional filters"""
-        attendance_data = self._load_json('attendance.json')
-        records = []
-        for record_data in attendance_data:
-            record = AttendanceRecord.from_dict(record_data)
-            if class_id and record.class_id != class_id:
-                continue
-            if date_str and record.date != date_str:
-                continue
-            
-            # Filter by attendance_type and period if specified
-            if attendance_type:
-                if record.attendance_type != attendance_type:
-                    continue
-                if attendance_type == 'period' and period and record.period != period:
-                    continue
-                elif attendance_type == 'day' and record.period != 1: # Day attendance is Period 1
-                    continue
-            
-            records.append(record)
-        return records
+        attendance_data = self.storage.find_attendance(class_id, date_str, attendance_type, period)
+        metrics.count('records_materialized', len(attendance_data))
+        return [AttendanceRecord.from_dict(record_data) for record_data in attendance_data]
 
     def is_attendance_locked(self, class_id: str, date_str: str, attendance_type: str, period: int = None) -> bool:
         """Check if attendance is locked for a specific class, date, and type"""
-        records = self.get_attendance_records(class_id, date_str, attendance_type)
-        if attendance_type == 'period' and period:
-            records = [r for r in records if r.period == period]
-        return any(r.locked for r in records)
+        return self.storage.is_attendance_locked(class_id, date_str, attendance_type, period)
 
     def lock_attendance(self, class_id: str, date_str: str, attendance_type: str, period: int = None):
         """Lock attendance for a specific class, date, and type"""
-        attendance_data = self._load_json('attendance.json')
-        for record_data in attendance_data:
-            if (record_data['class_id'] == class_id and 
-                record_data['date'] == date_str and 
-                record_data['attendance_type'] == attendance_type):
-                if attendance_type == 'period' and period and record_data.get('period') != period:
-                    continue
-                record_data['locked'] = True
-        self._save_json('attendance.json', attendance_data)
+        self.storage.lock_attendance(class_id, date_str, attendance_type, period)
+
+    def lock_attendance_many(self, keys: List[tuple]):
+        """Lock several (class_id, date, attendance_type, period) roll calls in one write"""
+        self.storage.lock_attendance_many(keys)
 
     def update_attendance_record(self, record_id: str, updates: Dict):
         """Update an existing attendance record"""
-        attendance_data = self._load_json('attendance.json')
-        for i, record_data in enumerate(attendance_data):
-            if record_data['record_id'] == record_id:
-                attendance_data[i].update(updates)
-                break
-        self._save_json('attendance.json', attendance_data)
+        self.storage.update_attendance(record_id, updates)
 
-    def get_class_attendance_summary(self, class_id: str, date_str: str, attendance_type: str = 'day', period: int = None) -> Dict:
-        """Get attendance summary for a class on a specific date"""
-        records = self.get_attendance_records(class_id, date_str, attendance_type)
-        if attendance_type == 'period' and period:
-            records = [r for r in records if r.period == period]
-        elif attendance_type == 'day':
-            records = [r for r in records if r.period == 1] # Day attendance is first period
-            
-        students = self.get_students_by_class(class_id)
-        
+    def update_attendance_records(self, updates: Dict[str, Dict]):
+        """Update several attendance records, given as {record_id: updates}, in one write"""
+        self.storage.update_attendance_many(updates)
+
+    def _build_class_summary(self, total_students: int, counts: Optional[Dict], user_names: Dict = None) -> Dict:
+        """Turn a storage roll call summary into the dict shown on dashboards and reports"""
         summary = {
-            'total_students': len(students),
+            'total_students': total_students,
             'present': 0,
             'absent': 0,
             'late': 0,
@@ -358,47 +318,45 @@ class DataManager:
             'marked_by_user': 'N/A' # Initialize
         }
         
-        if records:
-            present_students = set()
-            late_students = set()
-            
-            for record in records:
-                if record.status == 'present':
-                    present_students.add(record.student_id)
-                    if record.is_late:
-                        late_students.add(record.student_id)
-                summary['locked'] = summary['locked'] or record.locked
-            
-            summary['present'] = len(present_students)
-            summary['late'] = len(late_students)
+        if counts and counts['records']:
+            summary['present'] = counts['present']
+            summary['late'] = counts['late']
+            summary['locked'] = counts['locked']
             summary['absent'] = summary['total_students'] - summary['present']
             summary['percentage'] = (summary['present'] / summary['total_students']) * 100 if summary['total_students'] > 0 else 0
             
             # Get the user who marked the attendance (assuming one user marks per class/period)
-            if records: # Check if records exist before trying to access first element
-                summary['marked_by_user'] = self.get_user_name_by_id(records[0].marked_by)
+            if user_names is None:
+                summary['marked_by_user'] = self.get_user_name_by_id(counts['marked_by'])
+            else:
+                if counts['marked_by'] not in user_names:
+                    user_names[counts['marked_by']] = self.get_user_name_by_id(counts['marked_by'])
+                summary['marked_by_user'] = user_names[counts['marked_by']]
         
         return summary
 
+    def get_class_attendance_summary(self, class_id: str, date_str: str, attendance_type: str = 'day', period: int = None) -> Dict:
+        """Get attendance summary for a class on a specific date"""
+        counts = self.storage.summarize_attendance(class_id, date_str, attendance_type, period)
+        total_students = len(self.get_students_by_class(class_id))
+        return self._build_class_summary(total_students, counts)
+
     def get_student_attendance_history(self, student_id: str, start_date: str = None, end_date: str = None) -> List[AttendanceRecord]:
         """Get attendance history for a specific student"""
-        attendance_data = self._load_json('attendance.json')
-        records = []
-        
-        for record_data in attendance_data:
-            if record_data.get('student_id') == student_id:
-                record_date = record_data['date']
-                if start_date and record_date < start_date:
-                    continue
-                if end_date and record_date > end_date:
-                    continue
-                records.append(AttendanceRecord.from_dict(record_data))
-        
-        return sorted(records, key=lambda x: x.date, reverse=True)
+        attendance_data = self.storage.find_student_attendance(student_id, start_date, end_date)
+        metrics.count('records_materialized', len(attendance_data))
+        return [AttendanceRecord.from_dict(record_data) for record_data in attendance_data]
 
-    def get_department_attendance_summary(self, date_str: str, attendance_type: str = 'day', period: int = None) -> Dict:
-        """Get attendance summary for all classes in the department"""
-        all_classes = self.get_all_classes()
+    def get_student_attendance_stats(self, student_id: str, start_date: str = None, end_date: str = None) -> Dict:
+        """Get a student's attendance totals for a date range without loading the records"""
+        stats = self.storage.student_attendance_stats(student_id, start_date, end_date)
+        stats['absent_days'] = stats['total_days'] - stats['present_days']
+        stats['percentage'] = (stats['present_days'] / stats['total_days'] * 100) if stats['total_days'] > 0 else 0
+        return stats
+
+    def _build_department_summary(self, all_classes: List[Class], class_counts: Dict, student_counts: Dict,
+                                  user_names: Dict) -> Dict:
+        """Assemble a department summary from per-class roll call summaries"""
         summary = {
             'classes': [],
             'total_students': 0,
@@ -407,7 +365,8 @@ class DataManager:
         }
         
         for class_obj in all_classes:
-            class_summary = self.get_class_attendance_summary(class_obj.class_id, date_str, attendance_type, period)
+            class_summary = self._build_class_summary(student_counts.get(class_obj.class_id, 0),
+                                                      class_counts.get(class_obj.class_id), user_names)
             class_summary['class_name'] = class_obj.class_name
             class_summary['class_id'] = class_obj.class_id
             summary['classes'].append(class_summary)
@@ -419,5 +378,48 @@ class DataManager:
         
         return summary
 
+    def get_department_attendance_summary(self, date_str: str, attendance_type: str = 'day', period: int = None) -> Dict:
+        """Get attendance summary for all classes in the department.
+
+        Every class is summarized from a single pass over the date's attendance
+        rows, with per-class student counts and marker names looked up once.
+        """
+        class_counts = self.storage.summarize_attendance_by_class(date_str, attendance_type, period)
+        return self._build_department_summary(self.get_all_classes(), class_counts,
+                                              self.storage.count_rows_by('students', 'class_id'), {})
+
+    def get_department_attendance_range(self, start_date: str, end_date: str, attendance_type: str = 'day',
+                                        period: int = None) -> List[Dict]:
+        """Get department summaries for every day from start_date to end_date inclusive, oldest first.
+
+        Each entry has the shape of get_department_attendance_summary plus its
+        'date'. The whole range is read in one storage query, so the cost grows
+        with the records in the range rather than with days times classes.
+        """
+        counts_by_date = self.storage.summarize_attendance_range(start_date, end_date, attendance_type, period)
+        all_classes = self.get_all_classes()
+        student_counts = self.storage.count_rows_by('students', 'class_id')
+        user_names = {}
+
+        days = []
+        day = datetime.strptime(start_date, '%Y-%m-%d')
+        last_day = datetime.strptime(end_date, '%Y-%m-%d')
+        while day <= last_day:
+            date_str = day.strftime('%Y-%m-%d')
+            summary = self._build_department_summary(all_classes, counts_by_date.get(date_str, {}),
+                                                     student_counts, user_names)
+            summary['date'] = date_str
+            days.append(summary)
+            day += timedelta(days=1)
+        return days
+
+    def get_attendance_matrix(self, start_date: str, end_date: str) -> Optional[AttendanceMatrix]:
+        """Get the attendance from start_date to end_date as an AttendanceMatrix, or None without NumPy"""
+        if not HAS_NUMPY:
+            return None
+        return AttendanceMatrix.build(self.storage.find_attendance_between(start_date, end_date),
+                                      self.get_all_classes(), self.storage.count_rows_by('students', 'class_id'),
+                                      start_date, end_date)
+
 # Global instance
 data_manager = DataManager()
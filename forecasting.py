@@ -0,0 +1,241 @@
+"""Weekday-seasonal attendance forecasts for every class and the department.
+
+The daily attendance percentage of each class, and of the department as a
+whole, is modelled as a level, a linear trend and an offset per weekday:
+
+    percentage = level + trend * weeks + offset[weekday]
+
+fitted by weighted least squares. Weights halve every HALF_LIFE_DAYS into
+the past, so recent weeks count most. A small ridge penalty keeps the fit
+solvable for weekdays with little or no attendance: their offsets stay
+near 0 instead of being undetermined. Days a series was not marked are
+left out of its fit; the department series counts the classes that
+marked. It is fitted as a series of its own, rather than as a sum of
+class forecasts, so that its error bands reflect how much the class
+errors cancel out.
+
+The fit only needs the weighted sums X'WX, X'Wy and y'Wy of each series,
+kept as series x 9 x 9, series x 9 and series arrays. All series are
+then solved in one batched matrix inversion, and taking a day back out or
+putting it in again is one more einsum over that day's terms.
+
+AttendanceForecaster keeps the fitted model of every series between
+requests, and forecasts the department or one class from it. It refits
+from HISTORY_DAYS of attendance once a day. Whenever the data generation
+moves on in between, it re-reads the last REFRESH_DAYS days only, which is
+where newly marked and locked attendance lands, and swaps their terms in
+the sums. An edit to an older day is picked up by the next day's refit.
+
+Needs NumPy; the chatbot keeps its moving average predictions when
+analytics_engine.HAS_NUMPY is False.
+"""
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from analytics_engine import AttendanceMatrix, np
+
+HISTORY_DAYS = 84
+REFRESH_DAYS = 7
+HALF_LIFE_DAYS = 28.0
+# Series need this many marked days in the history to be forecast
+MIN_DAYS = 5
+# level, trend (per week), then one offset per weekday, Monday first
+PARAMETERS = 9
+# Penalty on each parameter, in units of one full-weight day
+RIDGE = (1e-6, 1.0) + (0.5,) * 7
+# z of a two-sided 80% interval
+INTERVAL_Z = 1.2816
+
+
+def design(day_numbers, origin: int):
+    """The model's inputs for each of day_numbers (date ordinals), as a days x PARAMETERS array"""
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    x = np.zeros((len(day_numbers), PARAMETERS))
+    x[:, 0] = 1
+    x[:, 1] = (day_numbers - origin) / 7
+    # date.fromordinal(1) is a Monday
+    x[np.arange(len(day_numbers)), 2 + (day_numbers - 1) % 7] = 1
+    return x
+
+
+def attendance_series(matrix: AttendanceMatrix):
+    """Percentages and marked flags (series x dates) of each class, then of the department"""
+    marked = matrix.class_marked()
+    present = matrix.class_present_counts()
+    marked_sizes = (matrix.class_sizes[:, None] * marked).sum(axis=0)
+    department = np.divide(present.sum(axis=0), marked_sizes, out=np.zeros(len(matrix.dates)),
+                           where=marked_sizes > 0) * 100
+    return (np.vstack([matrix.class_percentages(), department]),
+            np.vstack([marked, marked_sizes > 0]))
+
+
+class SeasonalTrendModel:
+    """Level, trend and weekday offsets of every series, fitted from weighted sums.
+
+    origin is the ordinal of the newest day of the history: the weights and
+    the trend are measured back from it. Attendance is given as series x
+    days arrays of percentages and of whether the series was marked.
+    """
+
+    def __init__(self, series_count: int, origin: int, half_life_days: float = HALF_LIFE_DAYS):
+        self.origin = origin
+        self.half_life_days = half_life_days
+        self.xtwx = np.zeros((series_count, PARAMETERS, PARAMETERS))
+        self.xtwy = np.zeros((series_count, PARAMETERS))
+        self.ytwy = np.zeros(series_count)
+        self.weight = np.zeros(series_count)
+        self.days = np.zeros(series_count, dtype=np.int64)
+        self.coefficients = np.zeros((series_count, PARAMETERS))
+        self.residual_std = np.zeros(series_count)
+        self._inverse = np.zeros((series_count, PARAMETERS, PARAMETERS))
+
+    def add(self, day_numbers, percentages, marked, sign: int = 1):
+        """Add the terms of these days to the sums, or take them out with sign=-1"""
+        x = design(day_numbers, self.origin)
+        ages = self.origin - np.asarray(day_numbers, dtype=np.int64)
+        w = np.where(marked, 0.5 ** (ages / self.half_life_days), 0.0)
+        y = np.where(marked, percentages, 0.0)
+        self.xtwx += sign * np.einsum('cd,dp,dq->cpq', w, x, x)
+        self.xtwy += sign * np.einsum('cd,cd,dp->cp', w, y, x)
+        self.ytwy += sign * (w * y * y).sum(axis=1)
+        self.weight += sign * w.sum(axis=1)
+        self.days += sign * np.asarray(marked).sum(axis=1)
+
+    def solve(self):
+        """Fit every series from the current sums"""
+        a = self.xtwx + np.diag(RIDGE)
+        self._inverse = np.linalg.inv(a)
+        self.coefficients = np.einsum('cpq,cq->cp', self._inverse, self.xtwy)
+        # Weighted residual sum of squares, from the sums alone
+        sse = (self.ytwy - 2 * np.einsum('cp,cp->c', self.coefficients, self.xtwy)
+               + np.einsum('cp,cpq,cq->c', self.coefficients, self.xtwx, self.coefficients))
+        variance = np.divide(np.maximum(sse, 0), self.weight, out=np.zeros(len(sse)), where=self.weight > 0)
+        # A level, a trend and the offset of the day are estimated per series
+        variance *= self.days / np.maximum(self.days - 3, 1)
+        self.residual_std = np.sqrt(variance)
+
+    def fitted(self):
+        """Which series have enough marked days to forecast"""
+        return self.days >= MIN_DAYS
+
+    def predict(self, day_numbers):
+        """Predicted percentages and their standard errors, both series x days"""
+        x = design(day_numbers, self.origin)
+        mean = np.clip(self.coefficients @ x.T, 0, 100)
+        leverage = np.einsum('dp,cpq,dq->cd', x, self._inverse, x)
+        return mean, self.residual_std[:, None] * np.sqrt(1 + leverage)
+
+
+def marked_weekdays(day_numbers, marked) -> List[int]:
+    """The weekdays on which any series was marked"""
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    return sorted({int(day) for day in (day_numbers[np.asarray(marked).any(axis=0)] - 1) % 7})
+
+
+def series_forecast(model: SeasonalTrendModel, series: int, day_numbers) -> List[Dict]:
+    """The forecast of one series for each of day_numbers, or [] if it has too little history"""
+    if not model.fitted()[series]:
+        return []
+    mean, std = model.predict(day_numbers)
+    mean, std = mean[series], std[series]
+    low = np.clip(mean - INTERVAL_Z * std, 0, 100)
+    high = np.clip(mean + INTERVAL_Z * std, 0, 100)
+    return [{
+        'date': date.fromordinal(int(day)).isoformat(),
+        'predicted_attendance': round(float(mean[i]), 1),
+        'low': round(float(low[i]), 1),
+        'high': round(float(high[i]), 1)
+    } for i, day in enumerate(day_numbers)]
+
+
+def department_forecast(model: SeasonalTrendModel, day_numbers) -> List[Dict]:
+    """The forecast of the department series, the last one, for each of day_numbers"""
+    return series_forecast(model, -1, day_numbers)
+
+
+class AttendanceForecaster:
+    """Class and department forecasts from a SeasonalTrendModel kept current between requests"""
+
+    def __init__(self, load_matrix: Callable[[str, str], Optional[AttendanceMatrix]],
+                 current_version: Callable[[], int]):
+        self.load_matrix = load_matrix
+        self.current_version = current_version
+        self._lock = threading.Lock()
+        self.model = None
+        self.version = None
+        self._class_ids = None
+        self._school_weekdays = []
+        # The last REFRESH_DAYS days as last added to the model
+        self._recent = None  # (day_numbers, percentages, marked)
+
+    def forecast(self, days: int = 7, class_id: str = None) -> List[Dict]:
+        """The forecast of class_id, else of the department, for the next `days` school days.
+
+        [] without enough history, or for a class the model does not know.
+        """
+        with self._lock:
+            self._update()
+            if self.model is None or not self._school_weekdays:
+                return []
+            series = -1
+            if class_id is not None:
+                if class_id not in self._class_ids:
+                    return []
+                series = self._class_ids.index(class_id)
+            upcoming = []
+            day = self.model.origin
+            while len(upcoming) < days:
+                day += 1
+                if (day - 1) % 7 in self._school_weekdays:
+                    upcoming.append(day)
+            return series_forecast(self.model, series, upcoming)
+
+    def _update(self):
+        today = date.today()
+        version = self.current_version()
+        if self.model is not None and self.model.origin == today.toordinal():
+            if version == self.version:
+                return
+            if self._refresh(today):
+                self.version = version
+                return
+        self._fit(today)
+        self.version = version
+
+    def _observations(self, start: date, end: date):
+        matrix = self.load_matrix(start.isoformat(), end.isoformat())
+        if matrix is None:
+            return None
+        day_numbers = np.arange(start.toordinal(), end.toordinal() + 1)
+        return (matrix, day_numbers) + attendance_series(matrix)
+
+    def _fit(self, today: date):
+        """Fit the model from the whole history"""
+        observations = self._observations(today - timedelta(days=HISTORY_DAYS - 1), today)
+        if observations is None:
+            self.model = None
+            return
+        matrix, day_numbers, percentages, marked = observations
+        self.model = SeasonalTrendModel(len(percentages), today.toordinal())
+        self.model.add(day_numbers, percentages, marked)
+        self.model.solve()
+        self._class_ids = matrix.class_ids
+        self._school_weekdays = marked_weekdays(day_numbers, marked)
+        self._recent = (day_numbers[-REFRESH_DAYS:], percentages[:, -REFRESH_DAYS:], marked[:, -REFRESH_DAYS:])
+
+    def _refresh(self, today: date) -> bool:
+        """Swap the terms of the last REFRESH_DAYS days for their current attendance; False if a refit is needed"""
+        observations = self._observations(today - timedelta(days=REFRESH_DAYS - 1), today)
+        if observations is None:
+            return False
+        matrix, day_numbers, percentages, marked = observations
+        # The series of the model are those of the classes of the last fit
+        if matrix.class_ids != self._class_ids:
+            return False
+        self.model.add(*self._recent, sign=-1)
+        self.model.add(day_numbers, percentages, marked)
+        self.model.solve()
+        self._school_weekdays = sorted(set(self._school_weekdays) | set(marked_weekdays(day_numbers, marked)))
+        self._recent = (day_numbers, percentages, marked)
+        return True
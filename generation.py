@@ -0,0 +1,47 @@
+"""Data generation counter shared by every worker process.
+
+The counter is a 64-bit integer in a small file that each process maps
+into memory. Storage backends bump it after every write, so a worker can
+tell whether anything changed since it last validated its caches with one
+memory read instead of stat calls or file parses.
+"""
+import fcntl
+import mmap
+import os
+import struct
+
+COUNTER = struct.Struct('<Q')
+
+
+class GenerationCounter:
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < COUNTER.size:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_size < COUNTER.size:
+                    os.ftruncate(fd, COUNTER.size)
+                # mmap keeps a duplicate of fd open, which would hold the lock
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            # A shared mapping stays shared with the processes forked from
+            # this one, so gunicorn --preload workers see each other's bumps
+            self._map = mmap.mmap(fd, COUNTER.size)
+        finally:
+            os.close(fd)
+
+    def value(self) -> int:
+        return COUNTER.unpack_from(self._map)[0]
+
+    def bump(self) -> int:
+        """Advance the counter after a write; returns the new value"""
+        # Open the file again for every bump: forked workers share inherited
+        # descriptors, and an flock on a shared descriptor excludes nobody
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            value = self.value() + 1
+            COUNTER.pack_into(self._map, 0, value)
+            return value
+        finally:
+            os.close(fd)
@@ -0,0 +1,183 @@
+"""Request metrics for the hot paths, in the Prometheus text format.
+
+Counters and timers are kept in one registry per process and served by the
+admin /metrics endpoint. Every gunicorn worker has its own registry, so a
+scrape reports the worker that answered it; the series are counters and
+summaries, which add up across workers.
+
+While a request is being served, the same updates also go to a breakdown of
+that request alone (see start_request()), which routes.py sends back in the
+Server-Timing header and logs at DEBUG. Outside a request only the registry
+is updated.
+
+Recording a value costs a context variable lookup and a couple of dict
+updates under a lock, so the instrumentation stays on in production. Timers
+are inclusive: a DataManager call that makes other DataManager calls counts
+their time too.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+PREFIX = 'attendance_'
+
+
+class RequestMetrics:
+    """What one request spent, by timer and counter"""
+    __slots__ = ('started', 'counters', 'timers')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counters = {}  # name -> value
+        self.timers = {}  # name -> [calls, seconds]
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """The breakdown as a Server-Timing header value"""
+        entries = [f'total;dur={self.elapsed() * 1000:.2f}']
+        for name, (calls, seconds) in self.timers.items():
+            entries.append(f'{name};dur={seconds * 1000:.2f};desc="{calls} calls"')
+        for name, value in self.counters.items():
+            entries.append(f'{name};desc="{value}"')
+        return ', '.join(entries)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._summaries = {}  # (name, labels) -> [count, sum]
+
+    def increment(self, name: str, value: float = 1, labels: tuple = ()):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        key = (name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted(self._summaries.items())
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f'{PREFIX}{name}_total'
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_format_labels(labels)} {value}')
+        for (name, labels), (count, total) in summaries:
+            metric = f'{PREFIX}{name}'
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f'# TYPE {metric} summary')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = MetricsRegistry()
+_current_request = contextvars.ContextVar('request_metrics', default=None)
+
+
+def start_request() -> RequestMetrics:
+    """Start collecting the breakdown of the request being served"""
+    request_metrics = RequestMetrics()
+    _current_request.set(request_metrics)
+    return request_metrics
+
+
+def finish_request(endpoint: str, status: int) -> Optional[RequestMetrics]:
+    """Record the request in the registry and stop collecting its breakdown"""
+    request_metrics = _current_request.get()
+    _current_request.set(None)
+    if request_metrics is None:
+        return None
+    labels = (('endpoint', endpoint or 'unknown'),)
+    REGISTRY.observe('request_seconds', request_metrics.elapsed(), labels)
+    REGISTRY.increment('responses', 1, labels + (('status', status),))
+    return request_metrics
+
+
+def count(name: str, value: float = 1, **labels):
+    """Add value to the counter name, labelled with labels"""
+    REGISTRY.increment(name, value, tuple(labels.items()))
+    request_metrics = _current_request.get()
+    if request_metrics is not None:
+        request_metrics.counters[name] = request_metrics.counters.get(name, 0) + value
+
+
+def observe_time(name: str, seconds: float, label: str = None, **labels):
+    """Record seconds spent in the timer name; label tells calls apart in the request breakdown"""
+    _observe_time(f'{name}_seconds', tuple(labels.items()), f'{name}.{label}' if label else name, seconds)
+
+
+def _observe_time(metric: str, labels: tuple, key: str, seconds: float):
+    REGISTRY.observe(metric, seconds, labels)
+    request_metrics = _current_request.get()
+    if request_metrics is not None:
+        timer = request_metrics.timers.get(key)
+        if timer is None:
+            request_metrics.timers[key] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+
+@contextmanager
+def timer(name: str, label: str = None, **labels):
+    """Time the block as one call of the timer name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_time(name, time.perf_counter() - started, label, **labels)
+
+
+def timed_methods(name: str, label: str) -> Callable[[type], type]:
+    """Class decorator timing every public method under the timer name, labelled label=<method name>"""
+    def decorate(cls: type) -> type:
+        for attribute, method in list(vars(cls).items()):
+            if attribute.startswith('_') or not callable(method):
+                continue
+            setattr(cls, attribute, _timed_method(method, name, label))
+        return cls
+    return decorate
+
+
+def _timed_method(method: Callable, name: str, label: str) -> Callable:
+    metric, labels, key = f'{name}_seconds', ((label, method.__name__),), f'{name}.{method.__name__}'
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _observe_time(metric, labels, key, time.perf_counter() - started)
+    return wrapper
@@ -0,0 +1,43 @@
+"""One-shot import of the JSON data files into the SQLite backend.
+
+Usage:
+    python migrate_to_sqlite.py [--data-dir data] [--db data/attendance.db]
+
+Existing rows in the database are replaced. Afterwards start the app with
+ATTENDANCE_STORAGE=sqlite to serve from the database.
+"""
+import argparse
+import os
+from typing import Dict
+
+from storage import JsonStorage
+from sqlite_storage import SqliteStorage
+
+
+def migrate(data_dir: str, db_path: str) -> Dict[str, int]:
+    """Copy every table from data_dir into the database and return the row counts"""
+    source = JsonStorage(data_dir)
+    target = SqliteStorage(db_path)
+    counts = {}
+    for table in ('users', 'classes', 'students', 'attendance'):
+        # find_attendance() with no filters includes the journal on top of attendance.json
+        rows = source.find_attendance() if table == 'attendance' else source.load_table(table)
+        target.save_table(table, rows)
+        counts[table] = len(rows)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='data', help='directory holding the JSON data files')
+    parser.add_argument('--db', help='SQLite database to create or replace (default: <data-dir>/attendance.db)')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.data_dir, 'attendance.db')
+    counts = migrate(args.data_dir, db_path)
+    for table, count in counts.items():
+        print(f"Imported {count} {table} rows into {db_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,11 @@ from datetime import datetime, date
 from typing import Dict, List, Optional
 import json
 import os
+import sys
+
+# created_at default of AttendanceRecord: the current time. from_dict only
+# falls back to it for rows without the key; a stored null stays None
+_NOW = object()
 
 class User:
     def __init__(self, user_id: str, username: str, password: str, role: str, name: str, assigned_classes: List[str] = None):
@@ -73,22 +78,28 @@ class Student:
         return cls(**data)
 
 class AttendanceRecord:
+    # Full attendance history can be materialized at once, so records carry no
+    # per-instance __dict__ and share one copy of their repeated strings
+    __slots__ = ('record_id', 'class_id', 'date', 'attendance_type', 'period', 'student_id', 'status',
+                 'is_late', 'marked_by', 'locked', 'submitted_as_type', 'created_at')
+
     def __init__(self, record_id: str, class_id: str, date: str, attendance_type: str, 
                  period: int = None, student_id: str = "", status: str = "", 
                  is_late: bool = False, marked_by: str = "", locked: bool = False,
-                 submitted_as_type: str = "period"): # New parameter
+                 submitted_as_type: str = "period", # New parameter
+                 created_at: Optional[str] = _NOW):
         self.record_id = record_id
-        self.class_id = class_id
-        self.date = date
-        self.attendance_type = attendance_type  # 'day' or 'period'
+        self.class_id = _intern(class_id)
+        self.date = _intern(date)
+        self.attendance_type = _intern(attendance_type)  # 'day' or 'period'
         self.period = period  # None for day attendance, 1-8 for period
-        self.student_id = student_id
-        self.status = status  # 'present', 'absent'
+        self.student_id = _intern(student_id)
+        self.status = _intern(status)  # 'present', 'absent'
         self.is_late = is_late
-        self.marked_by = marked_by
+        self.marked_by = _intern(marked_by)
         self.locked = locked
-        self.submitted_as_type = submitted_as_type
-        self.created_at = datetime.now().isoformat()
+        self.submitted_as_type = _intern(submitted_as_type)
+        self.created_at = datetime.now().isoformat() if created_at is _NOW else created_at
 
     def to_dict(self):
         return {
@@ -108,12 +119,15 @@ class AttendanceRecord:
 
     @classmethod
     def from_dict(cls, data):
-        record = cls(
+        return cls(
             data['record_id'], data['class_id'], data['date'], 
             data['attendance_type'], data.get('period'), data.get('student_id', ''),
             data.get('status', ''), data.get('is_late', False), 
             data.get('marked_by', ''), data.get('locked', False),
-            data.get('submitted_as_type', 'period') # New field
+            data.get('submitted_as_type', 'period'), # New field
+            data['created_at'] if 'created_at' in data else _NOW
         )
-        record.created_at = data.get('created_at', datetime.now().isoformat())
-        return record
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
@@ -0,0 +1,41 @@
+"""Split attendance.json into monthly partitions, or archive old partitions.
+
+Usage:
+    python partition_attendance.py [--data-dir data] [--archive-before YYYY-MM]
+
+Partitioned attendance lives in data/attendance/, one file per month with a
+manifest, so queries and compactions only open the months they need (see
+attendance_partitions.py). The conversion is done once, while the app may keep
+running. --archive-before then gzips the partitions of the months before the
+given one. Only the JSON backend is partitioned.
+"""
+import argparse
+import re
+import sys
+
+from storage import JsonStorage, create_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='data', help='directory holding the data files')
+    parser.add_argument('--archive-before', metavar='YYYY-MM', help='compress the partitions of earlier months')
+    args = parser.parse_args()
+
+    if args.archive_before and not re.fullmatch(r'\d{4}-\d{2}', args.archive_before):
+        parser.error("--archive-before takes a month as YYYY-MM")
+    storage = create_storage(args.data_dir)
+    if not isinstance(storage, JsonStorage):
+        print(f"The {storage.name} backend does not use partitions")
+        sys.exit(1)
+
+    if not storage.attendance_partitions.exists():
+        storage.partition_attendance()
+        print(f"Attendance split into {len(storage.attendance_partitions.read_manifest())} monthly partitions")
+    if args.archive_before:
+        archived = storage.archive_attendance(args.archive_before)
+        print(f"Archived {len(archived)} partitions: {', '.join(archived) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
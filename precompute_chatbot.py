@@ -0,0 +1,37 @@
+"""Precompute the chatbot's analytics answers into the shared snapshot.
+
+Usage:
+    python precompute_chatbot.py [--interval 5] [--once]
+
+Recomputes today's analytics, predictions, insights and comparison answers
+whenever the data changes, so the app's workers serve them from
+data/chatbot_snapshot.json instead of computing them inside a request (see
+chatbot_snapshots.py). Run it from the directory the app runs in, with the
+same ATTENDANCE_* settings. With --once it refreshes a stale snapshot and
+exits, e.g. from cron.
+"""
+import argparse
+import logging
+
+from chatbot import chatbot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between checks for new data')
+    parser.add_argument('--once', action='store_true', help='refresh once and exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.once:
+        refreshed = chatbot.snapshot_refresher.refresh()
+        print("Chatbot snapshot refreshed" if refreshed else "Chatbot snapshot already current")
+        return
+    try:
+        chatbot.snapshot_refresher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Check or rebuild the materialized attendance rollup.
+
+Usage:
+    python rebuild_rollup.py [--data-dir data] [--check]
+
+The rollup holds the per roll call counts behind the class and department
+summaries and is normally kept current on every submit, lock and edit. Run
+this after changing attendance data by hand. The backend is chosen by
+ATTENDANCE_STORAGE as for the app.
+"""
+import argparse
+import sys
+
+from storage import create_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='data', help='directory holding the data files')
+    parser.add_argument('--check', action='store_true', help='only report mismatches, do not rebuild')
+    args = parser.parse_args()
+
+    storage = create_storage(args.data_dir)
+    mismatches = storage.verify_rollup()
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} rollup mismatches in the {storage.name} backend")
+
+    if args.check:
+        sys.exit(1 if mismatches else 0)
+    storage.rebuild_rollup()
+    print("Rollup rebuilt")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,65 @@
-from flask import render_template, request, redirect, url_for, session, flash, jsonify, make_response
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, make_response, g, Response, stream_with_context
+from flask import before_render_template, template_rendered
 from datetime import datetime, timedelta
+import cProfile
+import hmac
+import os
+import time
 import uuid
 import json
 from app import app
 from data_manager import data_manager
 from chatbot import chatbot
 from models import AttendanceRecord
+import metrics
+
+# Admins can profile a request by adding ?profile=1 when this is set; the
+# cProfile stats are written to this directory
+PROFILE_DIR = os.environ.get('ATTENDANCE_PROFILE_DIR')
+
+@app.before_request
+def start_request_metrics():
+    """Collect the time and work of this request for the Server-Timing header and /metrics"""
+    metrics.start_request()
+
+@app.before_request
+def load_user():
+    """Resolve the logged-in user once per request as g.user (None when logged out)"""
+    g.user = data_manager.get_user_by_id(session['user_id']) if 'user_id' in session else None
+
+@app.before_request
+def start_profiler():
+    if PROFILE_DIR and request.args.get('profile') == '1' and g.user and g.user.role == 'admin':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint}-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        response.headers['X-Profile-File'] = filename
+    request_metrics = metrics.finish_request(request.endpoint, response.status_code)
+    if request_metrics is not None:
+        server_timing = request_metrics.server_timing()
+        app.logger.debug("%s %s %s: %s", request.method, request.path, response.status_code, server_timing)
+        # The breakdown names internals, so only admins get it back
+        if g.get('user') and g.user.role == 'admin':
+            response.headers['Server-Timing'] = server_timing
+    return response
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.observe_time('template_render', time.perf_counter() - started, template.name, template=template.name)
 
 @app.route('/')
 def index():
@@ -13,7 +67,7 @@ def index():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user:
         return redirect(url_for('login'))
     
@@ -64,7 +118,7 @@ def staff_dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role != 'staff':
         flash('Access denied. Staff access required.', 'error')
         return redirect(url_for('login'))
@@ -95,7 +149,7 @@ def mark_attendance(class_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role != 'staff':
         flash('Access denied. Staff access required.', 'error')
         return redirect(url_for('login'))
@@ -158,7 +212,7 @@ def submit_attendance():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role != 'staff':
         flash('Access denied. Staff access required.', 'error')
         return redirect(url_for('login'))
@@ -211,7 +265,7 @@ def latecomer_attendance(class_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role != 'staff':
         flash('Access denied. Staff access required.', 'error')
         return redirect(url_for('login'))
@@ -259,7 +313,7 @@ def submit_latecomer():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role != 'staff':
         flash('Access denied. Staff access required.', 'error')
         return redirect(url_for('login'))
@@ -307,7 +361,7 @@ def hod_dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -350,7 +404,7 @@ def class_details(class_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -383,14 +437,13 @@ def class_details(class_id):
     
     # Get weekly attendance trend
     weekly_trend = []
-    for i in range(7):
-        check_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        day_summary = data_manager.get_class_attendance_summary(class_id, check_date)
+    week_start = (datetime.now() - timedelta(days=6)).strftime('%Y-%m-%d')
+    for day_summary in data_manager.get_department_attendance_range(week_start, datetime.now().strftime('%Y-%m-%d')):
+        class_summary = next(c for c in day_summary['classes'] if c['class_id'] == class_id)
         weekly_trend.append({
-            'date': check_date,
-            'percentage': day_summary['percentage']
+            'date': day_summary['date'],
+            'percentage': class_summary['percentage']
         })
-    weekly_trend.reverse()
     
     return render_template('class_details.html',
                          class_obj=class_obj,
@@ -406,7 +459,7 @@ def student_details(student_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -422,12 +475,8 @@ def student_details(student_id):
     
     history = data_manager.get_student_attendance_history(student_id, start_date, end_date)
     
-    # Calculate statistics
-    total_days = len(set(record.date for record in history))
-    present_days = len(set(record.date for record in history if record.status == 'present'))
-    absent_days = total_days - present_days
-    late_count = sum(1 for record in history if record.is_late)
-    percentage = (present_days / total_days * 100) if total_days > 0 else 0
+    # Statistics come from the per-student running totals
+    stats = data_manager.get_student_attendance_stats(student_id, start_date, end_date)
     
     # Group history by date
     daily_attendance = {}
@@ -466,14 +515,6 @@ def student_details(student_id):
             'records': serializable_records # Use serializable records here
         })
     
-    stats = {
-        'total_days': total_days,
-        'present_days': present_days,
-        'absent_days': absent_days,
-        'late_count': late_count,
-        'percentage': percentage
-    }
-    
     class_obj = data_manager.get_class_by_id(student.class_id)
     
     return render_template('student_details.html',
@@ -489,7 +530,7 @@ def search_student():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -498,7 +539,7 @@ def search_student():
     students = []
     
     if query and len(query) >= 2:
-        students = data_manager.search_students(query)
+        students = data_manager.search_students(query, request.args.get('limit', type=int))
     
     if request.args.get('format') == 'json':
         return jsonify([{
@@ -516,7 +557,7 @@ def chatbot_page():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -529,7 +570,7 @@ def chatbot_query():
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         return jsonify({'error': 'Access denied'}), 403
     
@@ -537,16 +578,33 @@ def chatbot_query():
     if not query:
         return jsonify({'error': 'Query is required'}), 400
     
-    response = chatbot.process_query(query, user.role)
+    # Follow-up questions refer to the earlier queries of this browser session
+    session_id = session.setdefault('chatbot_session', uuid.uuid4().hex)
+    if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        # One JSON event per line, sent as soon as it is computed (see AttendanceChatbot.stream_query)
+        events = chatbot.stream_query(query, user.role, session_id)
+        return Response(stream_with_context(_ndjson_events(events)), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response = chatbot.process_query(query, user.role, session_id)
     return jsonify(response)
 
+def _ndjson_events(events):
+    """Each (event, data) pair as a line of JSON; a failure after the first line ends the stream with an error event"""
+    try:
+        for event, data in events:
+            yield app.json.dumps({'event': event, 'data': data}) + '\n'
+    except Exception:
+        app.logger.exception("Streaming a chatbot answer failed")
+        yield app.json.dumps({'event': 'error', 'data': {
+            'type': 'error', 'message': 'Sorry, I encountered an error while processing your request.'}}) + '\n'
+
 @app.route('/reports')
 def reports():
     """Reports page"""
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -570,7 +628,7 @@ def download_report_jpg():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -605,7 +663,7 @@ def print_report():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = data_manager.get_user_by_id(session['user_id'])
+    user = g.user
     if not user or user.role not in ['hod', 'admin']:
         flash('Access denied. HOD access required.', 'error')
         return redirect(url_for('login'))
@@ -616,6 +674,15 @@ def print_report():
 
     return render_template('report_print_template.html', report_data=dept_summary, date_str=date_str, day_of_week=day_of_week)
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics of the worker serving the request, for admins or a scraper holding ATTENDANCE_METRICS_TOKEN"""
+    token = os.environ.get('ATTENDANCE_METRICS_TOKEN')
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    if not scraper and not (g.user and g.user.role == 'admin'):
+        return jsonify({'error': 'Access denied'}), 403
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -0,0 +1,522 @@
+"""SQLite storage backend.
+
+Keeps users, classes, students and attendance in one local database file, so
+it needs no database service. Attendance is indexed by roll call
+(class_id, date, attendance_type, period) and by (student_id, date), and
+summaries and student history are answered with SQL instead of Python loops.
+Per roll call counts are kept in attendance_rollup, recomputed for the
+affected roll calls in the same transaction as every attendance change.
+
+Copy the existing JSON data in once with migrate_to_sqlite.py, then start the
+app with ATTENDANCE_STORAGE=sqlite (ATTENDANCE_DB overrides the database path).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+from generation import GenerationCounter
+from storage import StorageBackend, describe_rollup_mismatches, rollup_slot_period, summarize_attendance_rows
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    seq INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    password TEXT,
+    role TEXT,
+    name TEXT,
+    assigned_classes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_user_id ON users (user_id);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS classes (
+    seq INTEGER PRIMARY KEY,
+    class_id TEXT NOT NULL,
+    class_name TEXT,
+    department TEXT,
+    semester INTEGER,
+    section TEXT,
+    students TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_classes_class_id ON classes (class_id);
+
+CREATE TABLE IF NOT EXISTS students (
+    seq INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    roll_number TEXT,
+    name TEXT,
+    class_id TEXT,
+    email TEXT,
+    phone TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_students_student_id ON students (student_id);
+CREATE INDEX IF NOT EXISTS idx_students_class_id ON students (class_id);
+
+CREATE TABLE IF NOT EXISTS attendance (
+    seq INTEGER PRIMARY KEY,
+    record_id TEXT NOT NULL,
+    class_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    attendance_type TEXT NOT NULL,
+    period INTEGER,
+    student_id TEXT,
+    status TEXT,
+    is_late INTEGER NOT NULL DEFAULT 0,
+    marked_by TEXT,
+    locked INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    submitted_as_type TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_slot ON attendance (class_id, date, attendance_type, period);
+CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date, attendance_type, period);
+CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance (student_id, date);
+CREATE INDEX IF NOT EXISTS idx_attendance_record ON attendance (record_id);
+
+CREATE TABLE IF NOT EXISTS attendance_rollup (
+    class_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    attendance_type TEXT NOT NULL,
+    period INTEGER,
+    records INTEGER NOT NULL,
+    present INTEGER NOT NULL,
+    late INTEGER NOT NULL,
+    locked INTEGER NOT NULL,
+    marked_by TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_rollup_slot
+    ON attendance_rollup (date, attendance_type, period, class_id);
+
+CREATE TABLE IF NOT EXISTS initialized_tables (
+    name TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+TABLE_COLUMNS = {
+    'users': ('user_id', 'username', 'password', 'role', 'name', 'assigned_classes'),
+    'classes': ('class_id', 'class_name', 'department', 'semester', 'section', 'students'),
+    'students': ('student_id', 'roll_number', 'name', 'class_id', 'email', 'phone'),
+    'attendance': ('record_id', 'class_id', 'date', 'attendance_type', 'period', 'student_id', 'status',
+                   'is_late', 'marked_by', 'locked', 'created_at', 'submitted_as_type'),
+}
+# List-valued fields stored as JSON text
+JSON_COLUMNS = {'assigned_classes', 'students'}
+BOOL_COLUMNS = {'is_late', 'locked'}
+# Attendance fields left out of a row when NULL, so AttendanceRecord.from_dict
+# falls back to its own defaults just as it does for older JSON rows
+OPTIONAL_COLUMNS = {'created_at', 'submitted_as_type'}
+
+ATTENDANCE_COLUMNS = ', '.join(TABLE_COLUMNS['attendance'])
+ROLLUP_COLUMNS = ('records', 'present', 'late', 'locked', 'marked_by')
+ROLLUP_SLOT_FILTER = "class_id = ? AND date = ? AND attendance_type = ? AND period IS ?"
+# Rollup rows for the roll calls matching {where}, computed from attendance
+ROLLUP_SELECT = """
+    SELECT class_id, date, attendance_type, period,
+           COUNT(*),
+           COUNT(DISTINCT CASE WHEN status = 'present' THEN student_id END),
+           COUNT(DISTINCT CASE WHEN status = 'present' AND is_late THEN student_id END),
+           MAX(locked),
+           (SELECT first.marked_by FROM attendance AS first
+            WHERE first.class_id = slot.class_id AND first.date = slot.date
+              AND first.attendance_type = slot.attendance_type AND first.period IS slot.period
+            ORDER BY first.seq LIMIT 1)
+    FROM attendance AS slot WHERE {where}
+    GROUP BY class_id, date, attendance_type, period
+"""
+
+
+class SqliteStorage(StorageBackend):
+    name = 'sqlite'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.generation = GenerationCounter(db_path + '.generation')
+        # sqlite3 connections must not be shared between threads or forked
+        # workers, so each thread of each process opens its own
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if not self.table_exists('attendance_rollup'):
+            self.rebuild_rollup()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _columns(table: str, field: str = None) -> tuple:
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+        columns = TABLE_COLUMNS[table]
+        if field is not None and field not in columns:
+            raise ValueError(f"Unknown column {field} for table {table}")
+        return columns
+
+    @staticmethod
+    def _encode(table: str, row: Dict) -> tuple:
+        values = []
+        for column in TABLE_COLUMNS[table]:
+            value = row.get(column)
+            if column in JSON_COLUMNS:
+                value = json.dumps(value or [])
+            elif column in BOOL_COLUMNS:
+                value = 1 if value else 0
+            values.append(value)
+        return tuple(values)
+
+    @staticmethod
+    def _decode(table: str, values: tuple) -> Dict:
+        row = {}
+        for column, value in zip(TABLE_COLUMNS[table], values):
+            if column in JSON_COLUMNS:
+                value = json.loads(value) if value else []
+            elif column in BOOL_COLUMNS:
+                value = bool(value)
+            elif value is None and table == 'attendance' and column in OPTIONAL_COLUMNS:
+                continue
+            row[column] = value
+        return row
+
+    def _select(self, table: str, where: str = '', params: tuple = (), order: str = 'seq') -> List[Dict]:
+        columns = self._columns(table)
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order}"
+        return [self._decode(table, values) for values in self._connection().execute(sql, params)]
+
+    # Table access
+    def table_exists(self, table: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM initialized_tables WHERE name = ?", (table,)).fetchone() is not None
+
+    def table_version(self, table: str):
+        row = self._connection().execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    def load_table(self, table: str) -> List[Dict]:
+        return self._select(table)
+
+    def _replace_rows(self, conn: sqlite3.Connection, table: str, rows: List[Dict]):
+        """Replace every row of the table; call inside a transaction"""
+        columns = self._columns(table)
+        placeholders = ', '.join('?' for _ in columns)
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                         (self._encode(table, row) for row in rows))
+        conn.execute("INSERT OR IGNORE INTO initialized_tables (name) VALUES (?)", (table,))
+        conn.execute("INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                     "ON CONFLICT (name) DO UPDATE SET version = version + 1", (table,))
+        if table == 'attendance':
+            self._refresh_rollup(conn)
+
+    def save_table(self, table: str, rows: List[Dict]):
+        conn = self._connection()
+        with conn:
+            self._replace_rows(conn, table, rows)
+        self.generation.bump()
+
+    def create_table(self, table: str, rows: List[Dict]) -> bool:
+        self._columns(table)
+        conn = self._connection()
+        with conn:
+            created = conn.execute("INSERT OR IGNORE INTO initialized_tables (name) VALUES (?)", (table,)).rowcount
+            if created:
+                self._replace_rows(conn, table, rows)
+        if created:
+            self.generation.bump()
+        return bool(created)
+
+    def modify_table(self, table: str, update: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+        self._columns(table)
+        conn = self._connection()
+        # An immediate transaction takes the write lock up front, so the rows
+        # cannot change between the read and the write and no retry is needed
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = update(self._select(table))
+            self._replace_rows(conn, table, rows)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self.generation.bump()
+        return rows
+
+    def lookup(self, table: str, field: str, value) -> Optional[Dict]:
+        self._columns(table, field)
+        rows = self._select(table, f"{field} = ?", (value,), order='seq LIMIT 1')
+        return rows[0] if rows else None
+
+    def lookup_all(self, table: str, field: str, value) -> List[Dict]:
+        self._columns(table, field)
+        return self._select(table, f"{field} = ?", (value,))
+
+    # Attendance
+    @staticmethod
+    def _attendance_filter(class_id: str = None, date_str: str = None,
+                           attendance_type: str = None, period: int = None) -> tuple:
+        """Translate the get_attendance_records filters into a WHERE clause"""
+        clauses = []
+        params = []
+        if class_id:
+            clauses.append("class_id = ?")
+            params.append(class_id)
+        if date_str:
+            clauses.append("date = ?")
+            params.append(date_str)
+        if attendance_type:
+            clauses.append("attendance_type = ?")
+            params.append(attendance_type)
+            if attendance_type == 'period' and period:
+                clauses.append("period = ?")
+                params.append(period)
+            elif attendance_type == 'day':
+                clauses.append("period = 1") # Day attendance is Period 1
+        return ' AND '.join(clauses), tuple(params)
+
+    def find_attendance(self, class_id: str = None, date_str: str = None,
+                        attendance_type: str = None, period: int = None) -> List[Dict]:
+        where, params = self._attendance_filter(class_id, date_str, attendance_type, period)
+        return self._select('attendance', where, params)
+
+    @staticmethod
+    def _student_filter(student_id: str, start_date: str = None, end_date: str = None) -> tuple:
+        clauses = ["student_id = ?"]
+        params = [student_id]
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        return ' AND '.join(clauses), tuple(params)
+
+    def find_student_attendance(self, student_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        where, params = self._student_filter(student_id, start_date, end_date)
+        return self._select('attendance', where, params, order='date DESC, seq')
+
+    # Rollup
+    @staticmethod
+    def _refresh_rollup(conn: sqlite3.Connection, where: str = '1', params: tuple = ()):
+        """Recompute the rollup rows of every roll call with attendance matching where.
+
+        where must only filter on the roll call columns, so that it selects
+        whole roll calls. Call inside the transaction that changed them.
+        """
+        conn.execute(f"DELETE FROM attendance_rollup WHERE {where}", params)
+        conn.execute(f"INSERT INTO attendance_rollup (class_id, date, attendance_type, period, "
+                     f"{', '.join(ROLLUP_COLUMNS)}) " + ROLLUP_SELECT.format(where=where), params)
+
+    def _refresh_rollup_slots(self, conn: sqlite3.Connection, slots):
+        for slot in set(slots):
+            self._refresh_rollup(conn, ROLLUP_SLOT_FILTER, slot)
+
+    @staticmethod
+    def _rollup_row(values: tuple) -> Dict:
+        summary = dict(zip(ROLLUP_COLUMNS, values))
+        summary['locked'] = bool(summary['locked'])
+        return summary
+
+    def _read_rollup(self, where: str = '1', params: tuple = (), sql: str = None) -> Dict[str, Dict[tuple, Dict]]:
+        if sql is None:
+            sql = (f"SELECT class_id, date, attendance_type, period, {', '.join(ROLLUP_COLUMNS)} "
+                   f"FROM attendance_rollup WHERE {where}")
+        rollup = {}
+        for values in self._connection().execute(sql, params):
+            rollup.setdefault(values[1], {})[values[:4]] = self._rollup_row(values[4:])
+        return rollup
+
+    def verify_rollup(self) -> List[str]:
+        conn = self._connection()
+        # Read both sides in one transaction so they see the same snapshot
+        conn.execute("BEGIN")
+        try:
+            actual = self._read_rollup()
+            expected = self._read_rollup(sql=ROLLUP_SELECT.format(where='1'))
+        finally:
+            conn.rollback()
+        return describe_rollup_mismatches(actual, expected)
+
+    def rebuild_rollup(self):
+        conn = self._connection()
+        with conn:
+            self._refresh_rollup(conn)
+            conn.execute("INSERT OR IGNORE INTO initialized_tables (name) VALUES ('attendance_rollup')")
+
+    def student_attendance_stats(self, student_id: str, start_date: str = None, end_date: str = None) -> Dict:
+        where, params = self._student_filter(student_id, start_date, end_date)
+        total_days, present_days, late_count = self._connection().execute(f"""
+            SELECT COUNT(DISTINCT date),
+                   COUNT(DISTINCT CASE WHEN status = 'present' THEN date END),
+                   COALESCE(SUM(is_late), 0)
+            FROM attendance WHERE {where}
+        """, params).fetchone()
+        return {'total_days': total_days, 'present_days': present_days, 'late_count': late_count}
+
+    def find_attendance_between(self, start_date: str, end_date: str) -> List[Dict]:
+        return self._select('attendance', "date BETWEEN ? AND ?", (start_date, end_date))
+
+    def summarize_attendance(self, class_id: str, date_str: str, attendance_type: str = None,
+                             period: int = None) -> Dict:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if slot_period is not None and class_id and date_str:
+            values = self._connection().execute(
+                f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM attendance_rollup WHERE class_id = ? AND date = ? "
+                "AND attendance_type = ? AND period = ?", (class_id, date_str, attendance_type, slot_period)).fetchone()
+            if values is None:
+                return summarize_attendance_rows([])
+            return self._rollup_row(values)
+
+        where, params = self._attendance_filter(class_id, date_str, attendance_type, period)
+        where = where or '1'
+        records, present, late, locked, marked_by = self._connection().execute(f"""
+            SELECT COUNT(*),
+                   COUNT(DISTINCT CASE WHEN status = 'present' THEN student_id END),
+                   COUNT(DISTINCT CASE WHEN status = 'present' AND is_late THEN student_id END),
+                   MAX(locked),
+                   (SELECT marked_by FROM attendance WHERE {where} ORDER BY seq LIMIT 1)
+            FROM attendance WHERE {where}
+        """, params + params).fetchone()
+        return {
+            'records': records,
+            'present': present,
+            'late': late,
+            'locked': bool(locked),
+            'marked_by': marked_by
+        }
+
+    def summarize_attendance_by_class(self, date_str: str, attendance_type: str = None,
+                                      period: int = None) -> Dict[str, Dict]:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if slot_period is not None:
+            return {slot[0]: summary for slot, summary in self._read_rollup(
+                "date = ? AND attendance_type = ? AND period = ?",
+                (date_str, attendance_type, slot_period)).get(date_str, {}).items()}
+
+        where, params = self._attendance_filter(None, date_str, attendance_type, period)
+        conn = self._connection()
+        summaries = {}
+        for class_id, records, present, late, locked in conn.execute(f"""
+            SELECT class_id,
+                   COUNT(*),
+                   COUNT(DISTINCT CASE WHEN status = 'present' THEN student_id END),
+                   COUNT(DISTINCT CASE WHEN status = 'present' AND is_late THEN student_id END),
+                   MAX(locked)
+            FROM attendance WHERE {where} GROUP BY class_id
+        """, params):
+            summaries[class_id] = {'records': records, 'present': present, 'late': late,
+                                   'locked': bool(locked), 'marked_by': None}
+        # With a single MIN() aggregate SQLite takes the bare marked_by column
+        # from the first row of each class
+        for class_id, marked_by, _ in conn.execute(f"""
+            SELECT class_id, marked_by, MIN(seq) FROM attendance WHERE {where} GROUP BY class_id
+        """, params):
+            summaries[class_id]['marked_by'] = marked_by
+        return summaries
+
+    def summarize_attendance_range(self, start_date: str, end_date: str, attendance_type: str = None,
+                                   period: int = None) -> Dict[str, Dict[str, Dict]]:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if slot_period is not None:
+            rollup = self._read_rollup("date BETWEEN ? AND ? AND attendance_type = ? AND period = ?",
+                                       (start_date, end_date, attendance_type, slot_period))
+            return {date_str: {slot[0]: summary for slot, summary in slots.items()}
+                    for date_str, slots in sorted(rollup.items())}
+
+        where, params = self._attendance_filter(None, None, attendance_type, period)
+        where = ' AND '.join(clause for clause in ("date BETWEEN ? AND ?", where) if clause)
+        params = (start_date, end_date) + params
+        conn = self._connection()
+        summaries = {}
+        for date_str, class_id, records, present, late, locked in conn.execute(f"""
+            SELECT date, class_id,
+                   COUNT(*),
+                   COUNT(DISTINCT CASE WHEN status = 'present' THEN student_id END),
+                   COUNT(DISTINCT CASE WHEN status = 'present' AND is_late THEN student_id END),
+                   MAX(locked)
+            FROM attendance WHERE {where} GROUP BY date, class_id
+        """, params):
+            summaries.setdefault(date_str, {})[class_id] = {'records': records, 'present': present, 'late': late,
+                                                            'locked': bool(locked), 'marked_by': None}
+        for date_str, class_id, marked_by, _ in conn.execute(f"""
+            SELECT date, class_id, marked_by, MIN(seq) FROM attendance WHERE {where} GROUP BY date, class_id
+        """, params):
+            summaries[date_str][class_id]['marked_by'] = marked_by
+        return summaries
+
+    def count_rows_by(self, table: str, field: str) -> Dict:
+        self._columns(table, field)
+        return dict(self._connection().execute(f"SELECT {field}, COUNT(*) FROM {table} GROUP BY {field}"))
+
+    def add_attendance(self, rows: List[Dict]):
+        placeholders = ', '.join('?' for _ in TABLE_COLUMNS['attendance'])
+        conn = self._connection()
+        with conn:
+            conn.executemany(f"INSERT INTO attendance ({ATTENDANCE_COLUMNS}) VALUES ({placeholders})",
+                             (self._encode('attendance', row) for row in rows))
+            self._refresh_rollup_slots(conn, ((row.get('class_id'), row.get('date'), row.get('attendance_type'),
+                                               row.get('period')) for row in rows))
+        self.generation.bump()
+
+    def lock_attendance_many(self, keys: List[tuple]):
+        conn = self._connection()
+        with conn:
+            for class_id, date_str, attendance_type, period in keys:
+                where = "class_id = ? AND date = ? AND attendance_type = ?"
+                params = [class_id, date_str, attendance_type]
+                if attendance_type == 'period' and period:
+                    where += " AND period = ?"
+                    params.append(period)
+                conn.execute(f"UPDATE attendance SET locked = 1 WHERE {where}", params)
+                self._refresh_rollup(conn, where, tuple(params))
+        self.generation.bump()
+
+    def _update_attendance(self, conn: sqlite3.Connection, record_id: str, updates: Dict) -> Optional[tuple]:
+        """Update the first row with record_id; returns its (old slot, new slot), or None if nothing changed"""
+        columns = [column for column in updates if column in TABLE_COLUMNS['attendance']]
+        ignored = set(updates) - set(columns)
+        if ignored:
+            logger.warning("Ignoring unknown attendance fields: %s", ', '.join(sorted(ignored)))
+        if not columns:
+            return None
+        seq_row = conn.execute("SELECT seq FROM attendance WHERE record_id = ? ORDER BY seq LIMIT 1",
+                               (record_id,)).fetchone()
+        if seq_row is None:
+            return None
+        encoded = self._encode('attendance', updates)
+        values = [encoded[TABLE_COLUMNS['attendance'].index(column)] for column in columns]
+        slot_sql = "SELECT class_id, date, attendance_type, period FROM attendance WHERE seq = ?"
+        old_slot = conn.execute(slot_sql, seq_row).fetchone()
+        conn.execute(f"UPDATE attendance SET {', '.join(f'{column} = ?' for column in columns)} WHERE seq = ?",
+                     values + [seq_row[0]])
+        return old_slot, conn.execute(slot_sql, seq_row).fetchone()
+
+    def update_attendance_many(self, updates: Dict[str, Dict]):
+        conn = self._connection()
+        with conn:
+            slots = set()
+            for record_id, record_updates in updates.items():
+                changed = self._update_attendance(conn, record_id, record_updates)
+                if changed:
+                    slots.update(changed)
+            if not slots:
+                return
+            self._refresh_rollup_slots(conn, slots)
+        self.generation.bump()
@@ -117,6 +117,7 @@ Try asking me something like "Show today's attendance summary" or click on the s
 
     async sendMessage(message) {
         this.currentQuery = message;
+        this.progress = null;
         
         // Show typing indicator
         this.showTypingIndicator();
@@ -126,6 +127,8 @@ Try asking me something like "Show today's attendance summary" or click on the s
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    // Ask for the answer as it is computed, one JSON event per line
+                    'Accept': 'application/x-ndjson'
                 },
                 body: JSON.stringify({
                     query: message
@@ -136,7 +139,22 @@ Try asking me something like "Show today's attendance summary" or click on the s
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
+            let data = null;
+            const contentType = response.headers.get('Content-Type') || '';
+            if (response.body && contentType.startsWith('application/x-ndjson')) {
+                for await (const event of this.readEvents(response)) {
+                    if (event.event === 'complete' || event.event === 'error') {
+                        data = event.data;
+                    } else {
+                        this.showProgress(event);
+                    }
+                }
+                if (!data) {
+                    throw new Error('The answer ended before it was complete');
+                }
+            } else {
+                data = await response.json();
+            }
             
             // Hide typing indicator
             this.hideTypingIndicator();
@@ -157,6 +175,55 @@ Try asking me something like "Show today's attendance summary" or click on the s
         }
     }
 
+    async *readEvents(response) {
+        // Newline-delimited JSON: a chunk can end in the middle of a line
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (line.trim()) yield JSON.parse(line);
+            }
+        }
+        if (buffer.trim()) yield JSON.parse(buffer);
+    }
+
+    showProgress(event) {
+        // Partial analytics shown in the typing indicator until the full answer arrives
+        if (event.event === 'headline') {
+            this.progress = { headline: event.data, days: 0, average: null };
+        }
+        const typingText = document.querySelector('#typing-indicator .message-text');
+        if (!this.progress || !typingText) return;
+
+        if (event.event === 'trend_point') {
+            this.progress.days += 1;
+        } else if (event.event === 'statistics') {
+            this.progress.average = event.data.average_attendance;
+        }
+
+        const headline = this.progress.headline;
+        let content = `📊 **${headline.date}:** ${headline.percentage.toFixed(1)}% attendance ` +
+            `(${headline.present_students}/${headline.total_students} present)\n`;
+        if (this.progress.average !== null) {
+            content += `📈 30-day average: ${this.progress.average}%`;
+        } else {
+            content += `Analyzing trends... ${this.progress.days} days so far`;
+        }
+        typingText.innerHTML = `${this.formatMessageContent(content)}
+                    <div class="typing-dots">
+                        <span></span>
+                        <span></span>
+                        <span></span>
+                    </div>`;
+        this.scrollToBottom();
+    }
+
     processResponse(data) {
         let responseContent = '';
         let hasCharts = false;
@@ -0,0 +1,1171 @@
+"""Storage backends for DataManager.
+
+A backend stores the four tables of the system (users, classes, students and
+attendance) as plain dict rows. DataManager turns those rows into model
+objects, so a backend only has to answer the lookups and attendance queries
+below. JsonStorage keeps the data in data/*.json and is the default;
+SqliteStorage (sqlite_storage.py) keeps it in a local SQLite database and is
+selected with ATTENDANCE_STORAGE=sqlite.
+"""
+import bisect
+import contextlib
+import copy
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from atomic_io import file_lock, write_json_array_atomic, write_json_atomic
+from attendance_journal import AttendanceJournal
+from attendance_partitions import AttendancePartitions, month_overlaps, partition_month
+from attendance_stream import JournalReplay, iter_json_array
+from generation import GenerationCounter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Fields identifying one roll call: attendance for a class, date, type and period
+ATTENDANCE_SLOT_FIELDS = ('class_id', 'date', 'attendance_type', 'period')
+
+
+def attendance_row_matches(row: Dict, class_id: str = None, date_str: str = None,
+                           attendance_type: str = None, period: int = None) -> bool:
+    """Check an attendance row against the filters of DataManager.get_attendance_records"""
+    if class_id and row['class_id'] != class_id:
+        return False
+    if date_str and row['date'] != date_str:
+        return False
+    if attendance_type:
+        if row['attendance_type'] != attendance_type:
+            return False
+        if attendance_type == 'period' and period and row.get('period') != period:
+            return False
+        elif attendance_type == 'day' and row.get('period') != 1: # Day attendance is Period 1
+            return False
+    return True
+
+
+def rollup_slot_period(attendance_type: str, period: int = None) -> Optional[int]:
+    """Return the period of the single roll call slot these filters select, if they select one.
+
+    Day attendance is the period 1 slot and period attendance with a period is
+    that period's slot. Any other filter spans several slots, whose distinct
+    student counts cannot be added up from the rollup.
+    """
+    if attendance_type == 'day':
+        return 1
+    if attendance_type == 'period' and period:
+        return period
+    return None
+
+
+def attendance_slot(row: Dict) -> tuple:
+    return tuple(row.get(field) for field in ATTENDANCE_SLOT_FIELDS)
+
+
+class SlotTally:
+    """Running counts for one roll call, fed one row at a time"""
+    __slots__ = ('records', 'present_students', 'late_students', 'locked', 'marked_by')
+
+    def __init__(self):
+        self.records = 0
+        self.present_students = set()
+        self.late_students = set()
+        self.locked = False
+        self.marked_by = None
+
+    def add(self, row: Dict):
+        if not self.records:
+            self.marked_by = row.get('marked_by')
+        self.records += 1
+        if row.get('status') == 'present':
+            self.present_students.add(row.get('student_id'))
+            if row.get('is_late'):
+                self.late_students.add(row.get('student_id'))
+        self.locked = self.locked or bool(row.get('locked'))
+
+    def summary(self) -> Dict:
+        return {
+            'records': self.records,
+            'present': len(self.present_students),
+            'late': len(self.late_students),
+            'locked': self.locked,
+            'marked_by': self.marked_by
+        }
+
+
+def summarize_attendance_rows(rows: Iterable[Dict]) -> Dict:
+    """Count distinct present and late students over the rows of one roll call"""
+    tally = SlotTally()
+    for row in rows:
+        tally.add(row)
+    return tally.summary()
+
+
+def describe_rollup_mismatches(actual: Dict[str, Dict[tuple, Dict]],
+                               expected: Dict[str, Dict[tuple, Dict]]) -> List[str]:
+    """List the slots where a rollup ({date: {slot: summary}}) differs from the expected one"""
+    mismatches = []
+    for date_str in sorted(set(actual) | set(expected)):
+        actual_slots = actual.get(date_str, {})
+        expected_slots = expected.get(date_str, {})
+        for slot in sorted(set(actual_slots) | set(expected_slots), key=repr):
+            if actual_slots.get(slot) != expected_slots.get(slot):
+                mismatches.append(f"{slot}: rollup has {actual_slots.get(slot)}, raw records give {expected_slots.get(slot)}")
+    return mismatches
+
+
+class WriteConflict(Exception):
+    """A table kept changing under modify_table() until it ran out of retries"""
+
+
+class StudentTimeline:
+    """One student's attendance rows grouped by date in ascending order.
+
+    present_before[i] and late_before[i] count the present days and the late
+    records among the first i dates, so the totals for any date range are two
+    bisects and two subtractions.
+    """
+    __slots__ = ('dates', 'rows_by_date', 'present_before', 'late_before')
+
+    def __init__(self, rows: List[Dict]):
+        by_date = {}
+        for row in rows:
+            by_date.setdefault(row['date'], []).append(row)
+        self.dates = sorted(by_date)
+        self.rows_by_date = [by_date[date_str] for date_str in self.dates]
+        self.present_before = [0]
+        self.late_before = [0]
+        self._recount(0)
+
+    def _recount(self, start: int):
+        del self.present_before[start + 1:]
+        del self.late_before[start + 1:]
+        for rows in self.rows_by_date[start:]:
+            present = any(row.get('status') == 'present' for row in rows)
+            self.present_before.append(self.present_before[-1] + present)
+            self.late_before.append(self.late_before[-1] + sum(1 for row in rows if row.get('is_late')))
+
+    def add(self, row: Dict):
+        position = bisect.bisect_left(self.dates, row['date'])
+        if position < len(self.dates) and self.dates[position] == row['date']:
+            self.rows_by_date[position].append(row)
+        else:
+            self.dates.insert(position, row['date'])
+            self.rows_by_date.insert(position, [row])
+        self._recount(position)
+
+    def _bounds(self, start_date: str = None, end_date: str = None) -> tuple:
+        first = bisect.bisect_left(self.dates, start_date) if start_date else 0
+        last = bisect.bisect_right(self.dates, end_date) if end_date else len(self.dates)
+        return first, max(first, last)
+
+    def find(self, start_date: str = None, end_date: str = None) -> List[Dict]:
+        """Rows in the date range, newest date first"""
+        first, last = self._bounds(start_date, end_date)
+        return [row for rows in reversed(self.rows_by_date[first:last]) for row in rows]
+
+    def stats(self, start_date: str = None, end_date: str = None) -> Dict:
+        first, last = self._bounds(start_date, end_date)
+        return {
+            'total_days': last - first,
+            'present_days': self.present_before[last] - self.present_before[first],
+            'late_count': self.late_before[last] - self.late_before[first]
+        }
+
+
+class StorageBackend:
+    """Interface shared by the storage backends"""
+
+    name = ''
+    # Bumped after every write; see generation.py
+    generation: GenerationCounter = None
+
+    def data_generation(self) -> int:
+        """Counter that changes after any write by any process, for validating caches of derived data"""
+        return self.generation.value()
+
+    def table_exists(self, table: str) -> bool:
+        """Whether the table has been created, so defaults are only written once"""
+        raise NotImplementedError
+
+    def table_version(self, table: str):
+        """Return a marker that changes whenever the table is saved, for caches built from its rows"""
+        raise NotImplementedError
+
+    def create_table(self, table: str, rows: List[Dict]) -> bool:
+        """Save rows as the table unless it already exists; return whether this call created it"""
+        raise NotImplementedError
+
+    def modify_table(self, table: str, update: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+        """Replace the table with update(rows) without losing a concurrent save, and return the new rows.
+
+        update receives a private copy of the rows and may be called more than
+        once, so it must not have other side effects.
+        """
+        raise NotImplementedError
+
+    def load_table(self, table: str) -> List[Dict]:
+        """Return every row of users, classes or students in stored order"""
+        raise NotImplementedError
+
+    def save_table(self, table: str, rows: List[Dict]):
+        """Replace the contents of a table"""
+        raise NotImplementedError
+
+    def lookup(self, table: str, field: str, value) -> Optional[Dict]:
+        """Return the first row whose field equals value"""
+        raise NotImplementedError
+
+    def lookup_all(self, table: str, field: str, value) -> List[Dict]:
+        """Return every row whose field equals value, in stored order"""
+        raise NotImplementedError
+
+    def find_attendance(self, class_id: str = None, date_str: str = None,
+                        attendance_type: str = None, period: int = None) -> List[Dict]:
+        """Return attendance rows matching attendance_row_matches, in stored order"""
+        raise NotImplementedError
+
+    def find_student_attendance(self, student_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        """Return a student's attendance rows in the date range, newest date first"""
+        raise NotImplementedError
+
+    def student_attendance_stats(self, student_id: str, start_date: str = None, end_date: str = None) -> Dict:
+        """Count a student's days marked, days present on any roll call and late records in the date range"""
+        return StudentTimeline(self.find_student_attendance(student_id, start_date, end_date)).stats()
+
+    def find_attendance_between(self, start_date: str, end_date: str) -> List[Dict]:
+        """Return every attendance row dated start_date to end_date inclusive"""
+        return [row for row in self.find_attendance() if start_date <= row['date'] <= end_date]
+
+    def summarize_attendance(self, class_id: str, date_str: str, attendance_type: str = None,
+                             period: int = None) -> Dict:
+        """Return summarize_attendance_rows over the rows find_attendance would return"""
+        return summarize_attendance_rows(self.find_attendance(class_id, date_str, attendance_type, period))
+
+    def summarize_attendance_by_class(self, date_str: str, attendance_type: str = None,
+                                      period: int = None) -> Dict[str, Dict]:
+        """Summarize the roll call of every class on a date in one pass over that date's rows"""
+        rows_by_class = {}
+        for row in self.find_attendance(None, date_str, attendance_type, period):
+            rows_by_class.setdefault(row['class_id'], []).append(row)
+        return {class_id: summarize_attendance_rows(rows) for class_id, rows in rows_by_class.items()}
+
+    def summarize_attendance_range(self, start_date: str, end_date: str, attendance_type: str = None,
+                                   period: int = None) -> Dict[str, Dict[str, Dict]]:
+        """Summarize every class for each date from start_date to end_date inclusive.
+
+        Returns {date: {class_id: summary}} for the dates that have attendance.
+        """
+        rows_by_day = {}
+        for row in self.find_attendance_between(start_date, end_date):
+            if attendance_row_matches(row, None, None, attendance_type, period):
+                rows_by_day.setdefault(row['date'], {}).setdefault(row['class_id'], []).append(row)
+        return {
+            date_str: {class_id: summarize_attendance_rows(rows) for class_id, rows in rows_by_class.items()}
+            for date_str, rows_by_class in rows_by_day.items()
+        }
+
+    def count_rows_by(self, table: str, field: str) -> Dict:
+        """Return the number of rows per distinct value of field"""
+        counts = {}
+        for row in self.load_table(table):
+            counts[row.get(field)] = counts.get(row.get(field), 0) + 1
+        return counts
+
+    def verify_rollup(self) -> List[str]:
+        """Compare the materialized rollup with one computed from the raw rows and describe any mismatch"""
+        raise NotImplementedError
+
+    def rebuild_rollup(self):
+        """Recompute the materialized rollup from the raw rows and persist it"""
+        raise NotImplementedError
+
+    def is_attendance_locked(self, class_id: str, date_str: str, attendance_type: str, period: int = None) -> bool:
+        """Whether any matching row is locked; served from the rollup for a single roll call"""
+        return self.summarize_attendance(class_id, date_str, attendance_type, period)['locked']
+
+    def add_attendance(self, rows: List[Dict]):
+        raise NotImplementedError
+
+    def lock_attendance(self, class_id: str, date_str: str, attendance_type: str, period: int = None):
+        self.lock_attendance_many([(class_id, date_str, attendance_type, period)])
+
+    def lock_attendance_many(self, keys: List[tuple]):
+        """Lock every (class_id, date, attendance_type, period) roll call in keys as one write"""
+        raise NotImplementedError
+
+    def update_attendance(self, record_id: str, updates: Dict):
+        self.update_attendance_many({record_id: updates})
+
+    def update_attendance_many(self, updates: Dict[str, Dict]):
+        """Apply {record_id: field updates} as one write"""
+        raise NotImplementedError
+
+
+class JsonStorage(StorageBackend):
+    """Keeps data/*.json resident in memory with dict indexes.
+
+    Each file is parsed once and kept together with its stat stamp (mtime,
+    size, inode); it is parsed again only when the stamp changes. Attendance
+    changes are appended to a journal (see attendance_journal.py) rather than
+    rewriting attendance.json.
+
+    Summaries are served from a rollup of present/late/total/locked/marked_by
+    per roll call slot. It is saved next to attendance.json at every
+    compaction, loaded with it, and kept current slot by slot as journal
+    entries are applied.
+
+    Once partition_attendance.py has run, the compacted rows live in one file
+    per month under data/attendance/ instead of attendance.json, so a
+    compaction rewrites only the months the journal touched and streamed
+    queries skip the months outside their dates.
+
+    The files are written as indented JSON, or minified with
+    ATTENDANCE_DATA_FORMAT=compact; either is read back, so workers may
+    differ and convert_data_format.py rewrites an existing directory.
+
+    With ATTENDANCE_RESIDENT=0 the attendance rows are not kept in memory.
+    Attendance queries stream attendance.json (see attendance_stream.py) and
+    keep only the matching rows, and only the rollup stays resident: the
+    saved one, with the class and dates the journal touched rolled up again
+    from a scan. Every journal change costs the next summary a scan, so this
+    mode trades CPU for a worker size that no longer grows with the history.
+    """
+
+    name = 'json'
+    # Attempts modify_table() makes before giving up with WriteConflict
+    WRITE_RETRIES = 10
+    ATTENDANCE_FILE = 'attendance.json'
+    ATTENDANCE_JOURNAL_FILE = 'attendance.jsonl'
+    # Holds the monthly partitions that replace attendance.json once the
+    # directory is partitioned (see attendance_partitions.py)
+    ATTENDANCE_PARTITION_DIR = 'attendance'
+    # Per roll call counts for the rows in attendance.json; journal entries
+    # are rolled up in memory as they are applied
+    ROLLUP_FILE = 'attendance_rollup.json'
+    GENERATION_FILE = 'generation'
+    # Cache key of the rollup kept when the attendance rows are not resident
+    STREAMED_ROLLUP = 'streamed rollup'
+    # Fold the journal back into attendance.json once it grows past this size
+    JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+    # JSON indentation of the data files per ATTENDANCE_DATA_FORMAT
+    DATA_FORMATS = {'pretty': 2, 'compact': None}
+
+    def __init__(self, data_dir: str, data_format: str = None):
+        self.data_dir = data_dir
+        # Resident copies of the data files keyed by filename. Each entry keeps
+        # the stat stamp it was loaded under, the parsed rows and the lookup
+        # indexes built from them.
+        self._cache = {}
+        # Guards the resident attendance rows, which are patched in place as
+        # journal entries arrive. Readers take it to build indexes or walk
+        # the student timelines; the rollup's per-date dicts are replaced
+        # instead of patched, so summaries read them without it
+        self._attendance_lock = threading.RLock()
+        self.attendance_journal = AttendanceJournal(
+            os.path.join(self.data_dir, self.ATTENDANCE_JOURNAL_FILE),
+            fsync=os.environ.get('ATTENDANCE_JOURNAL_FSYNC', '1') != '0')
+        data_format = data_format or os.environ.get('ATTENDANCE_DATA_FORMAT', 'pretty')
+        if data_format not in self.DATA_FORMATS:
+            raise ValueError(f"Unknown data format: {data_format}")
+        self.json_indent = self.DATA_FORMATS[data_format]
+        self.attendance_partitions = AttendancePartitions(os.path.join(self.data_dir, self.ATTENDANCE_PARTITION_DIR),
+                                                          indent=self.json_indent)
+        # The resident attendance rows remember the generation they were
+        # last validated at and skip the stat calls while it has not moved
+        self.generation = GenerationCounter(os.path.join(self.data_dir, self.GENERATION_FILE))
+        # Whether attendance rows are kept resident or streamed from disk per query
+        self.resident_attendance = os.environ.get('ATTENDANCE_RESIDENT', '1') != '0'
+
+    def _file_stamp(self, filepath: str) -> Optional[tuple]:
+        """Return a cheap change marker for a file, or None if it does not exist"""
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _attendance_stamp(self) -> Optional[tuple]:
+        """Change marker of the compacted attendance rows: the partition manifest's, else attendance.json's"""
+        return (self._file_stamp(self.attendance_partitions.manifest_path)
+                or self._file_stamp(os.path.join(self.data_dir, self.ATTENDANCE_FILE)))
+
+    def _get_cache_entry(self, filename: str) -> Dict:
+        """Return the resident entry for a data file, reloading it if the file changed"""
+        if filename == self.ATTENDANCE_FILE:
+            return self._get_attendance_entry()
+
+        # users, classes and students are edited by hand, which bumps no
+        # generation, so these small files are checked with a stat each time
+        entry = self._cache.get(filename)
+        filepath = os.path.join(self.data_dir, filename)
+        stamp = self._file_stamp(filepath)
+        if entry is not None and stamp is not None and entry['stamp'] == stamp:
+            return entry
+
+        try:
+            with open(filepath, 'r') as f:
+                data = self._parse_json(f)
+        except FileNotFoundError:
+            return {'stamp': None, 'data': [], 'indexes': {}}
+        except json.JSONDecodeError:
+            # Files are only ever replaced whole, so this is real damage rather
+            # than a write in progress. Do not keep the failed read around; the
+            # next call retries the file
+            logger.error("Could not parse %s, serving it as empty", filepath)
+            return {'stamp': None, 'data': [], 'indexes': {}}
+
+        entry = {'stamp': stamp, 'data': data, 'indexes': {}}
+        self._cache[filename] = entry
+        return entry
+
+    def _get_attendance_entry(self) -> Dict:
+        """Return the resident attendance rows: attendance.json with the journal applied on top"""
+        generation = self.generation.value()
+        entry = self._cache.get(self.ATTENDANCE_FILE)
+        if entry is not None and entry.get('generation') == generation:
+            return entry
+
+        if (entry is not None and entry['stamp'] == self._attendance_stamp()
+                and entry['journal_offset'] == self.attendance_journal.size()):
+            entry['generation'] = generation
+            return entry
+
+        with self._attendance_lock, self.attendance_journal.shared_lock():
+            entry = self._refresh_attendance_entry()
+            entry['generation'] = generation
+            return entry
+
+    def _refresh_attendance_entry(self) -> Dict:
+        """Catch the resident attendance rows up with the files.
+
+        Only the journal tail written since the last call is read and applied;
+        attendance.json is parsed again only after a compaction replaced it.
+        Callers must hold the attendance lock and a journal lock.
+        """
+        stamp = self._attendance_stamp()
+        entry = self._cache.get(self.ATTENDANCE_FILE)
+        if entry is None or entry['stamp'] != stamp or entry['journal_offset'] > self.attendance_journal.size():
+            entry = {'stamp': stamp, 'data': self._load_attendance_rows(), 'indexes': {}, 'journal_offset': 0,
+                     'rollup': self._read_rollup(stamp)}
+            self._cache[self.ATTENDANCE_FILE] = entry
+
+        ops, entry['journal_offset'] = self.attendance_journal.read(entry['journal_offset'])
+        self._apply_attendance_ops(entry, ops)
+        return entry
+
+    def _load_attendance_rows(self) -> List[Dict]:
+        """Parse the compacted attendance rows, from the monthly partitions or attendance.json"""
+        if self.attendance_partitions.exists():
+            rows = []
+            for filename in self.attendance_partitions.read_manifest().values():
+                try:
+                    with self.attendance_partitions.open(filename) as f:
+                        rows.extend(self._parse_json(f))
+                except (FileNotFoundError, json.JSONDecodeError):
+                    logger.error("Could not read partition %s, serving it as empty", filename)
+            return rows
+
+        filepath = os.path.join(self.data_dir, self.ATTENDANCE_FILE)
+        try:
+            with open(filepath, 'r') as f:
+                return self._parse_json(f)
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError:
+            logger.error("Could not parse %s, serving it as empty", filepath)
+            return []
+
+    @staticmethod
+    def _parse_json(f) -> List[Dict]:
+        """json.load(f), counted in the request metrics"""
+        data = json.load(f)
+        metrics.count('json_files_parsed')
+        metrics.count('json_bytes_parsed', os.fstat(f.fileno()).st_size)
+        return data
+
+    def _apply_attendance_ops(self, entry: Dict, ops: List[Dict]):
+        """Apply journal operations to resident attendance rows, keeping built indexes and the rollup current"""
+        if ops:
+            metrics.count('journal_ops_applied', len(ops))
+        data = entry['data']
+        indexes = entry['indexes']
+        touched_slots = set()
+        for op in ops:
+            kind = op.get('op')
+            if kind == 'add':
+                row = op['row']
+                data.append(row)
+                touched_slots.add(attendance_slot(row))
+                for (fields, unique), index in indexes.items():
+                    self._add_to_index(index, fields, unique, row)
+                dates = entry.get('sorted_dates')
+                if dates is not None:
+                    position = bisect.bisect_left(dates, row['date'])
+                    if position == len(dates) or dates[position] != row['date']:
+                        dates.insert(position, row['date'])
+                timeline = entry.get('student_timelines', {}).get(row.get('student_id'))
+                if timeline is not None:
+                    timeline.add(row)
+            elif kind == 'lock':
+                rows = self._get_entry_index(entry, ('class_id', 'date')).get((op['class_id'], op['date']), [])
+                for row in rows:
+                    if row['attendance_type'] != op['attendance_type']:
+                        continue
+                    if op['attendance_type'] == 'period' and op['period'] and row.get('period') != op['period']:
+                        continue
+                    row['locked'] = True
+                    touched_slots.add(attendance_slot(row))
+            elif kind == 'update':
+                row = self._get_entry_index(entry, ('record_id',), unique=True).get(op['record_id'])
+                if row is not None:
+                    touched_slots.add(attendance_slot(row))
+                    timelines = entry.get('student_timelines', {})
+                    timelines.pop(row.get('student_id'), None)
+                    row.update(op['updates'])
+                    touched_slots.add(attendance_slot(row))
+                    timelines.pop(row.get('student_id'), None)
+                    if any(field in op['updates'] for fields, _ in indexes for field in fields):
+                        indexes.clear()
+                        entry.pop('sorted_dates', None)
+
+        # Months whose partitions the next compaction has to rewrite
+        entry.setdefault('dirty_months', set()).update(partition_month(slot[1]) for slot in touched_slots)
+        if entry.get('rollup') is not None and touched_slots:
+            slot_index = self._get_entry_index(entry, ATTENDANCE_SLOT_FIELDS)
+            slots_by_date = {}
+            for slot in touched_slots:
+                slots_by_date.setdefault(slot[1], []).append(slot)
+            # Readers iterate the per-date dicts without the attendance lock,
+            # so a changed date gets a new dict rather than being modified
+            for date_str, slots in slots_by_date.items():
+                slots_on_date = dict(entry['rollup'].get(date_str, {}))
+                for slot in slots:
+                    self._set_rollup_slot(slots_on_date, slot, slot_index.get(slot))
+                entry['rollup'][date_str] = slots_on_date
+
+    @staticmethod
+    def _set_rollup_slot(slots_on_date: Dict, slot: tuple, rows: Optional[List[Dict]]):
+        if rows:
+            slots_on_date[slot] = summarize_attendance_rows(rows)
+        else:
+            slots_on_date.pop(slot, None)
+
+    def _build_rollup(self, entry: Dict) -> Dict[str, Dict[tuple, Dict]]:
+        """Roll up the resident rows: {date: {slot: summary}}"""
+        rollup = {}
+        for slot, rows in self._get_entry_index(entry, ATTENDANCE_SLOT_FIELDS).items():
+            self._set_rollup_slot(rollup.setdefault(slot[1], {}), slot, rows)
+        return rollup
+
+    def _read_rollup(self, stamp: Optional[tuple]) -> Optional[Dict]:
+        """Load the saved rollup if it was written for this version of attendance.json"""
+        try:
+            with open(os.path.join(self.data_dir, self.ROLLUP_FILE), 'r') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if stamp is None or saved.get('source_stamp') != list(stamp):
+            return None
+
+        rollup = {}
+        for slot_data in saved['slots']:
+            slot = tuple(slot_data[field] for field in ATTENDANCE_SLOT_FIELDS)
+            rollup.setdefault(slot[1], {})[slot] = {
+                field: slot_data[field] for field in ('records', 'present', 'late', 'locked', 'marked_by')
+            }
+        return rollup
+
+    def _write_rollup(self, rollup: Dict, stamp: tuple):
+        slots = []
+        for slots_on_date in rollup.values():
+            for slot, summary in slots_on_date.items():
+                slot_data = dict(zip(ATTENDANCE_SLOT_FIELDS, slot))
+                slot_data.update(summary)
+                slots.append(slot_data)
+        write_json_atomic(os.path.join(self.data_dir, self.ROLLUP_FILE),
+                          {'source_stamp': list(stamp), 'slots': slots}, indent=self.json_indent, fsync=False)
+
+    def _get_rollup(self) -> Dict[str, Dict[tuple, Dict]]:
+        if not self.resident_attendance:
+            return self._get_streamed_rollup()
+        entry = self._get_attendance_entry()
+        rollup = entry.get('rollup')
+        if rollup is None:
+            with self._attendance_lock:
+                rollup = entry.get('rollup')
+                if rollup is None:
+                    rollup = entry['rollup'] = self._build_rollup(entry)
+        return rollup
+
+    def _append_attendance_ops(self, ops: List[Dict]):
+        """Record attendance changes in the journal and bring the resident rows up to date"""
+        self.attendance_journal.append(ops)
+        self.generation.bump()
+        if self.attendance_journal.size() > self.JOURNAL_COMPACT_BYTES:
+            self.compact_attendance_journal()
+        elif self.resident_attendance:
+            self._get_attendance_entry()
+
+    def compact_attendance_journal(self, rewrite_all: bool = False):
+        """Fold the attendance journal into the compacted rows and empty it.
+
+        In a partitioned directory only the months the journal touched are
+        rewritten, unless rewrite_all is set.
+        """
+        filepath = os.path.join(self.data_dir, self.ATTENDANCE_FILE)
+        if not self.resident_attendance:
+            with self._attendance_lock, self.attendance_journal.exclusive_lock() as journal_fd:
+                rollup = self._compute_streamed_rollup()
+                if self.attendance_partitions.exists():
+                    self._compact_partitions_streamed(rewrite_all)
+                else:
+                    write_json_array_atomic(filepath, self._stream_attendance(*self._open_attendance_stream()),
+                                            indent=self.json_indent)
+                self.attendance_journal.truncate(journal_fd)
+                stamp = self._attendance_stamp()
+                self._write_rollup(rollup, stamp)
+                self._cache[self.STREAMED_ROLLUP] = {'stamp': stamp, 'journal_offset': 0, 'rollup': rollup}
+            return
+
+        with self._attendance_lock, self.attendance_journal.exclusive_lock() as journal_fd:
+            entry = self._refresh_attendance_entry()
+            if self.attendance_partitions.exists():
+                manifest = self.attendance_partitions.read_manifest()
+                months = entry.get('dirty_months', set())
+                if rewrite_all:
+                    months = months | set(manifest)
+                rows_by_month = {month: [] for month in months}
+                for row in entry['data']:
+                    rows = rows_by_month.get(partition_month(row['date']))
+                    if rows is not None:
+                        rows.append(row)
+                self.attendance_partitions.write(manifest, rows_by_month)
+                # Put the resident rows in the order a reload would give
+                months = [partition_month(row['date']) for row in entry['data']]
+                if any(earlier > later for earlier, later in zip(months, months[1:])):
+                    # Sorted into a new list, as readers may be iterating the old one
+                    entry['data'] = sorted(entry['data'], key=lambda row: partition_month(row['date']))
+                    entry['indexes'].clear()
+                    entry.pop('sorted_dates', None)
+                    entry.pop('student_timelines', None)
+            else:
+                write_json_atomic(filepath, entry['data'], indent=self.json_indent)
+            self.attendance_journal.truncate(journal_fd)
+            entry['stamp'] = self._attendance_stamp()
+            entry['journal_offset'] = 0
+            entry['dirty_months'] = set()
+            if entry.get('rollup') is None:
+                entry['rollup'] = self._build_rollup(entry)
+            self._write_rollup(entry['rollup'], entry['stamp'])
+
+    def _compact_partitions_streamed(self, rewrite_all: bool = False):
+        """Rewrite the partitions the journal touched without loading the others; callers hold the journal lock"""
+        manifest = self.attendance_partitions.read_manifest()
+        ops, _ = self.attendance_journal.read()
+        replay = JournalReplay(ops)
+        dirty = {partition_month(date_str) for _, date_str in replay.touched_pairs()}
+        if rewrite_all:
+            dirty |= set(manifest)
+        moved = {}  # month -> rows an update moved there from another partition
+        if replay.has_updates:
+            # Updated rows can be in any partition, so find them first
+            for month, filename in manifest.items():
+                with self.attendance_partitions.open(filename) as f:
+                    for row in iter_json_array(f):
+                        replay.apply(row)
+                        if partition_month(row['date']) != month:
+                            moved.setdefault(partition_month(row['date']), []).append(row)
+            dirty |= {partition_month(date_str) for _, date_str in replay.updated_pairs}
+        added = {}
+        for position, row in replay.added:
+            replay.apply(row, position)
+            added.setdefault(partition_month(row['date']), []).append(row)
+
+        # The partitions are written oldest first, so this replay meets the
+        # rows in stored order as the one above did
+        rewrite = JournalReplay(ops)
+
+        def month_rows(month: str) -> Iterator[Dict]:
+            if month in manifest:
+                with self.attendance_partitions.open(manifest[month]) as f:
+                    for row in iter_json_array(f):
+                        rewrite.apply(row)
+                        if partition_month(row['date']) == month:
+                            yield row
+            yield from moved.get(month, [])
+            yield from added.get(month, [])
+
+        self.attendance_partitions.write(manifest, {month: month_rows(month) for month in dirty})
+
+    def _open_attendance_stream(self, keep_month: Callable[[str], bool] = None) -> tuple:
+        """Open the compacted rows and read the journal on top of them; callers hold a journal lock.
+
+        keep_month limits a partitioned directory to the months it accepts,
+        unless a journal update may have moved rows between dates. The files
+        are opened here, so they stay the versions that go with the journal
+        even if a compaction replaces them before the scan.
+        """
+        ops, _ = self.attendance_journal.read()
+        replay = JournalReplay(ops)
+        if not self.attendance_partitions.exists():
+            try:
+                return [open(os.path.join(self.data_dir, self.ATTENDANCE_FILE), 'r')], replay
+            except FileNotFoundError:
+                return [], replay
+
+        files = []
+        try:
+            for month, filename in self.attendance_partitions.read_manifest().items():
+                if keep_month is None or replay.moves_rows or keep_month(month):
+                    files.append(self.attendance_partitions.open(filename))
+        except BaseException:
+            for f in files:
+                f.close()
+            raise
+        return files, replay
+
+    @staticmethod
+    def _stream_attendance(files: List, replay: JournalReplay) -> Iterator[Dict]:
+        """Yield the rows of files with the journal replayed on them, then the rows the journal added"""
+        try:
+            for f in files:
+                metrics.count('json_bytes_streamed', os.fstat(f.fileno()).st_size)
+                try:
+                    for row in iter_json_array(f):
+                        yield replay.apply(row)
+                except json.JSONDecodeError:
+                    logger.error("Could not parse %s, serving the rows before the damage", f.name)
+                f.close()
+        finally:
+            for f in files:
+                f.close()
+        for position, row in replay.added:
+            yield replay.apply(row, position)
+
+    def _iter_attendance(self, start_date: str = None, end_date: str = None) -> Iterator[Dict]:
+        """Stream the attendance rows in stored order without loading them all.
+
+        With a date range, partitions that cannot hold rows in it are skipped;
+        callers still filter the rows by date.
+        """
+        keep_month = None
+        if start_date or end_date:
+            keep_month = lambda month: month_overlaps(month, start_date, end_date)
+        with self.attendance_journal.shared_lock():
+            files, replay = self._open_attendance_stream(keep_month)
+        return self._stream_attendance(files, replay)
+
+    def _scan_rollup(self, pairs: set = None, months: set = None) -> tuple:
+        """Roll up a scan of the rows, or of those whose (class_id, date) is in pairs.
+
+        months, if given, limits the scan to those partitions. Returns the
+        rollup and the JournalReplay used. Callers hold a journal lock.
+        """
+        files, replay = self._open_attendance_stream(None if months is None else months.__contains__)
+        tallies = {}
+        for row in self._stream_attendance(files, replay):
+            if pairs is None or (row.get('class_id'), row.get('date')) in pairs:
+                slot = attendance_slot(row)
+                tally = tallies.get(slot)
+                if tally is None:
+                    tally = tallies[slot] = SlotTally()
+                tally.add(row)
+        rollup = {}
+        for slot, tally in tallies.items():
+            rollup.setdefault(slot[1], {})[slot] = tally.summary()
+        return rollup, replay
+
+    def _compute_streamed_rollup(self) -> Dict[str, Dict[tuple, Dict]]:
+        """Bring the saved rollup up to date with the journal by scanning; callers hold a journal lock"""
+        rollup = self._read_rollup(self._attendance_stamp())
+        if rollup is None:
+            return self._scan_rollup()[0]
+
+        ops, _ = self.attendance_journal.read()
+        if not ops:
+            return rollup
+        journal = JournalReplay(ops)
+        pairs = journal.touched_pairs()
+        # Rows an update changed can be in any partition
+        months = None if journal.has_updates else {partition_month(date_str) for _, date_str in pairs}
+        scanned, replay = self._scan_rollup(pairs, months)
+        # Which rows the updates changed is only known once the scan has
+        # reached them, so their class and dates take a second scan
+        extra = replay.updated_pairs - pairs
+        if extra:
+            months = None if replay.moves_rows else {partition_month(date_str) for _, date_str in extra}
+            for date_str, slots in self._scan_rollup(extra, months)[0].items():
+                scanned.setdefault(date_str, {}).update(slots)
+            pairs |= extra
+
+        for class_id, date_str in pairs:
+            slots_on_date = rollup.get(date_str, {})
+            for slot in [slot for slot in slots_on_date if slot[0] == class_id]:
+                del slots_on_date[slot]
+        for date_str, slots in scanned.items():
+            rollup.setdefault(date_str, {}).update(slots)
+        return rollup
+
+    def _get_streamed_rollup(self) -> Dict[str, Dict[tuple, Dict]]:
+        """The rollup kept in place of the resident rows, recomputed after attendance changes"""
+        generation = self.generation.value()
+        entry = self._cache.get(self.STREAMED_ROLLUP)
+        if entry is not None and entry.get('generation') == generation:
+            return entry['rollup']
+
+        with self._attendance_lock, self.attendance_journal.shared_lock():
+            stamp = self._attendance_stamp()
+            journal_offset = self.attendance_journal.size()
+            if entry is None or entry['stamp'] != stamp or entry['journal_offset'] != journal_offset:
+                entry = {'stamp': stamp, 'journal_offset': journal_offset, 'rollup': self._compute_streamed_rollup()}
+                self._cache[self.STREAMED_ROLLUP] = entry
+            entry['generation'] = generation
+            return entry['rollup']
+
+    def _restamp_rollup(self, previous_stamp: Optional[tuple]):
+        """Keep the saved rollup valid after the compacted rows were moved without changing them"""
+        rollup = self._read_rollup(previous_stamp)
+        if rollup is not None:
+            self._write_rollup(rollup, self._attendance_stamp())
+
+    def partition_attendance(self):
+        """Move the compacted attendance rows from attendance.json into monthly partitions.
+
+        A one-off conversion: the rows are grouped in memory once. The journal
+        stays as it is, since it applies to the same rows.
+        """
+        filepath = os.path.join(self.data_dir, self.ATTENDANCE_FILE)
+        with self._attendance_lock, self.attendance_journal.exclusive_lock():
+            if self.attendance_partitions.exists():
+                return
+            previous_stamp = self._attendance_stamp()
+            rows_by_month = {}
+            for row in self._load_attendance_rows():
+                rows_by_month.setdefault(partition_month(row['date']), []).append(row)
+            self.attendance_partitions.write({}, rows_by_month)
+            self._restamp_rollup(previous_stamp)
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+        self.generation.bump()
+
+    def archive_attendance(self, before_month: str) -> List[str]:
+        """Compress the partitions of the months before before_month ('YYYY-MM'); returns those months"""
+        if not self.attendance_partitions.exists():
+            raise ValueError("Attendance is not partitioned; run partition_attendance() first")
+        with self._attendance_lock, self.attendance_journal.exclusive_lock():
+            previous_stamp = self._attendance_stamp()
+            manifest = self.attendance_partitions.read_manifest()
+            archived = self.attendance_partitions.archive(manifest, before_month)
+            self._restamp_rollup(previous_stamp)
+        self.generation.bump()
+        return [month for month, filename in archived.items() if filename != manifest[month]]
+
+    @staticmethod
+    def _add_to_index(index: Dict, fields: tuple, unique: bool, row: Dict):
+        key = row.get(fields[0]) if len(fields) == 1 else tuple(row.get(field) for field in fields)
+        if unique:
+            index.setdefault(key, row)
+        else:
+            index.setdefault(key, []).append(row)
+
+    def _get_entry_index(self, entry: Dict, fields: tuple, unique: bool = False) -> Dict:
+        index_name = (fields, unique)
+        index = entry['indexes'].get(index_name)
+        if index is None:
+            # Journal entries append to the resident attendance rows and their
+            # indexes under the attendance lock; building one takes it too, so
+            # no row is missed and the index set does not change under them
+            with self._attendance_lock:
+                index = entry['indexes'].get(index_name)
+                if index is None:
+                    index = {}
+                    for row in entry['data']:
+                        self._add_to_index(index, fields, unique, row)
+                    entry['indexes'][index_name] = index
+        return index
+
+    def _get_sorted_attendance_dates(self) -> List[str]:
+        """Distinct attendance dates in ascending order, kept current as rows are added"""
+        entry = self._get_attendance_entry()
+        dates = entry.get('sorted_dates')
+        if dates is None:
+            with self._attendance_lock:
+                dates = sorted(self._get_entry_index(entry, ('date',)))
+                entry['sorted_dates'] = dates
+        return dates
+
+    def _get_index(self, filename: str, fields: tuple, unique: bool = False) -> Dict:
+        """Get a dict index over a data file keyed by the given fields.
+
+        Unique indexes map a key to the first matching row, the others map a key
+        to every matching row in file order. Indexes are built on first use and
+        dropped whenever the file is reloaded.
+        """
+        return self._get_entry_index(self._get_cache_entry(filename), fields, unique)
+
+    def _load_json(self, filename: str) -> List[Dict]:
+        """Load data from JSON file"""
+        metrics.count('storage_loads', file=filename)
+        if filename == self.ATTENDANCE_FILE and not self.resident_attendance:
+            return list(self._iter_attendance())
+        return self._get_cache_entry(filename)['data']
+
+    def _save_json(self, filename: str, data: List[Dict]):
+        """Save data to JSON file"""
+        filepath = os.path.join(self.data_dir, filename)
+        if filename == self.ATTENDANCE_FILE:
+            # Replacing the attendance rows also discards the journal on top of them
+            with self._attendance_lock, self.attendance_journal.exclusive_lock() as journal_fd:
+                if self.attendance_partitions.exists():
+                    manifest = self.attendance_partitions.read_manifest()
+                    rows_by_month = {month: [] for month in manifest}
+                    for row in data:
+                        rows_by_month.setdefault(partition_month(row['date']), []).append(row)
+                    self.attendance_partitions.write(manifest, rows_by_month)
+                else:
+                    write_json_atomic(filepath, data, indent=self.json_indent)
+                self.attendance_journal.truncate(journal_fd)
+                self._cache.pop(filename, None)
+            self.generation.bump()
+            return
+
+        with file_lock(filepath):
+            self._write_json(filename, data)
+
+    def _write_json(self, filename: str, data: List[Dict]):
+        """Replace a data file other than attendance.json; callers hold its file lock"""
+        filepath = os.path.join(self.data_dir, filename)
+        write_json_atomic(filepath, data, indent=self.json_indent)
+        self._cache[filename] = {'stamp': self._file_stamp(filepath), 'data': data, 'indexes': {}}
+        self.generation.bump()
+
+    # Table access
+    def table_exists(self, table: str) -> bool:
+        if table == 'attendance' and self.attendance_partitions.exists():
+            return True
+        return os.path.exists(os.path.join(self.data_dir, f'{table}.json'))
+
+    def table_version(self, table: str):
+        # The stamp of the resident rows rather than a fresh stat, so the
+        # version always describes the rows load_table returns
+        return self._get_cache_entry(f'{table}.json')['stamp']
+
+    def load_table(self, table: str) -> List[Dict]:
+        return self._load_json(f'{table}.json')
+
+    def create_table(self, table: str, rows: List[Dict]) -> bool:
+        filename = f'{table}.json'
+        filepath = os.path.join(self.data_dir, filename)
+        # Several workers start at once; only the first may write the defaults
+        with file_lock(filepath):
+            if os.path.exists(filepath):
+                return False
+            if filename == self.ATTENDANCE_FILE:
+                self._save_json(filename, rows)
+            else:
+                self._write_json(filename, rows)
+        return True
+
+    def modify_table(self, table: str, update: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+        filename = f'{table}.json'
+        if filename == self.ATTENDANCE_FILE:
+            raise ValueError("Attendance changes go through add_attendance, lock_attendance and update_attendance")
+        filepath = os.path.join(self.data_dir, filename)
+        for attempt in range(self.WRITE_RETRIES):
+            # Compute the new rows without holding the lock, then write them
+            # only if nobody saved the file in the meantime
+            entry = self._get_cache_entry(filename)
+            rows = update(copy.deepcopy(entry['data']))
+            with file_lock(filepath):
+                if entry['stamp'] == self._file_stamp(filepath):
+                    self._write_json(filename, rows)
+                    return rows
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+        raise WriteConflict(f"{filename} kept changing, gave up after {self.WRITE_RETRIES} attempts")
+
+    def save_table(self, table: str, rows: List[Dict]):
+        self._save_json(f'{table}.json', rows)
+
+    def lookup(self, table: str, field: str, value) -> Optional[Dict]:
+        return self._get_index(f'{table}.json', (field,), unique=True).get(value)
+
+    def lookup_all(self, table: str, field: str, value) -> List[Dict]:
+        return self._get_index(f'{table}.json', (field,)).get(value, [])
+
+    def count_rows_by(self, table: str, field: str) -> Dict:
+        return {key: len(rows) for key, rows in self._get_index(f'{table}.json', (field,)).items()}
+
+    # Attendance
+    def find_attendance(self, class_id: str = None, date_str: str = None,
+                        attendance_type: str = None, period: int = None) -> List[Dict]:
+        if not self.resident_attendance:
+            return [row for row in self._iter_attendance(date_str, date_str)
+                    if attendance_row_matches(row, class_id, date_str, attendance_type, period)]
+        if class_id and date_str:
+            # Narrow the scan to one class and date using the resident indexes
+            if attendance_type == 'day':
+                rows = self._get_index(self.ATTENDANCE_FILE, ATTENDANCE_SLOT_FIELDS).get(
+                    (class_id, date_str, 'day', 1), [])
+            elif attendance_type == 'period' and period:
+                rows = self._get_index(self.ATTENDANCE_FILE, ATTENDANCE_SLOT_FIELDS).get(
+                    (class_id, date_str, 'period', period), [])
+            else:
+                rows = self._get_index(self.ATTENDANCE_FILE, ('class_id', 'date')).get((class_id, date_str), [])
+        elif date_str:
+            rows = self._get_index(self.ATTENDANCE_FILE, ('date',)).get(date_str, [])
+        else:
+            rows = self._load_json(self.ATTENDANCE_FILE)
+
+        return [row for row in rows if attendance_row_matches(row, class_id, date_str, attendance_type, period)]
+
+    def _get_student_timeline(self, student_id: str, start_date: str = None, end_date: str = None) -> StudentTimeline:
+        """Get a student's timeline, built from the student index on first use and kept current by journal entries.
+
+        Without resident rows the timeline is scanned for each call and may
+        leave out rows outside start_date to end_date.
+        """
+        if not self.resident_attendance:
+            return StudentTimeline([row for row in self._iter_attendance(start_date, end_date)
+                                    if row.get('student_id') == student_id])
+        entry = self._get_attendance_entry()
+        timelines = entry.setdefault('student_timelines', {})
+        timeline = timelines.get(student_id)
+        if timeline is None:
+            with self._attendance_lock:
+                timeline = StudentTimeline(self._get_entry_index(entry, ('student_id',)).get(student_id, []))
+                timelines[student_id] = timeline
+        return timeline
+
+    def _resident_lock(self):
+        """The attendance lock when the resident rows are patched in place, else a no-op"""
+        return self._attendance_lock if self.resident_attendance else contextlib.nullcontext()
+
+    def find_student_attendance(self, student_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        with self._resident_lock():
+            return self._get_student_timeline(student_id, start_date, end_date).find(start_date, end_date)
+
+    def student_attendance_stats(self, student_id: str, start_date: str = None, end_date: str = None) -> Dict:
+        with self._resident_lock():
+            return self._get_student_timeline(student_id, start_date, end_date).stats(start_date, end_date)
+
+    def find_attendance_between(self, start_date: str, end_date: str) -> List[Dict]:
+        if not self.resident_attendance:
+            # Dates in ascending order, each in stored order, as below
+            return sorted((row for row in self._iter_attendance(start_date, end_date)
+                           if start_date <= row['date'] <= end_date),
+                          key=lambda row: row['date'])
+        dates = self._get_sorted_attendance_dates()
+        date_index = self._get_index(self.ATTENDANCE_FILE, ('date',))
+        rows = []
+        for date_str in dates[bisect.bisect_left(dates, start_date):bisect.bisect_right(dates, end_date)]:
+            rows.extend(date_index[date_str])
+        return rows
+
+    def summarize_attendance(self, class_id: str, date_str: str, attendance_type: str = None,
+                             period: int = None) -> Dict:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if slot_period is None or not class_id or not date_str:
+            return super().summarize_attendance(class_id, date_str, attendance_type, period)
+        summary = self._get_rollup().get(date_str, {}).get((class_id, date_str, attendance_type, slot_period))
+        return dict(summary) if summary else summarize_attendance_rows([])
+
+    def summarize_attendance_by_class(self, date_str: str, attendance_type: str = None,
+                                      period: int = None) -> Dict[str, Dict]:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if slot_period is None:
+            return super().summarize_attendance_by_class(date_str, attendance_type, period)
+        return {slot[0]: dict(summary) for slot, summary in self._get_rollup().get(date_str, {}).items()
+                if slot[2] == attendance_type and slot[3] == slot_period}
+
+    def summarize_attendance_range(self, start_date: str, end_date: str, attendance_type: str = None,
+                                   period: int = None) -> Dict[str, Dict[str, Dict]]:
+        slot_period = rollup_slot_period(attendance_type, period)
+        if not self.resident_attendance:
+            if slot_period is None:
+                return super().summarize_attendance_range(start_date, end_date, attendance_type, period)
+            dates = sorted(date_str for date_str, slots in self._get_rollup().items() if slots)
+        else:
+            dates = self._get_sorted_attendance_dates()
+        # Bisect the sorted date list so only the dates inside the range are visited
+        first = bisect.bisect_left(dates, start_date)
+        last = bisect.bisect_right(dates, end_date)
+        summaries = {}
+
+        if slot_period is not None:
+            rollup = self._get_rollup()
+            for date_str in dates[first:last]:
+                by_class = {slot[0]: dict(summary) for slot, summary in rollup.get(date_str, {}).items()
+                            if slot[2] == attendance_type and slot[3] == slot_period}
+                if by_class:
+                    summaries[date_str] = by_class
+            return summaries
+
+        date_index = self._get_index(self.ATTENDANCE_FILE, ('date',))
+        for date_str in dates[first:last]:
+            rows_by_class = {}
+            for row in date_index.get(date_str, []):
+                if attendance_row_matches(row, None, None, attendance_type, period):
+                    rows_by_class.setdefault(row['class_id'], []).append(row)
+            if rows_by_class:
+                summaries[date_str] = {class_id: summarize_attendance_rows(rows)
+                                       for class_id, rows in rows_by_class.items()}
+        return summaries
+
+    def verify_rollup(self) -> List[str]:
+        if not self.resident_attendance:
+            with self._attendance_lock, self.attendance_journal.shared_lock():
+                return describe_rollup_mismatches(self._compute_streamed_rollup(), self._scan_rollup()[0])
+        with self._attendance_lock:
+            rollup = self._get_rollup()
+            expected = self._build_rollup(self._get_attendance_entry())
+            return describe_rollup_mismatches(rollup, expected)
+
+    def rebuild_rollup(self):
+        if not self.resident_attendance:
+            # Without a saved rollup the compaction rolls up a full scan
+            try:
+                os.remove(os.path.join(self.data_dir, self.ROLLUP_FILE))
+            except FileNotFoundError:
+                pass
+            self.compact_attendance_journal()
+            return
+        # Compaction persists the rollup, and the saved copy must describe the
+        # rows in attendance.json, so fold the journal in at the same time
+        entry = self._get_attendance_entry()
+        with self._attendance_lock:
+            entry['rollup'] = None
+        self.compact_attendance_journal()
+
+    def add_attendance(self, rows: List[Dict]):
+        self._append_attendance_ops([{'op': 'add', 'row': row} for row in rows])
+
+    def lock_attendance_many(self, keys: List[tuple]):
+        self._append_attendance_ops([{
+            'op': 'lock',
+            'class_id': class_id,
+            'date': date_str,
+            'attendance_type': attendance_type,
+            'period': period
+        } for class_id, date_str, attendance_type, period in keys])
+
+    def update_attendance_many(self, updates: Dict[str, Dict]):
+        self._append_attendance_ops([{'op': 'update', 'record_id': record_id, 'updates': record_updates}
+                                     for record_id, record_updates in updates.items()])
+
+
+def create_storage(data_dir: str) -> StorageBackend:
+    """Create the backend selected by the ATTENDANCE_STORAGE environment variable"""
+    backend = os.environ.get('ATTENDANCE_STORAGE', 'json')
+    if backend == 'sqlite':
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(os.environ.get('ATTENDANCE_DB', os.path.join(data_dir, 'attendance.db')))
+    if backend != 'json':
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return JsonStorage(data_dir)
@@ -0,0 +1,107 @@
+"""In-memory search index over student names and roll numbers.
+
+Every student is indexed under the 1, 2 and 3 character substrings of their
+lowercased name and roll number. A query is answered by intersecting the
+posting sets of its own substrings of up to 3 characters, starting with the
+smallest. The few remaining candidates are then checked for the full query,
+so results are exactly the students whose name or roll number contains it,
+as with the old linear scan.
+"""
+import heapq
+import re
+import threading
+from typing import Dict, List, Optional
+
+GRAM_SIZE = 3
+# Names are written like 'K.ANUSIYA' as well as 'K ANUSIYA'
+WORD_SEPARATORS = re.compile(r'[\s.]+')
+
+
+def _grams(text: str, size: int) -> set:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _query_grams(query: str) -> set:
+    return _grams(query, min(len(query), GRAM_SIZE))
+
+
+class StudentSearchIndex:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        # Students are keyed by (student_id, n) for the nth row with that
+        # student_id, since students.json can list an id more than once
+        self._entries = {}   # key -> (position, name, roll_number, row)
+        self._postings = {}  # gram -> set of keys
+
+    def _index(self, key: tuple, name: str, roll_number: str):
+        for text in (name, roll_number):
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(text, size):
+                    self._postings.setdefault(gram, set()).add(key)
+
+    def _unindex(self, key: tuple, name: str, roll_number: str):
+        for text in (name, roll_number):
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(text, size):
+                    posting = self._postings.get(gram)
+                    if posting is not None:
+                        posting.discard(key)
+                        if not posting:
+                            del self._postings[gram]
+
+    def update(self, rows: List[Dict], version=None):
+        """Bring the index in line with rows, re-indexing only students whose name or roll number changed"""
+        with self._lock:
+            self._update(rows, version)
+
+    def _update(self, rows: List[Dict], version):
+        entries = {}
+        occurrences = {}
+        for position, row in enumerate(rows):
+            occurrence = occurrences[row['student_id']] = occurrences.get(row['student_id'], -1) + 1
+            entries[(row['student_id'], occurrence)] = (position, row['name'].lower(), row['roll_number'].lower(), row)
+
+        for key, (_, name, roll_number, _) in self._entries.items():
+            entry = entries.get(key)
+            if entry is None or entry[1:3] != (name, roll_number):
+                self._unindex(key, name, roll_number)
+        for key, (_, name, roll_number, _) in entries.items():
+            previous = self._entries.get(key)
+            if previous is None or previous[1:3] != (name, roll_number):
+                self._index(key, name, roll_number)
+
+        self._entries = entries
+        self.version = version
+
+    @staticmethod
+    def _rank(query: str, name: str, roll_number: str) -> int:
+        """Exact matches first, then prefixes, then name words starting with the query, then other substrings"""
+        if query in (name, roll_number):
+            return 0
+        if name.startswith(query) or roll_number.startswith(query):
+            return 1
+        if any(word.startswith(query) for word in WORD_SEPARATORS.split(name)):
+            return 2
+        return 3
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Student rows whose name or roll number contains query, best match first"""
+        query = query.lower()
+        with self._lock:
+            if not query:
+                candidates = list(self._entries)
+            else:
+                postings = sorted((self._postings.get(gram, set()) for gram in _query_grams(query)), key=len)
+                candidates = postings[0].intersection(*postings[1:])
+
+            matches = []
+            for key in candidates:
+                position, name, roll_number, row = self._entries[key]
+                if query in name or query in roll_number:
+                    matches.append((self._rank(query, name, roll_number), position, row))
+        if limit is not None:
+            matches = heapq.nsmallest(limit, matches, key=lambda match: match[:2])
+        else:
+            matches.sort(key=lambda match: match[:2])
+        return [row for _, _, row in matches]
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """An empty data/ directory, in a working directory of its own"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('ATTENDANCE_STORAGE', 'json')
+    monkeypatch.setenv('ATTENDANCE_JOURNAL_FSYNC', '0')
+    for name in ('ATTENDANCE_RESIDENT', 'ATTENDANCE_DATA_FORMAT', 'ATTENDANCE_DB'):
+        monkeypatch.delenv(name, raising=False)
+    (tmp_path / 'data').mkdir()
+    return str(tmp_path / 'data')
+
+
+@pytest.fixture
+def data_manager(data_dir):
+    """A DataManager of its own on the default data"""
+    # Importing data_manager creates the global instance in the working directory
+    from data_manager import DataManager
+    return DataManager()
+
+
+def edit_table(data_dir: str, table: str, edit):
+    """Change a JSON data file the way an editor would, without the storage noticing"""
+    path = os.path.join(data_dir, f'{table}.json')
+    with open(path) as f:
+        rows = json.load(f)
+    edit(rows)
+    with open(path, 'w') as f:
+        json.dump(rows, f)
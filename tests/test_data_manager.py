@@ -0,0 +1,61 @@
+from conftest import edit_table
+
+
+def test_hand_edited_user_can_be_found_straight_away(data_manager, data_dir):
+    assert data_manager.get_user_by_username('staff3') is None
+    edit_table(data_dir, 'users', lambda rows: rows.append({
+        'user_id': 'staff3', 'username': 'staff3', 'password': 'staff123', 'role': 'staff',
+        'name': 'Prof. Ada Byron', 'assigned_classes': ['CS_1A']
+    }))
+
+    assert data_manager.get_user_by_username('staff3').name == 'Prof. Ada Byron'
+    assert data_manager.get_user_name_by_id('staff3') == 'Prof. Ada Byron'
+
+
+def test_users_are_shared_until_users_json_changes(data_manager, data_dir):
+    admin = data_manager.get_user_by_id('admin1')
+    assert data_manager.get_user_by_username('admin') is admin
+
+    edit_table(data_dir, 'users', lambda rows: rows[0].update(name='Administrator'))
+    assert data_manager.get_user_by_id('admin1') is not admin
+    assert data_manager.get_user_by_id('admin1').name == 'Administrator'
+
+def add_students(rows):
+    rows.extend([
+        {'student_id': 'CS1A001', 'roll_number': 'CS1A001', 'name': 'Grace Hopper', 'class_id': 'CS_1A',
+         'email': 'grace@example.com', 'phone': '9876543001'},
+        {'student_id': 'CS1A002', 'roll_number': 'CS1A002', 'name': 'Alan Turing', 'class_id': 'CS_1A',
+         'email': 'alan@example.com', 'phone': '9876543002'},
+    ])
+
+
+def test_hand_edited_students_join_their_roster_straight_away(data_manager, data_dir):
+    assert data_manager.get_students_by_class('CS_1A') == ()
+    edit_table(data_dir, 'students', add_students)
+
+    assert [student.name for student in data_manager.get_students_by_class('CS_1A')] == ['Grace Hopper',
+                                                                                         'Alan Turing']
+
+
+def test_roster_snapshot_is_reused_until_students_json_changes(data_manager, data_dir):
+    edit_table(data_dir, 'students', add_students)
+    roster = data_manager.get_students_by_class('CS_1A')
+    assert data_manager.get_students_by_class('CS_1A') is roster
+    # Saving attendance leaves the students table, and so the snapshot, alone
+    data_manager.lock_attendance('CS_1A', '2024-03-04', 'day')
+    assert data_manager.get_students_by_class('CS_1A') is roster
+
+    edit_table(data_dir, 'students', lambda rows: rows[1].update(class_id='CS_1B'))
+    assert data_manager.get_students_by_class('CS_1A') is not roster
+    assert [student.student_id for student in data_manager.get_students_by_class('CS_1A')] == ['CS1A001']
+    assert [student.student_id for student in data_manager.get_students_by_class('CS_1B')] == ['CS1A002']
+
+
+def test_search_index_follows_edits_of_students_json(data_manager, data_dir):
+    edit_table(data_dir, 'students', add_students)
+    assert [student.student_id for student in data_manager.search_students('hopper')] == ['CS1A001']
+
+    edit_table(data_dir, 'students', lambda rows: rows[0].update(name='Grace Brewster'))
+    assert data_manager.search_students('hopper') == []
+    assert [student.name for student in data_manager.search_students('brew')] == ['Grace Brewster']
+    assert [student.student_id for student in data_manager.search_students('cs1a', limit=1)] == ['CS1A001']
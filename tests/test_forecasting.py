@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from analytics_engine import AttendanceMatrix
+from forecasting import AttendanceForecaster
+from models import Class
+
+CLASSES = [Class('CS_2A', '2nd Year Computer Science A', 'CS', 2, 'A'),
+           Class('CS_2B', '2nd Year Computer Science B', 'CS', 2, 'B')]
+STUDENTS = 10
+
+
+def present_students(class_id: str, day: date) -> int:
+    """CS_2A is half empty on Mondays and nearly full otherwise; CS_2B always has 8 of 10"""
+    if class_id == 'CS_2A':
+        return 5 if day.weekday() == 0 else 9
+    return 8
+
+
+def day_rows(day: date, present=present_students) -> list:
+    return [{'record_id': f'{class_obj.class_id}_{day}_{student}', 'class_id': class_obj.class_id,
+             'date': day.isoformat(), 'attendance_type': 'day', 'period': 1,
+             'student_id': f'{class_obj.class_id}{student:03d}',
+             'status': 'present' if student < present(class_obj.class_id, day) else 'absent'}
+            for class_obj in CLASSES for student in range(STUDENTS)]
+
+
+class Attendance:
+    """Weekday attendance of the last 12 weeks, as DataManager.get_attendance_matrix serves it"""
+
+    def __init__(self):
+        today = date.today()
+        self.rows = [row for age in range(84) if (today - timedelta(days=age)).weekday() < 5
+                     for row in day_rows(today - timedelta(days=age))]
+        self.version = 1
+
+    def matrix(self, start_date: str, end_date: str) -> AttendanceMatrix:
+        rows = [row for row in self.rows if start_date <= row['date'] <= end_date]
+        return AttendanceMatrix.build(rows, CLASSES, {class_obj.class_id: STUDENTS for class_obj in CLASSES},
+                                      start_date, end_date)
+
+    def forecaster(self) -> AttendanceForecaster:
+        return AttendanceForecaster(self.matrix, lambda: self.version)
+
+
+def predicted(forecast: list) -> dict:
+    return {date.fromisoformat(day['date']).weekday(): day['predicted_attendance'] for day in forecast}
+
+
+def test_forecasts_each_class_from_its_own_weekday_pattern():
+    forecaster = Attendance().forecaster()
+    class_a = predicted(forecaster.forecast(5, 'CS_2A'))
+    assert sorted(class_a) == [0, 1, 2, 3, 4]
+    # The ridge penalty pulls the weekday offsets a little towards 0
+    assert class_a[0] == pytest.approx(50, abs=4)
+    assert all(class_a[weekday] == pytest.approx(90, abs=1) for weekday in range(1, 5))
+    assert all(value == pytest.approx(80, abs=1) for value in predicted(forecaster.forecast(5, 'CS_2B')).values())
+
+    department = predicted(forecaster.forecast(5))
+    assert department[0] == pytest.approx(65, abs=4)
+    assert department[2] == pytest.approx(85, abs=1)
+    assert forecaster.forecast(5, 'IT_2A') == []
+
+
+def test_refresh_after_new_attendance_matches_a_full_fit():
+    attendance = Attendance()
+    forecaster = attendance.forecaster()
+    forecaster.forecast(5, 'CS_2A')
+
+    today = date.today()
+    attendance.rows = [row for row in attendance.rows if row['date'] != today.isoformat()]
+    attendance.rows += day_rows(today, lambda class_id, day: 2)
+    attendance.version += 1
+
+    for class_id in ('CS_2A', 'CS_2B', None):
+        assert forecaster.forecast(5, class_id) == attendance.forecaster().forecast(5, class_id)
+    assert forecaster.forecast(5, 'CS_2B') != Attendance().forecaster().forecast(5, 'CS_2B')
@@ -0,0 +1,18 @@
+from models import AttendanceRecord
+
+ROW = {'record_id': 'ATT_1', 'class_id': 'CS_1A', 'date': '2024-03-04', 'attendance_type': 'day', 'period': 1,
+       'student_id': 'CS1A001', 'status': 'present', 'is_late': False, 'marked_by': 'staff1', 'locked': False,
+       'submitted_as_type': 'day'}
+
+
+def test_new_records_are_stamped_with_the_current_time():
+    assert AttendanceRecord('ATT_1', 'CS_1A', '2024-03-04', 'day', 1).created_at is not None
+
+
+def test_loaded_records_keep_their_stored_created_at():
+    assert AttendanceRecord.from_dict(dict(ROW, created_at='2024-03-04T09:00:00')).created_at == '2024-03-04T09:00:00'
+    assert AttendanceRecord.from_dict(dict(ROW, created_at=None)).to_dict()['created_at'] is None
+
+
+def test_loaded_records_without_created_at_get_the_current_time():
+    assert AttendanceRecord.from_dict(ROW).created_at is not None
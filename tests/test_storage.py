@@ -0,0 +1,78 @@
+import sys
+import threading
+
+from conftest import edit_table
+from storage import JsonStorage
+
+
+def attendance_row(class_id: str, student: int, date_str: str = '2024-03-04') -> dict:
+    return {'record_id': f'{class_id}_{date_str}_{student}', 'class_id': class_id, 'date': date_str,
+            'attendance_type': 'day', 'period': 1, 'student_id': f'{class_id}{student:03d}',
+            'status': 'present' if student % 4 else 'absent', 'is_late': False, 'marked_by': 'staff1',
+            'locked': False, 'created_at': None, 'submitted_as_type': 'day'}
+
+
+def test_hand_edited_table_is_reloaded_with_a_new_version(data_dir):
+    storage = JsonStorage(data_dir)
+    storage.create_table('classes', [{'class_id': 'CS_1A', 'class_name': 'CS 1A'}])
+    version = storage.table_version('classes')
+    assert storage.table_version('classes') == version
+
+    generation = storage.data_generation()
+    edit_table(data_dir, 'classes', lambda rows: rows.append({'class_id': 'CS_1B', 'class_name': 'CS 1B'}))
+    assert storage.table_version('classes') != version
+    assert [row['class_id'] for row in storage.load_table('classes')] == ['CS_1A', 'CS_1B']
+    assert storage.lookup('classes', 'class_id', 'CS_1B')['class_name'] == 'CS 1B'
+    # Nothing had to bump the generation for the edit to show
+    assert storage.data_generation() == generation
+
+def test_summaries_run_alongside_attendance_writes(data_dir):
+    storage = JsonStorage(data_dir)
+    # Plenty of roll calls on the date, so reading its summaries takes a while
+    storage.create_table('attendance', [attendance_row(f'IT_{i}A', 0) for i in range(200)])
+    storage.summarize_attendance_by_class('2024-03-04', 'day')
+    classes = [f'CS_{i}A' for i in range(1, 5)]
+    errors = []
+    writing = threading.Event()
+    writing.set()
+
+    def write(class_id):
+        try:
+            for student in range(40):
+                # Each write also marks a class new to the date, adding a roll call to its summaries
+                storage.add_attendance([attendance_row(class_id, student), attendance_row(f'{class_id}_{student}', 0)])
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while writing.is_set():
+                storage.summarize_attendance_by_class('2024-03-04', 'day')
+                storage.summarize_attendance_range('2024-03-01', '2024-03-08', 'day')
+                storage.find_attendance('CS_1A', '2024-03-04')
+                storage.find_attendance_between('2024-03-01', '2024-03-08')
+                storage.student_attendance_stats('CS_1A001')
+        except Exception as e:
+            errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    # Switch threads often, so the readers land in the middle of writes
+    sys.setswitchinterval(1e-6)
+    try:
+        writers = [threading.Thread(target=write, args=(class_id,)) for class_id in classes]
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writing.clear()
+        for thread in readers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+    summaries = storage.summarize_attendance_by_class('2024-03-04', 'day')
+    assert {class_id: summary['records'] for class_id, summary in summaries.items() if class_id in classes} == {
+        class_id: 40 for class_id in classes}
+    assert storage.verify_rollup() == []
@@ -0,0 +1,82 @@
+from student_search import StudentSearchIndex
+
+
+def student(student_id: str, name: str, roll_number: str = None) -> dict:
+    return {'student_id': student_id, 'roll_number': roll_number or student_id, 'name': name, 'class_id': 'CS_2A'}
+
+
+STUDENTS = [
+    student('CS2A001', 'K.ANUSIYA'),
+    student('CS2A002', 'ANU PRIYA'),
+    student('CS2A003', 'SHANMUGA PRIYA'),
+    student('CS2A004', 'ANU'),
+    student('CS2A005', 'BHANU PRAKASH'),
+    student('IT2A010', 'ARUN KUMAR'),
+]
+
+
+def search(index: StudentSearchIndex, query: str, limit: int = None) -> list:
+    return [row['student_id'] for row in index.search(query, limit)]
+
+
+def build(rows=STUDENTS) -> StudentSearchIndex:
+    index = StudentSearchIndex()
+    index.update(rows)
+    return index
+
+
+def test_matches_any_substring_of_the_name_like_a_scan():
+    index = build()
+    for query in ('a', 'an', 'anu', 'priya', 'mug', 'h pri', 'kumar', 'zzz', 'anusiyax'):
+        expected = [row['student_id'] for row in STUDENTS
+                    if query in row['name'].lower() or query in row['roll_number'].lower()]
+        assert sorted(search(index, query)) == sorted(expected), query
+
+
+def test_queries_are_case_insensitive():
+    assert search(build(), 'PrIyA') == search(build(), 'priya') == ['CS2A002', 'CS2A003']
+
+
+def test_finds_students_by_roll_number():
+    index = build()
+    assert search(index, 'CS2A003') == ['CS2A003']
+    assert search(index, 'it2a') == ['IT2A010']
+    assert search(index, '00') == ['CS2A001', 'CS2A002', 'CS2A003', 'CS2A004', 'CS2A005']
+
+
+def test_ranks_exact_then_prefix_then_word_then_substring_matches():
+    # ANU exactly, ANU PRIYA by prefix, K.ANUSIYA by a word of the name,
+    # BHANU PRAKASH only by a substring
+    assert search(build(), 'anu') == ['CS2A004', 'CS2A002', 'CS2A001', 'CS2A005']
+
+
+def test_equal_ranks_keep_the_students_table_order():
+    assert search(build(), 'priya') == ['CS2A002', 'CS2A003']
+    assert search(build(), '') == [row['student_id'] for row in STUDENTS]
+
+
+def test_limit_keeps_the_best_matches():
+    index = build()
+    assert search(index, 'anu', limit=2) == ['CS2A004', 'CS2A002']
+    assert search(index, 'anu', limit=10) == search(index, 'anu')
+    assert search(index, 'anu', limit=0) == []
+    assert search(index, '', limit=3) == ['CS2A001', 'CS2A002', 'CS2A003']
+
+
+def test_update_reindexes_changed_and_removed_students():
+    index = build()
+    rows = [dict(row) for row in STUDENTS if row['student_id'] != 'CS2A005']
+    rows[0]['name'] = 'K.ANITHA'
+    rows.append(student('CS2A006', 'PRIYA DHARSHINI'))
+    index.update(rows, version=2)
+
+    assert index.version == 2
+    assert search(index, 'anusiya') == []
+    assert search(index, 'anitha') == ['CS2A001']
+    assert search(index, 'bhanu') == []
+    assert search(index, 'priya') == ['CS2A006', 'CS2A002', 'CS2A003']
+
+
+def test_duplicate_student_ids_are_both_found():
+    index = build([student('CS2A001', 'ANU'), student('CS2A001', 'ANU PRIYA')])
+    assert [row['name'] for row in index.search('anu')] == ['ANU', 'ANU PRIYA']
@@ -0,0 +1,40 @@
+"""In-memory table of User objects keyed by user_id and by username.
+
+Every request resolves the logged-in user, and dashboards resolve the user
+who marked each roll call. The directory builds the User objects of the
+users table once and is rebuilt only when the table version changes, so
+these lookups are dict lookups.
+
+The User objects are shared between requests, so callers must not modify
+them.
+"""
+import threading
+from typing import Dict, List, Optional
+
+from models import User
+
+
+class UserDirectory:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_username = {}
+
+    def update(self, rows: List[Dict], version=None):
+        """Replace the directory with the users in rows"""
+        by_id, by_username = {}, {}
+        for row in rows:
+            user = User.from_dict(row)
+            # The first row wins, as with StorageBackend.lookup()
+            by_id.setdefault(user.user_id, user)
+            by_username.setdefault(user.username, user)
+        with self._lock:
+            self._by_id, self._by_username = by_id, by_username
+            self.version = version
+
+    def by_id(self, user_id: str) -> Optional[User]:
+        return self._by_id.get(user_id)
+
+    def by_username(self, username: str) -> Optional[User]:
+        return self._by_username.get(username)